@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Standalone performance scripts; run from the repo root, e.g. python -m benchmarks.bench_codegen
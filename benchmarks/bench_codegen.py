@@ -0,0 +1,62 @@
+# benchmarks/bench_codegen.py
+"""
+Per-edit cost of code generation: full rebuild vs CodeDocument line patches.
+
+    python -m benchmarks.bench_codegen
+"""
+import random
+import time
+
+from display_designer.codegen import CodeDocument, generate_code
+from display_designer.core import Element
+
+SIZES = (10, 100, 1000, 5000)
+EDITS = 500
+
+
+def make_elements(n, seed=0):
+    rnd = random.Random(seed)
+    elements = []
+    for i in range(n):
+        kind = rnd.choice(("rect", "circle", "text"))
+        x, y = rnd.randint(0, 300), rnd.randint(0, 220)
+        if kind == "text":
+            elements.append(Element("text", i, x, y, text=f"label {i}"))
+        else:
+            elements.append(Element(kind, i, x, y, rnd.randint(4, 40), rnd.randint(4, 40)))
+    return elements
+
+
+def time_per_edit(n):
+    """(full rebuild, incremental patch) seconds per single-element move."""
+    elements = make_elements(n)
+    rnd = random.Random(1)
+    targets = [rnd.choice(elements) for _ in range(EDITS)]
+
+    start = time.perf_counter()
+    for el in targets:
+        el.x += 1
+        generate_code(elements, 320, 240)
+    full = (time.perf_counter() - start) / EDITS
+
+    doc = CodeDocument(320, 240)
+    lines = doc.rebuild(elements).split("\n")
+    start = time.perf_counter()
+    for el in targets:
+        el.x += 1
+        first, old_count, new_lines = doc.set_element(el)
+        # Stand-in for the Tk Text delete/insert of only the patched lines.
+        lines[first - 1:first - 1 + old_count] = new_lines
+    incremental = (time.perf_counter() - start) / EDITS
+    return full, incremental
+
+
+def main():
+    print(f"{'elements':>9} {'full rebuild':>14} {'patch':>10}")
+    for n in SIZES:
+        full, incremental = time_per_edit(n)
+        print(f"{n:>9} {full * 1e6:>12.1f}us {incremental * 1e6:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_sketch_parser.py
+"""
+Sketch parsing: the single-pass GFX tokenizer vs the five-regex scan that
+apply_code_to_canvas used before.
+
+    python -m benchmarks.bench_sketch_parser [lines]
+"""
+import random
+import re
+import sys
+import time
+
+from display_designer.parser import parse_sketch
+
+CALLS = [
+    "  display.drawRect({a}, {b}, {c}, {d}, WHITE);",
+    "  display.fillRect({a}, {b}, {c}, {d}, WHITE);",
+    "  display.drawCircle({a}, {b}, {c}, WHITE);",
+    "  display.fillCircle({a}, {b}, {c}, WHITE);",
+    "  display.setCursor({a}, {b}); display.print(\"label {c}\");",
+    "  display.drawLine({a}, {b}, {c}, {d}, WHITE);",
+    "  display.drawFastHLine({a}, {b}, {c}, WHITE);",
+    "  display.fillRoundRect({a}, {b}, {c}, {d}, 3, WHITE);",
+    "  display.drawTriangle({a}, {b}, {c}, {d}, {a}, {d}, WHITE);",
+    "  // comment {a}",
+]
+
+
+def make_sketch(lines, seed=0):
+    rnd = random.Random(seed)
+    body = [rnd.choice(CALLS).format(a=rnd.randint(0, 300), b=rnd.randint(0, 200),
+                                     c=rnd.randint(1, 60), d=rnd.randint(1, 40))
+            for _ in range(lines)]
+    return "\n".join(["#define MARGIN 4", "void setup() {", "  display.clearDisplay();"] + body + ["}"])
+
+
+def legacy_parse(text):
+    """The old apply_code_to_canvas scan, minus the canvas calls (5 passes, no order)."""
+    found = []
+    for pat in (r"drawRect\((\d+),\s*(\d+),\s*(\d+),\s*(\d+)", r"fillRect\((\d+),\s*(\d+),\s*(\d+),\s*(\d+)"):
+        for m in re.finditer(pat, text):
+            found.append(("rect",) + tuple(map(int, m.groups())))
+    for pat in (r"drawCircle\((\d+),\s*(\d+),\s*(\d+)", r"fillCircle\((\d+),\s*(\d+),\s*(\d+)"):
+        for m in re.finditer(pat, text):
+            found.append(("circle",) + tuple(map(int, m.groups())))
+    for x, y, s in re.findall(r"setCursor\((\d+),\s*(\d+)\);\s*display\.print\(\"([^\"]*)\"\)", text):
+        found.append(("text", int(x), int(y), s))
+    return found
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    text = make_sketch(lines)
+    legacy_t, legacy = best_of(lambda: legacy_parse(text))
+    new_t, (elements, problems) = best_of(lambda: parse_sketch(text))
+    print(f"{lines} lines")
+    print(f"  legacy regex scan : {legacy_t * 1000:8.1f} ms  {len(legacy)} shapes (rect/circle/text only, unordered)")
+    print(f"  single-pass parse : {new_t * 1000:8.1f} ms  {len(elements)} shapes in draw order, {len(problems)} problems")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_spatial_index.py
+"""
+Hit-testing cost with core.SpatialIndex vs a linear scan over every element.
+
+    python -m benchmarks.bench_spatial_index
+
+Elements are spread over a canvas whose area grows with the element count
+(constant density, like a large multi-screen design), so the linear scan
+grows with n while the grid stays roughly flat.
+"""
+import math
+import random
+import time
+
+from display_designer.core import Element, SpatialIndex, footprint, _shape_contains
+
+SIZES = (1000, 10000, 100000)
+QUERIES = 2000
+
+
+def make_elements(n, seed=0):
+    rnd = random.Random(seed)
+    side = int(math.sqrt(n) * 24)
+    elements = []
+    for i in range(n):
+        kind = rnd.choice(("rect", "rect", "circle", "text", "line"))
+        x, y = rnd.randint(0, side), rnd.randint(0, side)
+        if kind == "text":
+            elements.append(Element("text", i, x, y, text=f"label {i % 100}"))
+        elif kind == "line":
+            elements.append(Element("line", i, x, y, rnd.randint(-30, 30), rnd.randint(-30, 30)))
+        else:
+            elements.append(Element(kind, i, x, y, rnd.randint(4, 40), rnd.randint(4, 40),
+                                    rotation=rnd.choice((0, 0, 0, 30)) if kind == "rect" else 0))
+    return elements, side
+
+
+def linear_at(shapes, px, py):
+    for eid, ((x0, y0, x1, y1), kind, data) in reversed(shapes):
+        if x0 <= px <= x1 and y0 <= py <= y1 and _shape_contains(kind, data, px, py, 0):
+            return eid
+    return None
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(n):
+    elements, side = make_elements(n)
+    rnd = random.Random(1)
+    points = [(rnd.uniform(0, side), rnd.uniform(0, side)) for _ in range(QUERIES)]
+    marquees = [(x, y, x + 80, y + 60) for x, y in points[:200]]
+
+    start = time.perf_counter()
+    index = SpatialIndex.from_elements(elements)
+    build = time.perf_counter() - start
+
+    it = iter(points * 2)
+    point = timed(lambda: index.at(*next(it)), QUERIES)
+    it = iter(marquees * 2)
+    marquee = timed(lambda: index.query(*next(it)), len(marquees))
+
+    movers = [rnd.choice(elements) for _ in range(QUERIES)]
+    it = iter(movers)
+
+    def move():
+        el = next(it)
+        el.translate(3, 2)
+        index.update(el.id, el)
+    update = timed(move, QUERIES)
+
+    shapes = [(el.id, footprint(el)) for el in elements]
+    it = iter(points[:200] * 2)
+    scan = timed(lambda: linear_at(shapes, *next(it)), 200)
+    return build, point, marquee, update, scan
+
+
+def main():
+    print(f"{'elements':>9} {'build':>9} {'point':>9} {'marquee':>9} {'update':>9} {'linear scan':>12}")
+    for n in SIZES:
+        build, point, marquee, update, scan = run(n)
+        print(f"{n:>9} {build * 1e3:>7.0f}ms {point * 1e6:>7.1f}us {marquee * 1e6:>7.1f}us "
+              f"{update * 1e6:>7.1f}us {scan * 1e6:>10.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/bench_text.py
+"""
+Text measurement and rasterization with the cached classic-font atlas.
+
+    python -m benchmarks.bench_text
+
+A UI is mostly the same few labels drawn over and over, so after the first
+call measuring or drawing a label is an LRU lookup. "cold" clears the caches
+before every call, "warm" does not.
+"""
+import time
+
+from display_designer.core import Framebuffer, text_bounds, text_mask, text_runs, text_size
+
+LABELS = ("Temp", "Humidity", "23.5 C", "Battery 87%", "WiFi: connected", "Menu", "> Settings", "Back")
+REPEAT = 20000
+
+
+def clear_caches():
+    for cached in (text_runs, text_mask, text_bounds):
+        cached.cache_clear()
+
+
+def timed(fn, repeat, cold=False):
+    total = 0.0
+    for i in range(repeat):
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        fn(LABELS[i % len(LABELS)])
+        total += time.perf_counter() - start
+    return total / repeat
+
+
+def main():
+    fb = Framebuffer(320, 240, "rgb565")
+    cases = {
+        "measure": lambda label: text_size(label, 2),
+        "draw": lambda label: fb.draw_text(10, 10, label, 2),
+    }
+    print(f"{'':>8} {'cold':>9} {'warm':>9}")
+    for name, fn in cases.items():
+        cold = timed(fn, REPEAT // 10, cold=True)
+        clear_caches()
+        warm = timed(fn, REPEAT)
+        print(f"{name:>8} {cold * 1e6:>7.1f}us {warm * 1e6:>7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
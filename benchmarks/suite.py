@@ -0,0 +1,386 @@
+# benchmarks/suite.py
+"""
+Benchmark suite: every hot path at scene sizes from 10 to 100k elements,
+with JSON results and a regression check for the build.
+
+    python -m benchmarks.suite run -o bench.json              # all benchmarks, all sizes
+    python -m benchmarks.suite run --sizes 10,1000 --only codegen,render
+    python -m benchmarks.suite compare base.json bench.json --threshold 15
+
+compare exits with status 1 if any benchmark got slower than the threshold
+(percent), or if a result in the base file is missing from the new one
+(removed, renamed or skipped; --allow-missing only lists those), so CI can
+gate on it. Results are seconds per operation, the best
+mean over a few rounds, so run base and new on the same machine.
+
+Scenes are synthetic (seeded, so every run measures the same work). The
+"tk.drag" benchmark drives the real window's canvas_drag loop, so it needs a
+display: run the suite under `xvfb-run` on a headless machine, otherwise it
+is recorded as skipped.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from display_designer.codegen import CodeDocument, generate_code
+from display_designer.core import Element, SpatialIndex, rasterize
+from display_designer.parser import ScriptReconciler, parse_lines, parse_script, parse_sketch
+from display_designer.timing import profile_frame
+
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+WIDTH, HEIGHT = 320, 240
+ROUNDS = 3
+MIN_TIME = 0.1  # seconds per round; slow cases run once per round
+SLOW = 1.0      # a call slower than this is timed once, not best of ROUNDS
+FRAME = 1 / 60
+
+BENCHMARKS = {}  # name -> (fn(n) -> seconds per operation, largest size or None)
+
+
+class Skip(Exception):
+    """The benchmark cannot run here (the message says why)."""
+
+
+def benchmark(name, max_size=None):
+    def register(fn):
+        BENCHMARKS[name] = (fn, max_size)
+        return fn
+    return register
+
+
+def measure(fn, rounds=ROUNDS, min_time=MIN_TIME):
+    """Best-of-rounds mean seconds per fn() call; each round repeats fn for at least min_time."""
+    best = math.inf
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+        if elapsed > SLOW:
+            break
+    return best
+
+
+# ----------------- Synthetic scenes -----------------
+def make_scene(n, seed=0, spread=False):
+    """n mixed elements on the WIDTH x HEIGHT display.
+
+    With spread, the area grows with n instead (constant density, like one
+    large multi-screen design), which is what hit-testing sees.
+    """
+    rnd = random.Random(seed)
+    side_x, side_y = (int(math.sqrt(n) * 24),) * 2 if spread else (WIDTH, HEIGHT)
+    elements = []
+    for i in range(n):
+        kind = rnd.choice(("rect", "rect", "circle", "text", "line", "triangle"))
+        x, y = rnd.randrange(side_x), rnd.randrange(side_y)
+        if kind == "text":
+            elements.append(Element("text", i, x, y, text=f"label {i % 100}", size=rnd.choice((1, 1, 2))))
+        elif kind == "line":
+            elements.append(Element("line", i, x, y, rnd.randint(-30, 30), rnd.randint(-30, 30)))
+        elif kind == "triangle":
+            points = [(x, y), (x + rnd.randint(4, 40), y + rnd.randint(0, 20)), (x + rnd.randint(0, 20), y + 30)]
+            xs, ys = [p[0] for p in points], [p[1] for p in points]
+            elements.append(Element("triangle", i, x, y, max(xs) - x, max(ys) - y,
+                                    fill=rnd.random() < 0.3, points=points))
+        elif kind == "circle":
+            d = rnd.randint(4, 40)
+            elements.append(Element("circle", i, x, y, d, d, fill=rnd.random() < 0.3))
+        else:
+            elements.append(Element("rect", i, x, y, rnd.randint(4, 60), rnd.randint(4, 40),
+                                    fill=rnd.random() < 0.3, radius=rnd.choice((0, 0, 0, 4))))
+    return elements
+
+
+def make_script(n, seed=0):
+    """An n-line editor script (the language only has rect, circle and text)."""
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(n):
+        x, y = rnd.randrange(WIDTH), rnd.randrange(HEIGHT)
+        kind = rnd.choice(("rect", "circle", "text"))
+        if kind == "rect":
+            lines.append(f"rect {x} {y} {x + rnd.randint(4, 60)} {y + rnd.randint(4, 40)}")
+        elif kind == "circle":
+            lines.append(f"circle {x} {y} {rnd.randint(2, 20)}")
+        else:
+            lines.append(f"text {x} {y} label {i % 100}")
+    return lines
+
+
+# ----------------- Benchmarks -----------------
+@benchmark("script.parse")
+def bench_script_parse(n):
+    """Run: parse a whole n-line editor script."""
+    text = "\n".join(make_script(n))
+    return measure(lambda: parse_script(text))
+
+
+@benchmark("script.edit")
+def bench_script_edit(n):
+    """Live mode: one edited line re-parsed and reconciled against the script."""
+    lines = make_script(n)
+    script = ScriptReconciler()
+    script.update("\n".join(lines))
+    rnd = random.Random(1)
+
+    def edit():
+        i = rnd.randrange(n)
+        lines[i] = f"rect {rnd.randrange(WIDTH)} {rnd.randrange(HEIGHT)} {WIDTH} {HEIGHT}"
+        text = "\n".join(lines)
+        script.update(text, parse_lines(set(text.splitlines()) - script.sources()))
+    return measure(edit)
+
+
+@benchmark("codegen.full")
+def bench_codegen_full(n):
+    """generate_arduino_code: the whole sketch for n elements."""
+    elements = make_scene(n)
+    return measure(lambda: generate_code(elements, WIDTH, HEIGHT))
+
+
+@benchmark("codegen.patch")
+def bench_codegen_patch(n):
+    """Dragging: the code-view line patch for one moved element."""
+    elements = make_scene(n)
+    doc = CodeDocument(WIDTH, HEIGHT)
+    doc.rebuild(elements)
+    rnd = random.Random(1)
+
+    def move():
+        el = elements[rnd.randrange(n)]
+        el.translate(1, 0)
+        doc.set_element(el)
+    return measure(move)
+
+
+@benchmark("sketch.parse")
+def bench_sketch_parse(n):
+    """apply_code_to_canvas: parse the generated sketch back into elements."""
+    code = generate_code(make_scene(n), WIDTH, HEIGHT)
+    return measure(lambda: parse_sketch(code))
+
+
+@benchmark("hit.point")
+def bench_hit_point(n):
+    """Click hit-test on a spread-out scene."""
+    elements = make_scene(n, spread=True)
+    index = SpatialIndex.from_elements(elements)
+    side = int(math.sqrt(n) * 24)
+    rnd = random.Random(1)
+    return measure(lambda: index.at(rnd.uniform(0, side), rnd.uniform(0, side)))
+
+
+@benchmark("hit.marquee")
+def bench_hit_marquee(n):
+    """80x60 marquee selection on a spread-out scene."""
+    elements = make_scene(n, spread=True)
+    index = SpatialIndex.from_elements(elements)
+    side = int(math.sqrt(n) * 24)
+    rnd = random.Random(1)
+
+    def query():
+        x, y = rnd.uniform(0, side), rnd.uniform(0, side)
+        index.query(x, y, x + 80, y + 60)
+    return measure(query)
+
+
+@benchmark("render.full")
+def bench_render_full(n):
+    """Rasterize the whole screen (pixel view, PNG and bitmap export)."""
+    elements = make_scene(n)
+    return measure(lambda: rasterize(elements, (WIDTH, HEIGHT), mode="rgb565"))
+
+
+@benchmark("render.profile")
+def bench_render_profile(n):
+    """The profiler panel's frame-time estimate (runs while dragging, 4x a second)."""
+    elements = make_scene(n)
+    return measure(lambda: profile_frame(elements, WIDTH, HEIGHT, mode="rgb565"))
+
+
+def _widgets(root):
+    for child in root.winfo_children():
+        yield child
+        yield from _widgets(child)
+
+
+def _pump(app, until, timeout=300):
+    deadline = time.perf_counter() + timeout
+    while not until():
+        if time.perf_counter() > deadline:
+            raise RuntimeError("timed out waiting for the window to settle")
+        app.update()
+        time.sleep(0.001)
+
+
+@benchmark("tk.drag", max_size=10_000)
+def bench_tk_drag(n, frames=120):
+    """One frame of canvas_drag in the real window: move, index, selection, code patch, redraws."""
+    try:
+        import tkinter as tk
+    except ImportError as e:
+        raise Skip(f"tkinter is not available ({e})")
+    from display_designer.app import PAD, open_emulator_window
+    try:
+        app = open_emulator_window("TFT 320x240", WIDTH, HEIGHT, mainloop=False)
+    except tk.TclError as e:
+        raise Skip(f"no display ({e}); run under xvfb-run")
+    try:
+        widgets = list(_widgets(app))
+        canvas = next(w for w in widgets if isinstance(w, tk.Canvas))
+        editor, code_area = [w for w in widgets if isinstance(w, tk.Text)][:2]
+        run = next(w for w in widgets if isinstance(w, tk.Button) and "Run" in w.cget("text"))
+
+        # The last line is drawn on top, so the drag below always grabs it.
+        x0, y0 = 20, 20
+        lines = make_script(n - 1) + [f"rect {x0} {y0} {x0 + 40} {y0 + 30}"]
+        editor.delete("1.0", "end")
+        editor.insert("1.0", "\n".join(lines))
+        run.invoke()
+        _pump(app, lambda: len(canvas.find_withtag("drawn")) >= n
+              and int(code_area.index("end-1c").split(".")[0]) >= n)
+        before = {item: canvas.coords(item) for item in canvas.find_withtag("drawn")}
+
+        x, y = PAD + x0, PAD + y0 + 15  # middle of the rect's left edge
+        canvas.event_generate("<Button-1>", x=x, y=y)
+        app.update()
+        total = 0.0
+        for i in range(frames):
+            x += 1 if (i // 40) % 2 == 0 else -1
+            start = time.perf_counter()
+            canvas.event_generate("<B1-Motion>", x=x, y=y)
+            app.update()
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            time.sleep(max(0.0, FRAME - elapsed))  # one motion per frame, like a steady drag
+        canvas.event_generate("<ButtonRelease-1>", x=x, y=y)
+        app.update()
+        if all(canvas.coords(item) == coords for item, coords in before.items()):
+            raise RuntimeError("the drag did not move anything")
+        return total / frames
+    finally:
+        app.destroy()
+
+
+# ----------------- Running and comparing -----------------
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(names, sizes, out=sys.stdout):
+    """{"meta": ..., "results": {name: {size: seconds}}, "skipped": {name: reason}}."""
+    results, skipped = {}, {}
+    for name in names:
+        fn, max_size = BENCHMARKS[name]
+        for n in sizes:
+            if max_size is not None and n > max_size:
+                continue
+            try:
+                seconds = fn(n)
+            except Skip as e:
+                skipped[name] = str(e)
+                print(f"{name:<16} skipped: {e}", file=out)
+                break
+            results.setdefault(name, {})[str(n)] = seconds
+            print(f"{name:<16} {n:>7} {seconds * 1e6:>12.1f}us", file=out)
+            out.flush()
+    meta = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "commit": _commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "rounds": ROUNDS,
+        "min_time": MIN_TIME,
+    }
+    return {"meta": meta, "results": results, "skipped": skipped}
+
+
+def compare(base, new, threshold):
+    """Rows of (name, size, base seconds, new seconds, change), the regressed rows and the
+    (name, size, reason) of base results the new file does not have."""
+    rows, regressions = [], []
+    for name, sizes in new["results"].items():
+        for size, seconds in sizes.items():
+            old = base["results"].get(name, {}).get(size)
+            if old is None:
+                continue
+            change = seconds / old - 1
+            rows.append((name, size, old, seconds, change))
+            if change * 100 > threshold:
+                regressions.append(rows[-1])
+    missing = []
+    for name, sizes in base["results"].items():
+        for size in sizes:
+            if size not in new["results"].get(name, {}):
+                reason = new.get("skipped", {}).get(name, "not in the new results")
+                missing.append((name, size, reason))
+    return rows, regressions, missing
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.split("\n\n")[0].strip())
+    sub = ap.add_subparsers(dest="command", required=True)
+    run_ap = sub.add_parser("run", help="run the benchmarks and write JSON results")
+    run_ap.add_argument("-o", "--out", help="write the results here (default: only print them)")
+    run_ap.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated element counts")
+    run_ap.add_argument("--only", help="comma-separated benchmark names or prefixes, e.g. codegen,hit.point")
+    cmp_ap = sub.add_parser("compare", help="compare two result files; exit 1 on regressions")
+    cmp_ap.add_argument("base")
+    cmp_ap.add_argument("new")
+    cmp_ap.add_argument("--threshold", type=float, default=15.0,
+                        help="percent slowdown that counts as a regression (default: 15)")
+    cmp_ap.add_argument("--allow-missing", action="store_true",
+                        help="list base results missing from the new file but do not fail on them")
+    args = ap.parse_args(argv)
+
+    if args.command == "run":
+        names = list(BENCHMARKS)
+        if args.only:
+            wanted = args.only.split(",")
+            names = [name for name in names if any(name == w or name.startswith(w + ".") for w in wanted)]
+            if not names:
+                ap.error(f"no benchmark matches --only {args.only} (have {', '.join(BENCHMARKS)})")
+        try:
+            sizes = [int(s) for s in args.sizes.split(",")]
+        except ValueError:
+            ap.error(f"bad --sizes '{args.sizes}'")
+        results = run(names, sizes)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+        return 0
+
+    rows, regressions, missing = compare(_load(args.base), _load(args.new), args.threshold)
+    for name, size, old, seconds, change in rows:
+        flag = "  REGRESSION" if (name, size, old, seconds, change) in regressions else ""
+        print(f"{name:<16} {size:>7} {old * 1e6:>12.1f}us -> {seconds * 1e6:>12.1f}us {change * 100:>+7.1f}%{flag}")
+    for name, size, reason in missing:
+        print(f"{name:<16} {size:>7} MISSING: {reason}")
+    print(f"{len(regressions)} of {len(rows)} results slower than {args.threshold:g}%"
+          + (f", {len(missing)} missing" if missing else ""))
+    return 1 if regressions or (missing and not args.allow_missing) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,32 @@
 # designer.py
 """
 Main entry point for the ESP32 Display Designer application.
-Starts the display selection window.
+Starts the display selection window, or runs a headless batch build, a
+live-mirror receiver tool or the render server for editor integrations:
+
+    python designer.py build LAYOUT_FILES_OR_DIRS... [-o OUT_DIR]
+    python designer.py mirror {receive,sketch} ...
+    python designer.py serve [tcp:127.0.0.1:PORT | unix:PATH]
 """
-from display_designer.app import open_display_selector
+import sys
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "build":
+        # Headless: keep tkinter out of the import graph entirely.
+        from display_designer.batch import main as build_main
+        return build_main(argv[1:])
+    if argv and argv[0] == "mirror":
+        from display_designer.mirror import main as mirror_main
+        return mirror_main(argv[1:])
+    if argv and argv[0] == "serve":
+        from display_designer.server import main as serve_main
+        return serve_main(argv[1:])
+    from display_designer.app import open_display_selector
+    open_display_selector()
+    return 0
+
 
 if __name__ == "__main__":
-    open_display_selector()
\ No newline at end of file
+    sys.exit(main())
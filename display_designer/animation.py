@@ -0,0 +1,345 @@
+# display_designer/animation.py
+"""
+Keyframe animation: timelines read from the editor script, frame diffs and a
+partial-update loop() export.
+
+An editor script animates its elements with two extra line kinds (parsed by
+parser.parse_keyframe() / parse_timeline()):
+
+    rect 10 10 40 30
+    key 0 x=10
+    key 1000 x=80 w=20
+    timeline fps=25 loop=1
+
+A "key" line belongs to the nearest element line above it and sets the
+element's model fields at that time: x/y are the top-left of its box (the
+circle centre is x + r), w/h only animate rects and circles. Values are
+interpolated linearly between keys and held before the first and after the
+last one. Each frame is diffed against the previous one on the rasterized
+pixels, and the change becomes a few fillRect(BLACK) rects plus the elements
+overlapping them (frame_update()), which is what the app updates while
+playing and what animation_code() emits per frame. Never imports tkinter.
+"""
+import time
+
+import numpy as np
+
+from .codegen import bitmap_defs, element_lines, header_lines, insert_defs
+from .core import rasterize
+from .optimize import _copy, bus_bytes, changed_rects, redraw_set, scene_cost
+from .parser import LineEntry, parse_keyframe, parse_timeline, spec_to_element
+
+DEFAULT_FPS = 20
+MAX_EXPORT_FRAMES = 600  # one switch case each in flash
+
+
+# ----------------- Timeline -----------------
+class Timeline:
+    """Keyframe tracks per element key (the element's id) plus the playback settings."""
+
+    def __init__(self, fps=DEFAULT_FPS, duration=None, loop=True):
+        self.fps = fps
+        self.duration = duration  # ms; None = up to the last key
+        self.loop = loop
+        self.tracks = {}  # key -> {prop: [(ms, value), ...] sorted by ms}
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def add_key(self, key, ms, values):
+        track = self.tracks.setdefault(key, {})
+        for prop, value in values.items():
+            keys = [k for k in track.get(prop, ()) if k[0] != ms]  # a later line at the same time wins
+            keys.append((ms, value))
+            keys.sort()
+            track[prop] = keys
+
+    @property
+    def end(self):
+        """Length of the animation in ms."""
+        if self.duration is not None:
+            return self.duration
+        return max((keys[-1][0] for track in self.tracks.values() for keys in track.values()), default=0)
+
+    @property
+    def frame_ms(self):
+        return 1000 / self.fps
+
+    @property
+    def frame_count(self):
+        """Distinct frames: a looping timeline's last frame is its first one again."""
+        frames = int(self.end * self.fps // 1000)
+        return max(frames if self.loop else frames + 1, 1)
+
+    def frame_time(self, index):
+        return index * 1000 // self.fps
+
+    def values(self, key, ms):
+        """{prop: value} of one element at time ms."""
+        out = {}
+        for prop, keys in self.tracks.get(key, {}).items():
+            if ms <= keys[0][0]:
+                out[prop] = keys[0][1]
+            elif ms >= keys[-1][0]:
+                out[prop] = keys[-1][1]
+            else:
+                for (t0, v0), (t1, v1) in zip(keys, keys[1:]):
+                    if t0 <= ms <= t1:
+                        out[prop] = round(v0 + (v1 - v0) * (ms - t0) / (t1 - t0))
+                        break
+        return out
+
+    def pose(self, elements, ms):
+        """The elements at time ms; animated ones are copies, the rest are passed through."""
+        out = []
+        for el in elements:
+            values = self.values(el.id, ms) if el.id in self.tracks else None
+            out.append(apply_values(el, values) if values else el)
+        return out
+
+
+def set_values(el, values):
+    """Set animated props on el (an Element or a Scene's ElementView) in place.
+
+    x/y move triangle points along; a circle keeps w == h. Returns True if anything changed.
+    """
+    x, y = values.get("x", el.x), values.get("y", el.y)
+    w, h = values.get("w", el.w), values.get("h", el.h)
+    if el.type == "circle" and ("w" in values or "h" in values):
+        w = h = values.get("w", values.get("h"))
+    if (x, y, w, h) == (el.x, el.y, el.w, el.h):
+        return False
+    el.translate(x - el.x, y - el.y)
+    el.w, el.h = w, h
+    return True
+
+
+def apply_values(el, values):
+    """Copy of el with animated props set."""
+    el = _copy(el)
+    set_values(el, values)
+    return el
+
+
+def read_timeline(lines, targets):
+    """Timeline and (line, message) problems for editor lines.
+
+    targets[i] is the element the "key" on line i would animate (the one
+    drawn by the nearest element line above it), or None.
+    """
+    timeline, problems = Timeline(), []
+    for index, line in enumerate(lines):
+        parts = line.split()
+        if not parts:
+            continue
+        cmd = parts[0].lower()
+        try:
+            if cmd == "timeline":
+                options = parse_timeline(parts)
+                timeline.fps = options.get("fps", timeline.fps)
+                timeline.duration = options.get("duration", timeline.duration)
+                timeline.loop = bool(options.get("loop", timeline.loop))
+            elif cmd == "key":
+                ms, values = parse_keyframe(parts)
+                el = targets[index]
+                if el is None:
+                    raise ValueError("key needs an element line above it")
+                if el.type not in ("rect", "circle") and ("w" in values or "h" in values):
+                    raise ValueError(f"only x and y can be animated on {el.type}")
+                timeline.add_key(el.id, ms, values)
+        except (ValueError, IndexError) as e:
+            problems.append((index + 1, str(e)))
+    return timeline, problems
+
+
+def parse_animation(text):
+    """Elements (id = their line index), Timeline and (line, message) problems of an editor script."""
+    lines = text.splitlines()
+    elements, targets, problems = [], [], []
+    current = None
+    for index, line in enumerate(lines):
+        entry = LineEntry(line)
+        if entry.error:
+            problems.append((index + 1, entry.error))
+        elif entry.spec is not None:
+            current = spec_to_element(entry.spec)
+            current.id = index
+            elements.append(current)
+        targets.append(current)
+    timeline, timeline_problems = read_timeline(lines, targets)
+    return elements, timeline, sorted(set(problems + timeline_problems))
+
+
+# ----------------- Frame diffs -----------------
+class FrameUpdate:
+    """How to get from one frame to the next: clear rects, then redraw elements in order."""
+    __slots__ = ("rects", "redraw", "churn")
+
+    def __init__(self, rects, redraw, churn):
+        self.rects = rects    # [(x, y, w, h)] to fillRect(BLACK)
+        self.redraw = redraw  # elements of the new frame overlapping them, in draw order
+        self.churn = churn    # pixels that changed
+
+
+def frame_update(after, before_pixels, after_pixels, width, tile=8, max_rects=8):
+    """FrameUpdate turning a screen showing before_pixels into the `after` elements (rendered as after_pixels).
+
+    The elements to redraw come from optimize.redraw_set(), which also
+    handles opaque RGB565 bitmaps.
+    """
+    changed = before_pixels != after_pixels
+    rects = changed_rects(changed, tile, max_rects)
+    if not rects:
+        return FrameUpdate([], [], 0)
+    redraw = redraw_set(after, rects, width)
+    return FrameUpdate(rects, redraw, int(np.count_nonzero(changed)))
+
+
+def update_cost(update, width, height, mode="mono"):
+    """scene_cost()-style totals of applying one FrameUpdate."""
+    cost = scene_cost(update.redraw, width, height, mode, clear=False)
+    cost["calls"] += len(update.rects)
+    cost["pixels"] += sum(w * h for _, _, w, h in update.rects)
+    cost["windows"] += len(update.rects)
+    cost["bus_bytes"] = bus_bytes(cost["pixels"], cost["windows"], width, height, mode) if update.rects else 0
+    return cost
+
+
+class Animation:
+    """Renders an animated element list frame by frame."""
+
+    def __init__(self, elements, timeline, width, height, mode="mono"):
+        self.elements = list(elements)
+        self.timeline = timeline
+        self.width, self.height, self.mode = width, height, mode
+
+    def frame(self, index):
+        """(elements, pixels) of frame index."""
+        posed = self.timeline.pose(self.elements, self.timeline.frame_time(index))
+        return posed, rasterize(posed, (self.width, self.height), self.mode).pixels
+
+    def updates(self):
+        """FrameUpdate per frame, each from the frame before it; frame 0 from the last frame when looping.
+
+        A non-looping frame 0 is the initial full draw, so its update is empty.
+        """
+        count = self.timeline.frame_count
+        frames = [self.frame(i) for i in range(count)]
+        out = []
+        for i, (posed, pixels) in enumerate(frames):
+            if i == 0 and not self.timeline.loop:
+                out.append(FrameUpdate([], [], 0))
+                continue
+            out.append(frame_update(posed, frames[i - 1][1], pixels, self.width))
+        return out
+
+
+class PlaybackStats:
+    """Dropped frames and per-frame pixel churn while playing in the app."""
+
+    def __init__(self):
+        self.frames = 0
+        self.dropped = 0
+        self.churn = []
+        self.started = time.perf_counter()
+
+    def record(self, churn, skipped=0):
+        self.frames += 1
+        self.dropped += skipped
+        self.churn.append(churn)
+
+    def summary(self):
+        if not self.churn:
+            return "no frames shown"
+        churn = sorted(self.churn)
+        return (f"{self.frames} frames, {self.dropped} dropped; churn/frame "
+                f"avg {sum(churn) / len(churn):.0f} px, max {churn[-1]} px")
+
+
+# ----------------- Export -----------------
+def animation_code(elements, timeline, width, height, mode="mono"):
+    """Sketch that draws frame 0 in setup() and plays the timeline in loop() with partial updates only.
+
+    Each frame is a case of drawFrame() that clears the frame's dirty rects
+    and redraws what overlaps them. loop() calls it on a millis() schedule;
+    the cases are diffs from the frame before, so a late loop() applies every
+    frame it missed back to back and only shows the last one. Returns (code, report).
+    """
+    elements = list(elements)
+    anim = Animation(elements, timeline, width, height, mode)
+    count = timeline.frame_count
+    if count > MAX_EXPORT_FRAMES:
+        raise ValueError(f"{count} frames is too many to export (at most {MAX_EXPORT_FRAMES}); "
+                         "lower fps or duration")
+    updates = anim.updates()
+    first = anim.frame(0)[0]
+
+    every = elements + [el for u in updates for el in u.redraw]
+    lines = insert_defs(header_lines(width, height), bitmap_defs(every)[0])
+    for el in first:
+        lines.extend(element_lines(el))
+    lines += [
+        "  display.display();",
+        "}",
+        "",
+        f"#define FRAME_MS {timeline.frame_ms:g}",
+        f"#define FRAME_COUNT {count}",
+        "",
+        "// Partial update from the previous frame to frame f",
+        "void drawFrame(uint16_t f) {",
+        "  switch (f) {",
+    ]
+    for i, update in enumerate(updates):
+        if not update.rects:
+            continue
+        lines.append(f"    case {i}: // {update.churn} px changed")
+        lines += [f"      display.fillRect({x}, {y}, {w}, {h}, BLACK);" for x, y, w, h in update.rects]
+        for el in update.redraw:
+            lines += ["    " + line for line in element_lines(el)]
+        lines.append("      break;")
+    lines += [
+        "  }",
+        "}",
+        "",
+        "void loop() {",
+        "  static uint32_t start = millis();",
+        "  static uint16_t shown = 0;",
+        "  uint32_t elapsed = millis() - start;",
+        "  uint32_t due = (uint32_t)(elapsed / FRAME_MS);",
+        "  bool drawn = false;",
+    ]
+    if timeline.loop:
+        lines += ["  while (shown != due % FRAME_COUNT) {",
+                  "    shown = (shown + 1) % FRAME_COUNT;"]
+    else:
+        lines += ["  if (due >= FRAME_COUNT) due = FRAME_COUNT - 1;",
+                  "  while (shown < due) {",
+                  "    shown++;"]
+    lines += ["    drawFrame(shown);",
+              "    drawn = true;",
+              "  }"]
+    if mode == "mono":
+        lines.append("  if (drawn) display.display();")
+    lines.append("}")
+
+    changed = [u for u in updates if u.rects]
+    costs = [update_cost(u, width, height, mode) for u in changed]
+    full = scene_cost(first, width, height, mode)
+    report = {
+        "frames": count, "fps": timeline.fps, "changed_frames": len(changed),
+        "churn": [u.churn for u in updates],
+        "avg_pixels": sum(c["pixels"] for c in costs) / len(costs) if costs else 0,
+        "full_pixels": full["pixels"],
+        "max_bus_bytes": max((c["bus_bytes"] for c in costs), default=0),
+        "avg_bus_bytes": sum(c["bus_bytes"] for c in costs) / len(costs) if costs else 0,
+        "full_bus_bytes": full["bus_bytes"],
+    }
+    return "\n".join(lines), report
+
+
+def format_animation_report(report):
+    churn = report["churn"]
+    return (f"Animation: {report['frames']} frames at {report['fps']} fps, {report['changed_frames']} with changes; "
+            f"churn avg {sum(churn) / len(churn):.0f} px, max {max(churn)} px; per frame "
+            f"{report['avg_pixels']:.0f} px written (full redraw {report['full_pixels']}), bus avg "
+            f"{report['avg_bus_bytes']:.0f} B, max {report['max_bus_bytes']} B (full {report['full_bus_bytes']} B)")
@@ -0,0 +1,339 @@
+# display_designer/backends.py
+"""
+Code generation backends: the same layout as a sketch for different display libraries.
+
+Every backend emits from the draw-op IR (codegen.build_ir), so adding a library
+means writing its sketch template and how each DrawOp becomes calls:
+
+  * adafruit-gfx     Adafruit_SSD1306 + Adafruit GFX, identical to generate_code().
+  * u8g2-full        U8g2 full frame buffer: clearBuffer(), draw, sendBuffer().
+  * u8g2-page        U8g2 page buffer: one 8-pixel page of RAM, the screen is
+                     redrawn once per page in a firstPage()/nextPage() loop.
+  * tft-espi-sprite  TFT_eSPI drawing into a 16-bit TFT_eSprite that is pushed to
+                     the panel in one DMA transfer.
+
+generate() also returns the RAM and flash the sketch implies. Flash is the
+library's rough base size, its fonts, the bitmap arrays and the per-call
+estimate used by the bitmap report (codegen.call_flash); RAM is the frame buffer the library
+allocates. They are ballpark figures for an ESP32 build, for comparing
+backends rather than replacing the linker map.
+"""
+from .codegen import FOOTER_LINES, bitmap_defs, build_ir, c_string, call_flash, gfx_lines, header_lines, insert_defs
+
+# Largest block malloc() usually gets on an ESP32 without PSRAM.
+ESP32_MAX_BLOCK = 110 * 1024
+
+
+class Backend:
+    """Base backend: subclasses set name/label/library_flash and emit the sketch."""
+    name = ""
+    label = ""
+    library_flash = 0  # rough flash of the library code pulled in by a one-screen sketch
+
+    def draw_lines(self, ops):
+        """The lines that draw ops."""
+        raise NotImplementedError
+
+    def sketch_lines(self, draw, width, height):
+        """The whole sketch around the draw lines."""
+        raise NotImplementedError
+
+    def buffer_bytes(self, width, height):
+        return 0
+
+    def passes(self, width, height):
+        """How many times the draw calls run per frame."""
+        return 1
+
+    def extra_flash(self, ops):
+        """Flash on top of the library and the calls (fonts)."""
+        return 0
+
+    def notes(self, ops, width, height):
+        return []
+
+    def generate(self, elements, width, height):
+        """(code, footprint report dict) for the elements on a width x height display."""
+        elements = list(elements)
+        ops = build_ir(elements)
+        draw = self.draw_lines(ops)
+        defs, bitmap_flash = bitmap_defs(elements)
+        code = "\n".join(insert_defs(self.sketch_lines(draw, width, height), defs))
+        calls, calls_flash = call_flash(draw)
+        buffer = self.buffer_bytes(width, height)
+        report = {
+            "backend": self.name,
+            "buffer_bytes": buffer,
+            "ram_bytes": buffer,
+            "calls": calls,
+            "call_flash": calls_flash,
+            "flash_bytes": self.library_flash + self.extra_flash(ops) + bitmap_flash + calls_flash,
+            "passes": self.passes(width, height),
+            "notes": self.notes(ops, width, height),
+        }
+        return code, report
+
+
+BACKENDS = {}
+DEFAULT_BACKEND = "adafruit-gfx"
+
+
+def register_backend(backend):
+    """Add a Backend instance to BACKENDS (replacing one with the same name)."""
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend '{name}' (expected one of {', '.join(BACKENDS)})")
+
+
+def generate_for(elements, width, height, backend=DEFAULT_BACKEND):
+    """(code, footprint report) of elements with the named backend."""
+    return get_backend(backend).generate(elements, width, height)
+
+
+def format_footprint(report):
+    """One-line summary of a generate() report."""
+    line = (f"{report['backend']}: ~{report['ram_bytes']} B RAM, ~{report['flash_bytes']} B flash "
+            f"({report['calls']} calls, ~{report['call_flash']} B)")
+    if report["passes"] > 1:
+        line += f", draws {report['passes']}x per frame"
+    return "; ".join([line] + report["notes"])
+
+
+def _negative(ops):
+    return any(a < 0 for op in ops for a in op.args)
+
+
+# ----------------- Adafruit GFX -----------------
+class AdafruitGFX(Backend):
+    name = "adafruit-gfx"
+    label = "Adafruit GFX"
+    library_flash = 14_000  # GFX core, SSD1306 driver, Wire, classic font
+
+    def draw_lines(self, ops):
+        return [line for op in ops for line in gfx_lines(op)]
+
+    def sketch_lines(self, draw, width, height):
+        return header_lines(width, height) + draw + FOOTER_LINES
+
+    def buffer_bytes(self, width, height):
+        # Adafruit_SSD1306::begin() mallocs the whole 1bpp page buffer.
+        return width * ((height + 7) // 8)
+
+
+# ----------------- U8g2 -----------------
+# U8g2 fonts cannot be scaled, so text sizes map to the closest fixed font
+# (with its approximate flash size and the line height used for multi-line
+# text). Only size 1 matches the GFX glyph cell.
+U8G2_FONTS = {
+    1: ("u8g2_font_5x7_tr", 800, 8),
+    2: ("u8g2_font_10x20_tr", 2_000, 20),
+    3: ("u8g2_font_inb24_mr", 3_000, 33),
+    4: ("u8g2_font_logisoso32_tr", 3_500, 48),
+}
+
+# Constructor names of the SSD1306 panels U8g2 knows, by size.
+U8G2_SSD1306 = {
+    (128, 64): "SSD1306_128X64_NONAME",
+    (128, 32): "SSD1306_128X32_UNIVISION",
+    (96, 16): "SSD1306_96X16_ER",
+    (72, 40): "SSD1306_72X40_ER",
+    (64, 48): "SSD1306_64X48_ER",
+    (64, 32): "SSD1306_64X32_NONAME",
+}
+
+_U8G2_SHAPES = {
+    "rect": ("drawFrame", "drawBox"),
+    "round_rect": ("drawRFrame", "drawRBox"),
+    "circle": ("drawCircle", "drawDisc"),
+    "hline": ("drawHLine", "drawHLine"),
+    "vline": ("drawVLine", "drawVLine"),
+    "line": ("drawLine", "drawLine"),
+}
+
+
+def u8g2_font(size):
+    return U8G2_FONTS[min(max(size, 1), max(U8G2_FONTS))]
+
+
+class U8g2(Backend):
+    """U8g2 on an SSD1306; buffer is "F" (full) or "1" (one page)."""
+    library_flash = 10_000  # u8g2 core, SSD1306 driver, Wire
+
+    def __init__(self, name, label, buffer):
+        self.name = name
+        self.label = label
+        self.buffer = buffer
+
+    def draw_lines(self, ops):
+        lines = []
+        font = None
+        transparent = False
+        for op in ops:
+            lines.extend(f"  // {note}" for note in op.notes)
+            if op.op == "bitmap":
+                if not transparent:
+                    transparent = True
+                    lines.append("  u8g2.setBitmapMode(1);  // draw only the set bits, like Adafruit drawBitmap()")
+                x, y, w, h = op.args
+                lines.append(f"  u8g2.drawBitmap({x}, {y}, {(w + 7) // 8}, {h}, {op.text});")
+            elif op.op == "rgb_bitmap":
+                lines.append(f"  // RGB565 bitmap {op.text} skipped: U8g2 displays are monochrome")
+            elif op.op == "text":
+                if u8g2_font(op.size)[0] != font:
+                    font = u8g2_font(op.size)[0]
+                    lines.append(f"  u8g2.setFont({font});")
+                x, y = op.args
+                step = u8g2_font(op.size)[2]
+                # drawStr() neither wraps nor handles newlines: one call per line.
+                for i, part in enumerate(op.text.split("\n")):
+                    if part:
+                        lines.append(f'  u8g2.drawStr({x}, {y + step * i}, {c_string(part)});')
+            elif op.op == "triangle":
+                if op.fill:
+                    lines.append(f"  u8g2.drawTriangle({', '.join(str(a) for a in op.args)});")
+                else:
+                    x0, y0, x1, y1, x2, y2 = op.args
+                    for a, b in (((x0, y0), (x1, y1)), ((x1, y1), (x2, y2)), ((x2, y2), (x0, y0))):
+                        lines.append(f"  u8g2.drawLine({a[0]}, {a[1]}, {b[0]}, {b[1]});")
+            else:
+                call = _U8G2_SHAPES[op.op][op.fill]
+                lines.append(f"  u8g2.{call}({', '.join(str(a) for a in op.args)});")
+        return lines
+
+    def sketch_lines(self, draw, width, height):
+        panel = U8G2_SSD1306.get((width, height))
+        lines = [
+            "#include <Arduino.h>",
+            "#include <U8g2lib.h>",
+            "#include <Wire.h>",
+            f"#define SCREEN_WIDTH {width}",
+            f"#define SCREEN_HEIGHT {height}",
+        ]
+        if panel is None:
+            panel = U8G2_SSD1306[(128, 64)]
+            lines.append(f"// U8g2 has no {width}x{height} SSD1306 constructor; pick the one for your panel.")
+        lines += [
+            "// Hardware I2C, no reset pin (adjust for other displays/protocols)",
+            f"U8G2_{panel}_{self.buffer}_HW_I2C u8g2(U8G2_R0, U8X8_PIN_NONE);",
+            "",
+            "void drawScreen() {",
+            "  u8g2.setFontPosTop();  // text y is the top of the glyphs, as in Adafruit GFX",
+        ] + draw + [
+            "}",
+            "",
+            "void setup() {",
+            "  u8g2.begin();",
+        ]
+        if self.buffer == "F":
+            lines += ["  u8g2.clearBuffer();", "  drawScreen();", "  u8g2.sendBuffer();"]
+        else:
+            lines += ["  u8g2.firstPage();", "  do {", "    drawScreen();", "  } while (u8g2.nextPage());"]
+        return lines + [
+            "}",
+            "",
+            "void loop() {",
+            "  // Your main loop code here",
+            "}",
+        ]
+
+    def buffer_bytes(self, width, height):
+        # One tile row (8 pixel rows) for page mode, all of them for the full buffer.
+        return width if self.buffer == "1" else width * ((height + 7) // 8)
+
+    def passes(self, width, height):
+        return 1 if self.buffer == "F" else (height + 7) // 8
+
+    def extra_flash(self, ops):
+        return sum(u8g2_font(size)[1] for size in {op.size for op in ops if op.op == "text"})
+
+    def notes(self, ops, width, height):
+        notes = []
+        if any(op.op == "text" for op in ops):
+            notes.append("text uses the nearest U8g2 font, not the GFX glyphs")
+        if _negative(ops):
+            notes.append("U8g2 coordinates and sizes are unsigned, negative ones wrap around")
+        if any(op.op == "rgb_bitmap" for op in ops):
+            notes.append("RGB565 bitmaps are left out (use a 1bpp format)")
+        return notes
+
+
+# ----------------- TFT_eSPI -----------------
+class TFTeSPISprite(Backend):
+    name = "tft-espi-sprite"
+    label = "TFT_eSPI sprite + DMA"
+    library_flash = 24_000  # TFT_eSPI with sprites, DMA and the GLCD font
+
+    def draw_lines(self, ops):
+        # TFT_eSPI keeps the Adafruit GFX drawing API, and font 1 is the same GLCD font.
+        # It has no drawRGBBitmap(); pushImage() copies RGB565 arrays into the sprite.
+        lines = []
+        swapped = False
+        for op in ops:
+            if op.op != "rgb_bitmap":
+                lines += gfx_lines(op, "spr", "TFT_WHITE")
+                continue
+            if not swapped:
+                swapped = True
+                lines.append("  spr.setSwapBytes(true);  // the arrays hold plain RGB565 values")
+            x, y, w, h = op.args
+            lines.append(f"  spr.pushImage({x}, {y}, {w}, {h}, {op.text});")
+        return lines
+
+    def sketch_lines(self, draw, width, height):
+        lines = [
+            "#include <TFT_eSPI.h>  // driver and pins are set in TFT_eSPI's User_Setup.h",
+            f"#define SCREEN_WIDTH {width}",
+            f"#define SCREEN_HEIGHT {height}",
+            "",
+            "TFT_eSPI tft = TFT_eSPI();",
+            "TFT_eSprite spr = TFT_eSprite(&tft);  // off-screen frame, pushed to the panel in one DMA transfer",
+            "uint16_t *frame;",
+            "",
+            "void drawScreen() {",
+            "  spr.fillSprite(TFT_BLACK);",
+            "  spr.setTextColor(TFT_WHITE);",
+            "  spr.setTextFont(1);",
+        ] + draw + [
+            "}",
+            "",
+            "void setup() {",
+            "  tft.init();",
+        ]
+        if width > height:
+            lines.append("  tft.setRotation(1);  // landscape")
+        return lines + [
+            "  tft.initDMA();",
+            "  spr.setColorDepth(16);",
+            "  frame = (uint16_t *)spr.createSprite(SCREEN_WIDTH, SCREEN_HEIGHT);",
+            "  if (!frame) for(;;); // Not enough RAM for the sprite",
+            "  drawScreen();",
+            "  tft.startWrite();",
+            "  tft.pushImageDMA(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, frame);",
+            "  tft.dmaWait();",
+            "  tft.endWrite();",
+            "}",
+            "",
+            "void loop() {",
+            "  // Redraw with drawScreen() and push the frame again to update",
+            "}",
+        ]
+
+    def buffer_bytes(self, width, height):
+        return width * height * 2
+
+    def notes(self, ops, width, height):
+        if self.buffer_bytes(width, height) > ESP32_MAX_BLOCK:
+            return [f"the {width}x{height} sprite needs PSRAM (over ~{ESP32_MAX_BLOCK // 1024} KB of heap)"]
+        return []
+
+
+register_backend(AdafruitGFX())
+register_backend(U8g2("u8g2-full", "U8g2 full buffer", "F"))
+register_backend(U8g2("u8g2-page", "U8g2 page buffer", "1"))
+register_backend(TFTeSPISprite())
@@ -0,0 +1,357 @@
+# display_designer/batch.py
+"""
+Headless batch build: editor-command scripts or Adafruit GFX sketches in,
+generated Arduino code and PNG previews out. Never imports tkinter.
+
+    python designer.py build layouts/ -o build/screens --display "OLED 128x64" -j 8
+
+Files are built on a process pool and reported as they finish. A content-hash
+cache in the output directory skips inputs (and options) that have not changed
+since the last build.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .animation import animation_code, format_animation_report, parse_animation
+from .backends import BACKENDS, DEFAULT_BACKEND, format_footprint, generate_for
+from .codegen import BITMAP_LAYOUTS, format_bitmap_report, generate_bitmap_code, generate_code
+from .core import DISPLAY_PRESETS, mode_for_display, rasterize
+from .optimize import format_optimize_report, optimize, partial_update_lines
+from .parser import bitmap_paths, parse_script, parse_sketch
+from .timing import BUSES, format_profile, parse_bus, profile_frame
+
+SCRIPT_SUFFIXES = (".txt", ".layout")
+SKETCH_SUFFIXES = (".ino", ".cpp", ".h")
+CACHE_NAME = ".designer-cache.json"
+
+_SIZE_DEFINE = re.compile(r"^\s*#define\s+SCREEN_(WIDTH|HEIGHT)\s+(\d+)", re.M)
+_GFX_CALL = re.compile(r"\b\w+\s*\.\s*(?:draw|fill|print|setCursor)\w*\s*\(")
+
+
+# ----------------- Single input -----------------
+def is_sketch(path, text):
+    """Sketch (Arduino C++) or editor-command script, by extension, else by content."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in SKETCH_SUFFIXES:
+        return True
+    if suffix in SCRIPT_SUFFIXES:
+        return False
+    return bool(_GFX_CALL.search(text))
+
+
+def sketch_size(text, default):
+    """(width, height) from the sketch's SCREEN_WIDTH/SCREEN_HEIGHT defines, else default."""
+    found = dict(_SIZE_DEFINE.findall(text))
+    return int(found.get("WIDTH", default[0])), int(found.get("HEIGHT", default[1]))
+
+
+def parse_source(path, text):
+    """(elements, problems) of a layout file, whichever format it is in."""
+    return parse_sketch(text) if is_sketch(path, text) else parse_script(text)
+
+
+def build_source(text, width, height, sketch=False, mode="mono", scale=1, png=True, bitmap=None, rle=False,
+                 optimized=False, previous=None, bus=None, backend=DEFAULT_BACKEND, animate=False):
+    """Parse one layout and return its generated code, PNG preview bytes (or None) and problems.
+
+    With bitmap set to one of BITMAP_LAYOUTS the code blits a packed PROGMEM
+    buffer instead of issuing draw calls. optimized runs the draw-call
+    optimizer first; previous (the elements of the screen shown before this
+    one) adds an updateScreen() that only redraws the dirty rectangles.
+    With bus set (a timing.Bus), the estimated frame time is profiled too.
+    backend names the display library to generate for (backends.BACKENDS);
+    other than the default it also reports the RAM/flash footprint.
+    animate plays the script's key lines in a partial-update loop() (animation.py).
+    "notes" holds the size/cost reports.
+    """
+    timeline = None
+    if animate and not sketch:
+        elements, timeline, problems = parse_animation(text)
+    else:
+        elements, problems = parse_sketch(text) if sketch else parse_script(text)
+    notes = []
+    drawn = elements
+    if optimized:
+        drawn, report = optimize(elements, width, height, mode=mode)
+        notes.append(format_optimize_report(report))
+    if animate and not timeline:
+        notes.append("no key lines to animate; static code")
+    if timeline:
+        code, report = animation_code(elements, timeline, width, height, mode=mode)
+        notes.append(format_animation_report(report))
+    elif bitmap:
+        code, report = generate_bitmap_code(drawn, width, height, layout=bitmap, rle=rle)
+        notes.append(format_bitmap_report(report))
+    elif backend != DEFAULT_BACKEND:
+        code, report = generate_for(drawn, width, height, backend)
+        notes.append(format_footprint(report))
+    else:
+        code = generate_code(drawn, width, height)
+    if bus is not None:
+        notes.extend(format_profile(profile_frame(drawn, width, height, mode=mode, bus=bus)))
+    if previous is not None:
+        lines, report = partial_update_lines(previous, drawn, width, height, mode=mode)
+        code += "\n\n" + "\n".join(lines)
+        b, a = report["before"], report["after"]
+        notes.append(f"updateScreen(): {len(report['rects'])} dirty rects, {report['redrawn']} redrawn; "
+                     f"pixels {b['pixels']} -> {a['pixels']}, bus {b['bus_bytes']} -> {a['bus_bytes']} B")
+    return {
+        "code": code + "\n",
+        "png": rasterize(elements, (width, height), mode=mode).to_png(scale) if png else None,
+        "elements": len(elements),
+        "problems": problems,
+        "notes": notes,
+    }
+
+
+def _build_job(job):
+    """Process-pool worker: build job["path"] and write its outputs."""
+    start = time.perf_counter()
+    path = job["path"]
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        sketch = is_sketch(path, text)
+        width, height = sketch_size(text, job["size"]) if sketch and not job["size_given"] else job["size"]
+        previous = None
+        if job["dirty_from"]:
+            with open(job["dirty_from"], encoding="utf-8") as f:
+                previous, _ = parse_source(job["dirty_from"], f.read())
+        built = build_source(text, width, height, sketch=sketch, mode=job["mode"], scale=job["scale"],
+                             png=job["png"], bitmap=job["bitmap"], rle=job["rle"], optimized=job["optimize"],
+                             previous=previous, bus=parse_bus(job["bus"]) if job["profile"] else None,
+                             backend=job["backend"], animate=job["animate"])
+        with open(job["code_out"], "w", encoding="utf-8") as f:
+            f.write(built["code"])
+        if built["png"] is not None:
+            with open(job["png_out"], "wb") as f:
+                f.write(built["png"])
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        return {"path": path, "key": job["key"], "status": "failed", "error": str(e)}
+    except Exception as e:  # a bug on one input must not take down the whole pool
+        return {"path": path, "key": job["key"], "status": "failed", "error": f"{type(e).__name__}: {e}"}
+    return {"path": path, "key": job["key"], "status": "built", "elements": built["elements"],
+            "problems": built["problems"], "notes": built["notes"], "size": (width, height),
+            "seconds": time.perf_counter() - start}
+
+
+# ----------------- Inputs and cache -----------------
+def collect_inputs(paths):
+    """Expand directories (recursively) to layout files; plain files are taken as given."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(SCRIPT_SUFFIXES + SKETCH_SUFFIXES):
+                        found.append(os.path.join(root, name))
+        else:
+            found.append(path)
+    return found
+
+
+def _tool_digest():
+    """Hash of the headless modules' sources, so upgrading them invalidates the cache."""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(here)):
+        if not name.endswith(".py") or name == "app.py":
+            continue
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _asset_bytes(source):
+    """Hashes of the images an input draws, so editing one rebuilds the input."""
+    digest = hashlib.sha256()
+    for path in bitmap_paths(source.decode("utf-8", "replace")):
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"missing")
+    return digest.digest()
+
+
+def _load_cache(path, tool):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("entries", {}) if cache.get("tool") == tool else {}
+
+
+def _save_cache(path, tool, entries):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"tool": tool, "entries": entries}, f, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# ----------------- Command line -----------------
+def _parse_size(value):
+    try:
+        w, h = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got '{value}'")
+    if w <= 0 or h <= 0:
+        raise argparse.ArgumentTypeError("width and height must be positive")
+    return w, h
+
+
+def _check_bus(value):
+    try:
+        parse_bus(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value.lower()
+
+
+def make_parser():
+    presets = [name for name, size in DISPLAY_PRESETS.items() if size]
+    ap = argparse.ArgumentParser(prog="designer.py build",
+                                 description="Generate Adafruit GFX code and PNG previews from layout files.")
+    ap.add_argument("inputs", nargs="+", help="editor-command scripts (.txt, .layout), sketches (.ino, .cpp, .h) "
+                                              "or directories of them")
+    ap.add_argument("-o", "--out", default="build", help="output directory (default: build)")
+    ap.add_argument("--display", choices=presets, default="OLED 128x64", help="display preset")
+    ap.add_argument("--size", type=_parse_size, help="custom WIDTHxHEIGHT; overrides --display and sketch defines")
+    ap.add_argument("--mode", choices=("mono", "rgb565"), help="preview colour mode (default: from --display)")
+    ap.add_argument("--scale", type=int, default=1, help="PNG preview pixel scale (default: 1)")
+    ap.add_argument("--no-png", dest="png", action="store_false", help="only generate code")
+    ap.add_argument("--backend", choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                    help=f"display library to generate code for (default: {DEFAULT_BACKEND})")
+    ap.add_argument("--bitmap", choices=BITMAP_LAYOUTS, help="emit a packed PROGMEM bitmap instead of draw calls")
+    ap.add_argument("--rle", action="store_true", help="run-length compress --bitmap data")
+    ap.add_argument("--optimize", action="store_true",
+                    help="cull hidden shapes, use fast lines and merge text runs before generating code")
+    ap.add_argument("--dirty-from", metavar="LAYOUT",
+                    help="also emit updateScreen(), redrawing only what changed since LAYOUT was shown")
+    ap.add_argument("--animate", action="store_true",
+                    help="play the key lines of editor scripts in a loop() that only redraws what changed per frame")
+    ap.add_argument("--profile", action="store_true",
+                    help="estimate frame time and FPS on the device, with the most expensive elements")
+    ap.add_argument("--bus", default=None, type=_check_bus,
+                    help=f"display bus for --profile: {', '.join(BUSES)} or e.g. spi-20m "
+                         f"(default: i2c-400k for mono, spi-40m for TFT)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    ap.add_argument("--force", action="store_true", help="ignore the cache and rebuild everything")
+    ap.add_argument("--strict", action="store_true", help="exit non-zero if any line failed to parse")
+    return ap
+
+
+def _report(result, out):
+    path = result["path"]
+    if result["status"] == "failed":
+        print(f"failed  {path}: {result['error']}", file=out)
+        return
+    if result["status"] == "cached":
+        problems = result["problems"]
+        print(f"cached  {path}" + (f" ({problems} line(s) did not parse)" if problems else ""), file=out)
+        return
+    w, h = result["size"]
+    print(f"built   {path} ({result['elements']} elements, {w}x{h}, {result['seconds'] * 1000:.1f} ms)", file=out)
+    for note in result["notes"]:
+        print(f"  {note}", file=out)
+    for lineno, msg in result["problems"]:
+        print(f"  {path}:{lineno}: {msg}", file=out)
+
+
+def main(argv=None, out=sys.stdout):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.backend != DEFAULT_BACKEND and (args.bitmap or args.dirty_from):
+        parser.error(f"--bitmap and --dirty-from generate {DEFAULT_BACKEND} code only")
+    if args.animate and (args.backend != DEFAULT_BACKEND or args.bitmap or args.dirty_from or args.optimize):
+        parser.error(f"--animate generates plain {DEFAULT_BACKEND} code (no --bitmap, --dirty-from or --optimize)")
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("no layout files found", file=sys.stderr)
+        return 2
+    stems = {}
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if stem in stems:
+            print(f"{path} and {stems[stem]} would both write {stem}.ino", file=sys.stderr)
+            return 2
+        stems[stem] = path
+
+    os.makedirs(args.out, exist_ok=True)
+    size = args.size or DISPLAY_PRESETS[args.display]
+    options = {"size": size, "size_given": args.size is not None, "png": args.png, "scale": args.scale,
+               "bitmap": args.bitmap, "rle": args.rle, "optimize": args.optimize, "dirty_from": args.dirty_from,
+               "profile": args.profile, "backend": args.backend, "animate": args.animate,
+               "mode": args.mode or ("mono" if args.size else mode_for_display(args.display))}
+    options["bus"] = args.bus or ("i2c-400k" if options["mode"] == "mono" else "spi-40m")
+    tool = _tool_digest()
+    cache_path = os.path.join(args.out, CACHE_NAME)
+    cache = {} if args.force else _load_cache(cache_path, tool)
+    option_bytes = json.dumps(options, sort_keys=True).encode()
+    if args.dirty_from:
+        try:
+            with open(args.dirty_from, "rb") as f:
+                option_bytes += f.read()
+        except OSError as e:
+            print(f"--dirty-from: {e}", file=sys.stderr)
+            return 2
+
+    start = time.perf_counter()
+    jobs, counts = [], {"built": 0, "cached": 0, "failed": 0}
+    problems = 0
+    for stem, path in stems.items():
+        job = dict(options, path=path, code_out=os.path.join(args.out, stem + ".ino"),
+                   png_out=os.path.join(args.out, stem + ".png"))
+        try:
+            with open(path, "rb") as f:
+                source = f.read()
+            job["key"] = hashlib.sha256(option_bytes + source + _asset_bytes(source)).hexdigest()
+        except OSError as e:
+            _report({"path": path, "status": "failed", "error": str(e)}, out)
+            counts["failed"] += 1
+            continue
+        outputs = [job["code_out"]] + ([job["png_out"]] if args.png else [])
+        entry = cache.get(os.path.abspath(path))
+        if entry and entry["key"] == job["key"] and all(os.path.exists(p) for p in outputs):
+            _report({"path": path, "status": "cached", "problems": entry["problems"]}, out)
+            counts["cached"] += 1
+            problems += entry["problems"]
+            continue
+        jobs.append(job)
+
+    def finish(result):
+        nonlocal problems
+        _report(result, out)
+        counts[result["status"]] += 1
+        if result["status"] == "built":
+            # The problem count is kept so --strict still fails on a cached input.
+            cache[os.path.abspath(result["path"])] = {"key": result["key"], "problems": len(result["problems"])}
+            problems += len(result["problems"])
+        else:
+            cache.pop(os.path.abspath(result["path"]), None)
+
+    try:
+        if args.jobs <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                finish(_build_job(job))
+        else:
+            with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as pool:
+                for future in as_completed([pool.submit(_build_job, job) for job in jobs]):
+                    finish(future.result())
+    finally:
+        # Keep whatever finished, even if the build was interrupted.
+        _save_cache(cache_path, tool, cache)
+
+    print(f"{counts['built']} built, {counts['cached']} cached, {counts['failed']} failed "
+          f"in {time.perf_counter() - start:.2f} s", file=out)
+    if counts["failed"] or (args.strict and problems):
+        return 1
+    return 0
@@ -0,0 +1,722 @@
+# display_designer/codegen.py
+"""
+Arduino (Adafruit GFX) code generation for the Element model.
+
+generate_code() builds the whole sketch. CodeDocument builds the same text but
+remembers which lines each element owns, so an edit to one element becomes a
+small line patch instead of a full rewrite of the code view.
+generate_project_code() emits a multi-screen project, one function per screen;
+project_document() builds it as a CodeDocument over one screen's draw calls.
+The bitmap export at the end emits a static screen as one packed PROGMEM buffer.
+Bitmap elements become drawBitmap() / drawRGBBitmap() calls on PROGMEM arrays
+declared above setup(), one per distinct image (bitmap_defs()).
+build_ir() lowers elements to library-neutral DrawOps, which backends.py turns
+into code for other display libraries.
+"""
+import re
+import zlib
+
+import numpy as np
+
+from .core import rasterize, signature
+from .images import is_opaque, load_source, split_source
+
+
+# ----------------- Sketch template -----------------
+def header_lines(width, height):
+    return [
+        "#include <Adafruit_GFX.h>",
+        "#include <Adafruit_SSD1306.h>",
+        f"#define SCREEN_WIDTH {width}",
+        f"#define SCREEN_HEIGHT {height}",
+        "// Assuming a standard I2C connection and OLED type (adjust for other displays/protocols)",
+        "Adafruit_SSD1306 display(SCREEN_WIDTH, SCREEN_HEIGHT, &Wire);",
+        "",
+        "void setup() {",
+        "  // Serial.begin(115200); // Uncomment for debugging",
+        "  if(!display.begin(SSD1306_SWITCHCAPVCC, 0x3C)) {",
+        "    // Serial.println(F(\"SSD1306 allocation failed\"));",
+        "    for(;;); // Don't proceed, loop forever",
+        "  }",
+        "  display.clearDisplay();",
+        "  display.setTextColor(WHITE);",
+    ]
+
+
+FOOTER_LINES = [
+    "  display.display();",
+    "}",
+    "",
+    "void loop() {",
+    "  // Your main loop code here",
+    "}"
+]
+
+
+# ----------------- Intermediate representation -----------------
+class DrawOp:
+    """One library-neutral draw call.
+
+    op is "rect", "round_rect", "circle", "hline", "vline", "line",
+    "triangle", "text", "bitmap" (1bpp) or "rgb_bitmap"; args are its integer
+    arguments in Adafruit GFX order without the colour (text: the cursor x, y;
+    bitmaps: x, y, w, h, with the array name in text). fill picks the filled
+    variant and notes are comment lines to emit before the call.
+    """
+    __slots__ = ("op", "args", "fill", "text", "size", "notes")
+
+    def __init__(self, op, args, fill=False, text="", size=1, notes=()):
+        self.op = op
+        self.args = args
+        self.fill = fill
+        self.text = text
+        self.size = size
+        self.notes = notes
+
+    def __eq__(self, other):
+        return isinstance(other, DrawOp) and all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __repr__(self):
+        fill = " fill" if self.fill else ""
+        text = f" {self.text!r} size={self.size}" if self.op == "text" else ""
+        return f"DrawOp({self.op}{fill} {self.args}{text})"
+
+
+_ROTATION_NOTES = ("WARNING: Rotated rectangle (rotation={}°) - Not supported by Adafruit_GFX::drawRect.",
+                   "Drawing the bounding box based on unrotated coordinates.")
+
+
+def lower(el):
+    """The DrawOps that draw one element."""
+    if el.type == "text":
+        return [DrawOp("text", (el.x, el.y), text=el.text, size=el.size)]
+    if el.type == "rect":
+        notes = ()
+        if el.rotation % 360 != 0:
+            notes = (_ROTATION_NOTES[0].format(el.rotation), _ROTATION_NOTES[1])
+        if el.radius:
+            return [DrawOp("round_rect", (el.x, el.y, el.w, el.h, el.radius), el.fill, notes=notes)]
+        return [DrawOp("rect", (el.x, el.y, el.w, el.h), el.fill, notes=notes)]
+    if el.type == "circle":
+        return [DrawOp("circle", (el.x + el.w // 2, el.y + el.h // 2, el.w // 2), el.fill)]
+    if el.type == "line":
+        if el.h == 0 and el.w >= 0:
+            return [DrawOp("hline", (el.x, el.y, el.w + 1))]
+        if el.w == 0 and el.h >= 0:
+            return [DrawOp("vline", (el.x, el.y, el.h + 1))]
+        return [DrawOp("line", (el.x, el.y, el.x + el.w, el.y + el.h))]
+    if el.type == "triangle":
+        return [DrawOp("triangle", tuple(c for p in el.points for c in p), el.fill)]
+    if el.type == "bitmap":
+        op = "rgb_bitmap" if is_opaque(el.text) else "bitmap"
+        return [DrawOp(op, (el.x, el.y, el.w, el.h), text=bitmap_name(el.text))]
+    return []
+
+
+def build_ir(elements):
+    """DrawOps for an iterable of Elements, in draw order."""
+    return [op for el in elements for op in lower(el)]
+
+
+# ----------------- C literals -----------------
+_C_SPECIAL = re.compile(r'[\\"\x00-\x1f\x7f]')
+_C_ESCAPES = {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\t": "\\t", "\r": "\\r"}
+
+
+def c_string(text):
+    """text as a C string literal, quotes included.
+
+    Other control characters become three-digit octal escapes, which no
+    following digit can extend.
+    """
+    return '"' + _C_SPECIAL.sub(lambda m: _C_ESCAPES.get(m.group()) or f"\\{ord(m.group()):03o}", text) + '"'
+
+
+# ----------------- Adafruit GFX emitter -----------------
+_GFX_NAMES = {"rect": "Rect", "round_rect": "RoundRect", "circle": "Circle", "triangle": "Triangle"}
+_GFX_FIXED = {"hline": "drawFastHLine", "vline": "drawFastVLine", "line": "drawLine"}
+
+
+def gfx_lines(op, obj="display", color="WHITE"):
+    """Lines for one DrawOp as Adafruit GFX calls on obj (TFT_eSPI shares the API)."""
+    lines = [f"  // {note}" for note in op.notes] if op.notes else []
+    if op.op == "text":
+        x, y = op.args
+        line = f'  {obj}.setCursor({x}, {y}); {obj}.print({c_string(op.text)});'
+        if op.size != 1:
+            # Keep each block self-contained: restore the default size afterwards.
+            line = f'  {obj}.setTextSize({op.size});{line[1:]} {obj}.setTextSize(1);'
+        lines.append(line)
+        return lines
+    if op.op in ("bitmap", "rgb_bitmap"):
+        x, y, w, h = op.args
+        if op.op == "bitmap":
+            lines.append(f"  {obj}.drawBitmap({x}, {y}, {op.text}, {w}, {h}, {color});")
+        else:
+            lines.append(f"  {obj}.drawRGBBitmap({x}, {y}, {op.text}, {w}, {h});")
+        return lines
+    name = _GFX_FIXED.get(op.op) or ("fill" if op.fill else "draw") + _GFX_NAMES[op.op]
+    lines.append(f"  {obj}.{name}({', '.join(map(str, op.args))}, {color});")
+    return lines
+
+
+_ELEMENT_LINES = {}  # signature -> lines; the IR costs ~3x a direct emitter on full rebuilds
+_ELEMENT_LINES_MAX = 8192
+
+
+def element_lines(el):
+    """The setup() lines that draw a single element: gfx_lines() over its DrawOps."""
+    key = signature(el)
+    lines = _ELEMENT_LINES.get(key)
+    if lines is None:
+        if len(_ELEMENT_LINES) >= _ELEMENT_LINES_MAX:
+            _ELEMENT_LINES.clear()
+        lines = _ELEMENT_LINES[key] = tuple(line for op in lower(el) for line in gfx_lines(op))
+    return list(lines)
+
+
+def generate_code(elements, width, height):
+    """Full sketch text for an iterable of Elements, in draw order."""
+    elements = list(elements)
+    body = []
+    for el in elements:
+        body.extend(element_lines(el))
+    header = insert_defs(header_lines(width, height), bitmap_defs(elements)[0])
+    return "\n".join(header + body + FOOTER_LINES)
+
+
+# ----------------- Bitmap assets -----------------
+_NON_WORD = re.compile(r"\W+")
+
+
+def bitmap_name(source):
+    """C array name for a bitmap source: the file name plus a short hash of the whole source."""
+    _, path = split_source(source)
+    stem = _NON_WORD.sub("_", re.split(r"[\\/]", path)[-1].rsplit(".", 1)[0]).strip("_")
+    return f"bmp_{stem}_{zlib.crc32(source.encode()) & 0xFFFF:04x}"
+
+
+def bitmap_defs(elements):
+    """(lines, flash bytes) declaring the PROGMEM array of every distinct bitmap in elements.
+
+    Each array is preceded by a "// bitmap NAME WxH SOURCE" comment, which is
+    how parse_sketch() finds the image again. 1bpp arrays are in drawBitmap()
+    row layout, RGB565 ones hold one uint16_t per pixel.
+    """
+    lines, flash = [], 0
+    for source in dict.fromkeys(el.text for el in elements if el.type == "bitmap"):
+        name = bitmap_name(source)
+        try:
+            pixels = load_source(source)
+        except (OSError, ValueError) as e:
+            lines += [f"// bitmap {name} 0x0 {source}", f"// ERROR: cannot load the image: {e}", ""]
+            continue
+        h, w = pixels.shape
+        lines.append(f"// bitmap {name} {w}x{h} {source}")
+        if pixels.dtype == bool:
+            data = np.packbits(pixels, axis=1).tobytes()
+            lines += progmem_lines(name, data)
+            flash += len(data)
+        else:
+            lines += progmem_words(name, pixels.ravel().tolist())
+            flash += 2 * pixels.size
+        lines.append("")
+    return lines, flash
+
+
+def insert_defs(lines, defs):
+    """lines with defs inserted before the first function (declarations go above setup())."""
+    if not defs:
+        return lines
+    at = next(i for i, line in enumerate(lines) if line.startswith("void "))
+    return lines[:at] + defs + lines[at:]
+
+
+# ----------------- Incremental document -----------------
+class _LineCounts:
+    """Fenwick tree over per-element line counts: O(log n) update and prefix sum."""
+    def __init__(self, counts=()):
+        self.counts = []
+        self.tree = [0]
+        self._build(list(counts))
+
+    def _build(self, counts, capacity=None):
+        self.counts = counts
+        size = max(capacity or 0, len(counts), 16)
+        self.tree = [0] * (size + 1)
+        for i in range(1, size + 1):
+            if i <= len(counts):
+                self.tree[i] += counts[i - 1]
+            j = i + (i & -i)
+            if j <= size:
+                self.tree[j] += self.tree[i]
+
+    def append(self, count):
+        if len(self.counts) + 1 >= len(self.tree):
+            self._build(self.counts + [count], capacity=2 * len(self.tree))
+            return
+        self.counts.append(0)
+        self.set(len(self.counts) - 1, count)
+
+    def set(self, index, count):
+        delta = count - self.counts[index]
+        self.counts[index] = count
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """Sum of counts[:index]."""
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+
+class CodeDocument:
+    """Generated sketch that tracks the line span owned by each element.
+
+    rebuild() produces the full text; set_element() and remove_element()
+    return a patch (first_line, old_line_count, new_lines) against the text
+    produced so far, with first_line 1-based like Tk Text indices. Patches are
+    None when nothing changed. Cost per edit is O(log n) in the element count.
+    embed() places the blocks inside a larger sketch instead (see project_document()).
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._header = header_lines(width, height)
+        self._footer = FOOTER_LINES
+        self._arrays = set()  # bitmap sources the header declares
+        self._slots = {}    # element id -> slot index
+        self._blocks = []   # slot index -> lines (empty list once removed)
+        self._counts = _LineCounts()
+        self._shared = None   # embedded: blocks other screens draw (tuples of lines)
+        self._pinned = set()  # embedded: ids drawn outside the document's blocks
+
+    def rebuild(self, elements):
+        """Reset the document to elements (structural change) and return its full text."""
+        elements = list(elements)
+        defs, _ = bitmap_defs(elements)
+        self._header = insert_defs(header_lines(self.width, self.height), defs)
+        self._footer = FOOTER_LINES
+        self._arrays = {el.text for el in elements if el.type == "bitmap"}
+        self._shared, self._pinned = None, set()
+        self._fill(elements)
+        return self.text()
+
+    def embed(self, header, elements, footer, shared=(), pinned=()):
+        """Reset the document to the blocks of elements between header and footer lines; returns the text.
+
+        shared holds the blocks other screens draw and pinned the ids of elements
+        drawn elsewhere (e.g. by a shared function). needs_rebuild() is true for
+        edits that would change what is shared, and for every bitmap.
+        """
+        self._header, self._footer = list(header), list(footer)
+        self._arrays = set()
+        self._shared, self._pinned = set(shared), set(pinned)
+        self._fill(list(elements))
+        return self.text()
+
+    def _fill(self, elements):
+        self._slots = {}
+        self._blocks = []
+        for el in elements:
+            self._slots[el.id] = len(self._blocks)
+            self._blocks.append(element_lines(el))
+        self._counts = _LineCounts(len(b) for b in self._blocks)
+
+    def resize(self, width, height, elements):
+        """Display size changed: the header changes, so rebuild everything."""
+        self.width = width
+        self.height = height
+        return self.rebuild(elements)
+
+    def text(self):
+        body = [line for block in self._blocks for line in block]
+        return "\n".join(self._header + body + self._footer)
+
+    def line_span(self, el_id):
+        """(first_line, line_count) of an element's block, or None if unknown."""
+        slot = self._slots.get(el_id)
+        if slot is None:
+            return None
+        return self._first_line(slot), len(self._blocks[slot])
+
+    def needs_rebuild(self, el):
+        """True if set_element(el) cannot be patched: a bitmap whose array the header does not
+        declare, or (embedded) an element that is or would become shared."""
+        if self._shared is None:
+            return el.type == "bitmap" and el.text not in self._arrays
+        return el.type == "bitmap" or el.id in self._pinned or tuple(element_lines(el)) in self._shared
+
+    def is_pinned(self, el_id):
+        """True if el_id is drawn outside the document's blocks, so removing it cannot be patched."""
+        return el_id in self._pinned
+
+    def set_element(self, el):
+        """Add el (appended in draw order) or update its block."""
+        lines = element_lines(el)
+        slot = self._slots.get(el.id)
+        if slot is None:
+            slot = self._slots[el.id] = len(self._blocks)
+            self._blocks.append(lines)
+            self._counts.append(len(lines))
+            return (self._first_line(slot), 0, lines) if lines else None
+        old = self._blocks[slot]
+        if old == lines:
+            return None
+        first = self._first_line(slot)
+        self._blocks[slot] = lines
+        self._counts.set(slot, len(lines))
+        return first, len(old), lines
+
+    def remove_element(self, el_id):
+        slot = self._slots.pop(el_id, None)
+        if slot is None:
+            return None
+        old = self._blocks[slot]
+        first = self._first_line(slot)
+        # Leave an empty block behind so later slots keep their index; rebuild() compacts.
+        self._blocks[slot] = []
+        self._counts.set(slot, 0)
+        return (first, len(old), []) if old else None
+
+    def _first_line(self, slot):
+        return 1 + len(self._header) + self._counts.prefix(slot)
+
+
+def apply_patch(lines, patch):
+    """Apply a CodeDocument patch to a list of lines in place (headless consumers)."""
+    first, old_count, new_lines = patch
+    lines[first - 1:first - 1 + old_count] = new_lines
+
+
+# ----------------- Multi-screen projects -----------------
+# Everything is drawn in one colour, so the order of draw calls within a screen
+# does not change its pixels and elements shared by several screens can be
+# hoisted into one function that each of those screens calls.
+_FUNCTION = re.compile(r"^void (\w+)\(\) \{\n(.*?)^\}", re.M | re.S)
+_HELPER_CALL = re.compile(r"^\s*(draw\w+)\(\);\s*$")
+
+
+def share_blocks(screens):
+    """Split per-screen blocks into groups used by several screens and each screen's own.
+
+    screens is [(name, [block, ...])] with blocks hashable (tuples of lines).
+    Returns (groups, layout): groups is [(user names, [block, ...])] in order
+    of first use; layout maps name -> ([group index, ...], [own block index, ...]),
+    the own blocks given by their index in that screen's list. A block repeated
+    within one screen is only shared once.
+    """
+    users = {}
+    for name, blocks in screens:
+        for block in dict.fromkeys(blocks):
+            users.setdefault(block, []).append(name)
+    group_of, groups = {}, []
+    for block, names in users.items():
+        if len(names) < 2:
+            continue
+        key = tuple(names)
+        if key not in group_of:
+            group_of[key] = len(groups)
+            groups.append((key, []))
+        groups[group_of[key]][1].append(block)
+    layout = {}
+    for name, blocks in screens:
+        used, own, seen = [], [], set()
+        for i, block in enumerate(blocks):
+            key = tuple(users[block])
+            if len(key) > 1 and block not in seen:
+                seen.add(block)
+                if group_of[key] not in used:
+                    used.append(group_of[key])
+            else:
+                own.append(i)
+        layout[name] = (used, own)
+    return groups, layout
+
+
+def generate_project_code(screens, width, height):
+    """Sketch with one drawScreen_<name>() per screen, plus a size report dict.
+
+    screens is [(name, elements)] in project order; the first one is shown by
+    setup(). Elements drawn identically on several screens go into shared
+    draw functions instead of being repeated in every screen. Screens with an
+    RGB565 bitmap share nothing: it is opaque, so their calls keep their order.
+    """
+    doc, report = project_document(screens, width, height)
+    return doc.text(), report
+
+
+def project_document(screens, width, height, live=None):
+    """generate_project_code() as a CodeDocument (text() is the sketch), plus the report.
+
+    With live set to a screen name, the document's elements are that screen's
+    own draw calls in its drawScreen_ function, so moving one of them is a
+    line patch; needs_rebuild() is true for edits that change what is shared.
+    """
+    screens = [(name, list(elements)) for name, elements in screens]
+    elements_of = dict(screens)
+    defs, _ = bitmap_defs(el for _, elements in screens for el in elements)
+    ordered = {name for name, elements in screens
+               if any(el.type == "bitmap" and is_opaque(el.text) for el in elements)}
+    screens = [(name, [tuple(element_lines(el)) for el in elements]) for name, elements in screens]
+    groups, layout = share_blocks([(name, blocks) for name, blocks in screens if name not in ordered])
+    layout.update((name, ([], list(range(len(blocks))))) for name, blocks in screens if name in ordered)
+    everyone = len(screens)
+    names = ["drawCommon" if len(users) == everyone and len(groups) == 1 else f"drawShared{i + 1}"
+             for i, (users, _) in enumerate(groups)]
+
+    header = header_lines(width, height)
+    setup_at = header.index("void setup() {")
+    out = header[:setup_at] + defs
+    for fn, (users, blocks) in zip(names, groups):
+        out += [f"// Shared by: {', '.join(users)}", f"void {fn}() {{"]
+        out += [line for block in blocks for line in block] + ["}", ""]
+    head = None
+    for name, blocks in screens:
+        used, own = layout[name]
+        out += [f"void drawScreen_{name}() {{", "  display.clearDisplay();"]
+        out += [f"  {names[i]}();" for i in used]
+        if name == live:
+            head, out = out, []
+        else:
+            out += [line for i in own for line in blocks[i]]
+        out += ["  display.display();", "}", ""]
+    out += header[setup_at:]
+    out += [f"  drawScreen_{screens[0][0]}();" if screens else "  display.display();", "}", "",
+            "void loop() {", "  // Call drawScreen_<name>() to show another screen", "}"]
+
+    doc = CodeDocument(width, height)
+    if live is None:
+        doc.embed(out, [], [])
+    else:
+        live_elements = elements_of[live]
+        own = set(layout[live][1])
+        shared = {block for name, blocks in screens if name != live and name not in ordered for block in blocks}
+        doc.embed(head, [el for i, el in enumerate(live_elements) if i in own], out, shared,
+                  [el.id for i, el in enumerate(live_elements) if i not in own or el.type == "bitmap"])
+
+    # Draw-call cost with and without sharing; each screen adds clearDisplay() and
+    # display(), each use of a shared function one argument-less call.
+    calls, flash = call_flash(line for _, blocks in groups for block in blocks for line in block)
+    blocks_of = dict(screens)
+    for name, (used, own) in layout.items():
+        own_calls, own_flash = call_flash(line for i in own for line in blocks_of[name][i])
+        calls += own_calls + len(used) + 2
+        flash += own_flash + CALL_FLASH_BYTES * (len(used) + 2)
+    flat_calls, flat_flash = call_flash(line for _, blocks in screens for block in blocks for line in block)
+    report = {
+        "screens": len(screens),
+        "shared_functions": len(groups),
+        "shared_elements": sum(len(blocks) for _, blocks in groups),
+        "calls": calls,
+        "call_flash": flash,
+        "unshared_calls": flat_calls + 2 * len(screens),
+        "unshared_call_flash": flat_flash + 2 * CALL_FLASH_BYTES * len(screens),
+    }
+    return doc, report
+
+
+def format_project_report(report):
+    """One-line summary of a generate_project_code() report."""
+    return (f"{report['screens']} screens, {report['shared_elements']} shared elements in "
+            f"{report['shared_functions']} functions: ~{report['call_flash']} B of draw calls "
+            f"(~{report['unshared_call_flash']} B unshared)")
+
+
+def extract_screen(code, name):
+    """The draw calls of drawScreen_<name>() in a project sketch, with shared functions inlined.
+
+    Returns None if the sketch has no such function (e.g. it is a one-screen sketch).
+    """
+    bodies = {fn: body.rstrip("\n") for fn, body in _FUNCTION.findall(code)}
+    body = bodies.get(f"drawScreen_{name}")
+    if body is None:
+        return None
+    lines = []
+    for line in body.split("\n"):
+        helper = _HELPER_CALL.match(line)
+        if helper and helper.group(1) in bodies and not helper.group(1).startswith("drawScreen_"):
+            lines.extend(bodies[helper.group(1)].split("\n"))
+        else:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+# ----------------- Bitmap export -----------------
+# Static screens can ship as one pre-rasterized 1bpp buffer instead of draw calls.
+# "ssd1306" is the controller's native page layout (byte = 8 vertical pixels, LSB
+# on top), i.e. exactly Adafruit_SSD1306's buffer, so it is blitted with a single
+# memcpy_P into display.getBuffer(). "drawbitmap" is the row-major, MSB-first
+# layout expected by Adafruit_GFX::drawBitmap() and works with any GFX display.
+BITMAP_LAYOUTS = ("ssd1306", "drawbitmap")
+
+# Rough Xtensa (ESP32) code size of one display.xxx(...) call in setup():
+# load `this` + call8 per call, a movi/l32r per argument. Only used for the report.
+CALL_FLASH_BYTES = 6
+ARG_FLASH_BYTES = 3
+RLE_DECODER_FLASH_BYTES = 64
+
+_CALL = re.compile(r'\b\w+\.\w+\(([^;]*)\);')
+_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+RLE_DECODER_LINES = [
+    "// PackBits-style RLE: c < 128 -> c + 1 literal bytes follow; c >= 128 -> next byte repeated c - 125 times.",
+    "static void unpackRle(const uint8_t *src, uint8_t *dst, size_t n) {",
+    "  size_t i = 0;",
+    "  while (i < n) {",
+    "    uint8_t c = pgm_read_byte(src++);",
+    "    if (c < 128) {",
+    "      for (uint16_t k = 0; k <= c; k++) dst[i++] = pgm_read_byte(src++);",
+    "    } else {",
+    "      uint8_t v = pgm_read_byte(src++);",
+    "      for (uint16_t k = 0; k < c - 125u; k++) dst[i++] = v;",
+    "    }",
+    "  }",
+    "}",
+]
+
+
+def rle_encode(data):
+    """PackBits-style run-length encoding (see RLE_DECODER_LINES) of a bytes-like object.
+
+    Runs are found with NumPy; the Python loop only visits run boundaries.
+    """
+    buf = np.frombuffer(bytes(data), dtype=np.uint8)
+    if not len(buf):
+        return b""
+    starts = np.flatnonzero(np.concatenate(([True], buf[1:] != buf[:-1])))
+    lengths = np.diff(np.append(starts, len(buf)))
+    out = bytearray()
+    literal_from = None  # start of the pending literal stretch
+
+    def flush_literal(end):
+        for pos in range(literal_from, end, 128):
+            chunk = buf[pos:min(pos + 128, end)]
+            out.append(len(chunk) - 1)
+            out.extend(chunk.tobytes())
+
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if length >= 3:
+            if literal_from is not None:
+                flush_literal(start)
+                literal_from = None
+            value = int(buf[start])
+            while length >= 3:
+                n = min(length, 130)
+                out += bytes((n + 125, value))
+                start += n
+                length -= n
+        if length and literal_from is None:
+            literal_from = start  # short runs (and 1-2 byte leftovers) join the pending literal
+    if literal_from is not None:
+        flush_literal(len(buf))
+    return bytes(out)
+
+
+def rle_decode(data, size):
+    """Inverse of rle_encode (mirrors the C decoder), for checking exports."""
+    out = bytearray()
+    i = 0
+    while len(out) < size:
+        c = data[i]
+        if c < 128:
+            out += data[i + 1:i + 2 + c]
+            i += 2 + c
+        else:
+            out += bytes((data[i + 1],)) * (c - 125)
+            i += 2
+    return bytes(out)
+
+
+def call_flash(lines):
+    """(calls, approximate flash bytes) of the obj.method(...) calls in generated lines."""
+    calls = flash = 0
+    for line in lines:
+        for args in _CALL.findall(line):
+            calls += 1
+            flash += CALL_FLASH_BYTES
+            strings = _STRING.findall(args)
+            flash += sum(len(s) + 1 for s in strings)  # string literals live in flash too
+            args = _STRING.sub("", args).strip()
+            flash += ARG_FLASH_BYTES * (args.count(",") + 1 if args else 0)
+    return calls, flash
+
+
+def estimate_call_flash(elements):
+    """(calls, approximate flash bytes) of drawing elements with generated display calls."""
+    return call_flash(line for el in elements for line in element_lines(el))
+
+
+def progmem_lines(name, data, per_line=16):
+    lines = [f"const uint8_t {name}[] PROGMEM = {{"]
+    for i in range(0, len(data), per_line):
+        lines.append("  " + ", ".join(f"0x{b:02X}" for b in data[i:i + per_line]) + ",")
+    lines.append("};")
+    return lines
+
+
+def progmem_words(name, data, per_line=12):
+    lines = [f"const uint16_t {name}[] PROGMEM = {{"]
+    for i in range(0, len(data), per_line):
+        lines.append("  " + ", ".join(f"0x{v:04X}" for v in data[i:i + per_line]) + ",")
+    lines.append("};")
+    return lines
+
+
+def generate_bitmap_code(elements, width, height, layout="ssd1306", rle=False, name="screen"):
+    """Sketch that blits the pre-rasterized layout (text included), plus a flash-size report dict."""
+    if layout not in BITMAP_LAYOUTS:
+        raise ValueError(f"Unknown bitmap layout '{layout}' (expected one of {', '.join(BITMAP_LAYOUTS)})")
+    elements = list(elements)
+    fb = rasterize(elements, (width, height))
+    raw = fb.pages() if layout == "ssd1306" else fb.packed()
+    stored = rle_encode(raw) if rle else raw
+    array = f"{name}_bitmap"
+
+    if layout == "ssd1306":
+        size_expr = "SCREEN_WIDTH * ((SCREEN_HEIGHT + 7) / 8)"
+        blit = ([f"  unpackRle({array}, display.getBuffer(), {size_expr});"] if rle else
+                [f"  memcpy_P(display.getBuffer(), {array}, sizeof({array}));"])
+    else:
+        size_expr = "((SCREEN_WIDTH + 7) / 8) * SCREEN_HEIGHT"
+        if rle:
+            blit = [f"  static uint8_t {name}_buffer[{size_expr}];",
+                    f"  unpackRle({array}, {name}_buffer, sizeof({name}_buffer));",
+                    f"  display.drawBitmap(0, 0, {name}_buffer, SCREEN_WIDTH, SCREEN_HEIGHT, WHITE);"]
+        else:
+            blit = [f"  display.drawBitmap(0, 0, {array}, SCREEN_WIDTH, SCREEN_HEIGHT, WHITE);"]
+
+    header = header_lines(width, height)
+    setup_at = header.index("void setup() {")
+    described = f"{width}x{height} 1bpp, {'SSD1306 page' if layout == 'ssd1306' else 'drawBitmap row'} layout"
+    described += f", RLE {len(raw)} -> {len(stored)} bytes" if rle else f", {len(raw)} bytes"
+    preamble = [f"// {described}"] + progmem_lines(array, stored) + [""]
+    if rle:
+        preamble += RLE_DECODER_LINES + [""]
+    code = "\n".join(header[:setup_at] + preamble + header[setup_at:] + blit + FOOTER_LINES)
+
+    calls, call_flash = estimate_call_flash(elements)
+    report = {
+        "layout": layout,
+        "raw_bytes": len(raw),
+        "stored_bytes": len(stored),
+        "decoder_bytes": RLE_DECODER_FLASH_BYTES if rle else 0,
+        "bitmap_flash": len(stored) + (RLE_DECODER_FLASH_BYTES if rle else 0) + CALL_FLASH_BYTES * 2,
+        "draw_calls": calls,
+        "draw_call_flash": call_flash,
+    }
+    return code, report
+
+
+def format_bitmap_report(report):
+    """One-line summary of a generate_bitmap_code() report."""
+    stored = f"{report['stored_bytes']} B"
+    if report["decoder_bytes"]:
+        stored = f"RLE {report['raw_bytes']} -> {report['stored_bytes']} B + ~{report['decoder_bytes']} B decoder"
+    return (f"{report['layout']} bitmap: {stored} (~{report['bitmap_flash']} B flash) vs "
+            f"~{report['draw_call_flash']} B for {report['draw_calls']} draw calls")
@@ -5,6 +5,15 @@ Core models and presets for the Display Designer.
 
 import math
 import re
+import struct
+import zlib
+from functools import lru_cache
+from operator import attrgetter
+
+import numpy as np
+
+from .glcdfont import GLCDFONT, GLCDFONT_FIRST
+from .images import is_opaque, load_source
 
 # ----------------- Presets -----------------
 DISPLAY_PRESETS = {
@@ -17,16 +26,1402 @@ DISPLAY_PRESETS = {
 # ----------------- Helper: Element model -----------------
 class Element:
     """Model for a drawable element on canvas."""
-    def __init__(self, etype, canvas_id, x=0, y=0, w=0, h=0, text="", rotation=0):
-        self.type = etype  # "rect", "circle", "text"
+    __slots__ = ("type", "id", "x", "y", "w", "h", "text", "rotation", "fill", "radius", "size", "points")
+
+    def __init__(self, etype, canvas_id, x=0, y=0, w=0, h=0, text="", rotation=0,
+                 fill=False, radius=0, size=1, points=None):
+        self.type = etype  # "rect", "circle", "text", "line", "triangle", "bitmap"
         self.id = canvas_id
         self.x = x         # Top-left x coordinate relative to display (0, 0)
         self.y = y         # Top-left y coordinate relative to display (0, 0)
-        self.w = w         # Width
-        self.h = h         # Height
-        self.text = text
+        self.w = w         # Width (for "line": x1 - x0, may be negative)
+        self.h = h         # Height (for "line": y1 - y0, may be negative)
+        self.text = text          # for "bitmap" its source, "<format>:<path>" (see images.py)
         self.rotation = rotation  # degrees
+        self.fill = fill          # fillRect / fillCircle / fillRoundRect / fillTriangle
+        self.radius = radius      # corner radius of a round rect (0 = plain rect)
+        self.size = size          # setTextSize() multiplier for text
+        self.points = points      # [(x0, y0), (x1, y1), (x2, y2)] for "triangle"
+        if etype == "text" and not (w or h):
+            self.w, self.h = text_size(text, size)  # what print() covers in the classic font
+
+    def translate(self, dx, dy):
+        """Move the element (and its triangle points, if any) by dx, dy."""
+        self.x += dx
+        self.y += dy
+        if self.points:
+            self.points = [(px + dx, py + dy) for px, py in self.points]
+
+
+# ----------------- Scene: struct-of-arrays element store -----------------
+ELEMENT_TYPES = ("rect", "circle", "text", "line", "triangle", "bitmap")
+_TYPE_CODE = {t: i for i, t in enumerate(ELEMENT_TYPES)}
+
+
+class ElementView:
+    """Live, Element-compatible view of one row of a Scene (reads and writes go to the columns)."""
+    __slots__ = ("_scene", "id")
+
+    def __init__(self, scene, element_id):
+        self._scene = scene
+        self.id = element_id
+
+    def _row(self):
+        row = self._scene._rows[self.id] if 0 <= self.id < self._scene._next_id else -1
+        if row < 0:
+            raise KeyError(f"Element {self.id} is no longer in the scene")
+        return row
+
+    def _column(name, cast=int):
+        def get(self):
+            return cast(getattr(self._scene, name)[self._row()])
+
+        def set(self, value):
+            getattr(self._scene, name)[self._row()] = value
+        return property(get, set)
+
+    x = _column("_x")
+    y = _column("_y")
+    w = _column("_w")
+    h = _column("_h")
+    rotation = _column("_rotation")
+    fill = _column("_fill", bool)
+    radius = _column("_radius")
+    size = _column("_size")
+    del _column
+
+    @property
+    def type(self):
+        return ELEMENT_TYPES[self._scene._kind[self._row()]]
+
+    @property
+    def text(self):
+        return self._scene._texts[self._scene._text[self._row()]]
+
+    @text.setter
+    def text(self, value):
+        self._scene._text[self._row()] = self._scene._intern(value)
+
+    @property
+    def points(self):
+        rel = self._scene._points.get(self.id)
+        if rel is None:
+            return None
+        row = self._row()
+        x, y = int(self._scene._x[row]), int(self._scene._y[row])
+        return [(x + dx, y + dy) for dx, dy in rel]
+
+    @points.setter
+    def points(self, value):
+        self._scene._set_points(self.id, self._row(), value)
+
+    def translate(self, dx, dy):
+        # triangle points are stored relative to (x, y), so they follow for free
+        row = self._row()
+        self._scene._x[row] += dx
+        self._scene._y[row] += dy
+
+    def to_element(self):
+        """Detached Element copy of this row."""
+        return Element(self.type, self.id, self.x, self.y, self.w, self.h, text=self.text, rotation=self.rotation,
+                       fill=self.fill, radius=self.radius, size=self.size, points=self.points)
+
+
+class Scene:
+    """Element store backed by typed NumPy columns, with ids independent of Tk.
+
+    Rows are kept in draw order. Every element has a stable integer id; _rows
+    maps id -> row (-1 once removed). Removal leaves a tombstone that is
+    compacted once more than half the rows are dead, so ids and draw order
+    survive deletes. Text is interned into a shared table and triangle points
+    are stored relative to (x, y). Iterating yields ElementView objects, which
+    code generation and the rasterizer accept like Elements.
+    """
+    _COLUMNS = (("_kind", np.uint8), ("_x", np.int32), ("_y", np.int32), ("_w", np.int32), ("_h", np.int32),
+                ("_rotation", np.int16), ("_fill", np.bool_), ("_radius", np.int16), ("_size", np.uint8),
+                ("_text", np.int32), ("_ids", np.int32), ("_alive", np.bool_))
+
+    def __init__(self, capacity=64):
+        for name, dtype in self._COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self._rows = np.zeros(0, dtype=np.int32)   # id -> row, -1 when removed
+        self._n = 0        # rows in use, including tombstones
+        self._dead = 0
+        self._next_id = 0
+        self._texts = [""]
+        self._text_ids = {"": 0}
+        self._points = {}  # id -> ((dx, dy), ...) relative to (x, y), triangles only
+
+    # ---- construction ----
+    @classmethod
+    def from_elements(cls, elements):
+        """Bulk-load Elements (in draw order) into a new Scene."""
+        elements = list(elements)
+        scene = cls(capacity=max(64, len(elements)))
+        if not elements:
+            return scene
+        types, texts = [el.type for el in elements], [el.text for el in elements]
+        x, y, w, h, rotation, fill, radius, size = _columns(
+            elements, ("x", "y", "w", "h", "rotation", "fill", "radius", "size"))
+        ids = scene.add_many(types, x, y, w, h, rotation=rotation, fill=fill, radius=radius, size=size, text=texts)
+        for eid, el in zip(ids, elements):
+            if el.points:
+                scene._set_points(int(eid), scene._rows[eid], el.points)
+        return scene
+
+    def copy(self):
+        """Independent copy (same ids, draw order and text table), e.g. a snapshot for a worker thread."""
+        other = Scene.__new__(Scene)
+        for name, _ in self._COLUMNS:
+            setattr(other, name, getattr(self, name)[:max(self._n, 1)].copy())
+        other._rows = self._rows.copy()
+        other._n, other._dead, other._next_id = self._n, self._dead, self._next_id
+        other._texts = list(self._texts)
+        other._text_ids = dict(self._text_ids)
+        other._points = dict(self._points)
+        return other
+
+    def add(self, el):
+        """Copy an Element (or ElementView) into the scene; returns its new id."""
+        (eid,) = self.add_many([el.type], [el.x], [el.y], [el.w], [el.h], rotation=[el.rotation], fill=[el.fill],
+                               radius=[el.radius], size=[el.size], text=[el.text])
+        if el.points:
+            self._set_points(eid, self._rows[eid], el.points)
+        return int(eid)
+
+    def add_many(self, types, x, y, w, h, rotation=0, fill=False, radius=0, size=1, text=None):
+        """Vectorized bulk insert at the end of the draw order. Returns the new ids."""
+        count = len(x)
+        self._reserve(self._n + count)
+        rows = slice(self._n, self._n + count)
+        codes = [_TYPE_CODE[t] for t in types] if not isinstance(types, str) else _TYPE_CODE[types]
+        self._kind[rows] = codes
+        self._x[rows] = x
+        self._y[rows] = y
+        self._w[rows] = w
+        self._h[rows] = h
+        self._rotation[rows] = rotation
+        self._fill[rows] = fill
+        self._radius[rows] = radius
+        self._size[rows] = size
+        self._text[rows] = 0 if text is None else [self._intern(t) for t in text]
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int32)
+        self._ids[rows] = ids
+        self._alive[rows] = True
+        self._next_id += count
+        if self._next_id > len(self._rows):
+            rows_map = np.full(max(self._next_id, 2 * len(self._rows)), -1, dtype=np.int32)
+            rows_map[:len(self._rows)] = self._rows
+            self._rows = rows_map
+        self._rows[ids] = np.arange(self._n, self._n + count, dtype=np.int32)
+        self._n += count
+        return ids
+
+    def remove(self, element_id):
+        if element_id not in self:
+            raise KeyError(element_id)
+        self._alive[self._rows[element_id]] = False
+        self._rows[element_id] = -1
+        self._points.pop(element_id, None)
+        self._dead += 1
+        if self._dead > 64 and self._dead * 2 > self._n:
+            self.compact()
+
+    def clear(self):
+        self._rows[:] = -1
+        self._n = self._dead = 0
+        self._points.clear()
+
+    def reorder(self, ids):
+        """Put the given ids first, in that order (the rest keep their relative order)."""
+        first = self._rows[np.asarray(ids, dtype=np.intp)]
+        rest = np.flatnonzero(self._alive[:self._n])
+        rest = rest[~np.isin(rest, first)]
+        self._take(np.concatenate([first, rest]))
+
+    def compact(self):
+        """Drop tombstones, keeping draw order."""
+        self._take(np.flatnonzero(self._alive[:self._n]))
+
+    def _take(self, rows):
+        for name, _ in self._COLUMNS:
+            col = getattr(self, name)
+            col[:len(rows)] = col[rows]
+        self._n = len(rows)
+        self._dead = 0
+        self._rows[:] = -1
+        self._rows[self._ids[:self._n]] = np.arange(self._n, dtype=np.int32)
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._x):
+            return
+        new = max(capacity, 2 * len(self._x))
+        for name, dtype in self._COLUMNS:
+            col = np.zeros(new, dtype=dtype)
+            col[:self._n] = getattr(self, name)[:self._n]
+            setattr(self, name, col)
+
+    def _intern(self, text):
+        tid = self._text_ids.get(text)
+        if tid is None:
+            tid = self._text_ids[text] = len(self._texts)
+            self._texts.append(text)
+        return tid
+
+    def _set_points(self, element_id, row, points):
+        if points is None:
+            self._points.pop(element_id, None)
+            return
+        x, y = int(self._x[row]), int(self._y[row])
+        self._points[element_id] = tuple((px - x, py - y) for px, py in points)
+
+    # ---- access ----
+    def __len__(self):
+        return self._n - self._dead
+
+    def __contains__(self, element_id):
+        return 0 <= element_id < self._next_id and self._rows[element_id] >= 0
+
+    def __getitem__(self, element_id):
+        if element_id not in self:
+            raise KeyError(element_id)
+        return ElementView(self, element_id)
+
+    def ids(self):
+        """Live ids in draw order."""
+        return self._ids[:self._n][self._alive[:self._n]]
+
+    def __iter__(self):
+        return (ElementView(self, int(i)) for i in self.ids())
+
+    def columns(self):
+        """Read-only arrays of the live rows, in draw order (type codes index ELEMENT_TYPES)."""
+        live = self._alive[:self._n]
+        return {name[1:]: getattr(self, name)[:self._n][live] for name, _ in self._COLUMNS
+                if name not in ("_alive",)}
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the scene (columns, id map, text table and points)."""
+        total = sum(getattr(self, name).nbytes for name, _ in self._COLUMNS) + self._rows.nbytes
+        total += sum(len(t) + 49 for t in self._texts)
+        return total + 120 * len(self._points)
+
+    # ---- vectorized bulk operations ----
+    def translate(self, ids, dx, dy):
+        """Move every element in ids (None = the whole scene) by (dx, dy)."""
+        if ids is None:
+            rows = slice(0, self._n)  # tombstones move too; harmless and avoids a gather
+        else:
+            rows = self._rows[np.asarray(ids, dtype=np.intp)]
+        self._x[rows] += dx
+        self._y[rows] += dy
+
+    def bounds(self, ids=None):
+        """Union bounding box (x0, y0, x1, y1) of ids (default: everything), or None if empty.
+
+        Lines may have negative w/h, so both ends are considered.
+        """
+        if ids is None:
+            rows = np.flatnonzero(self._alive[:self._n])
+        else:
+            rows = self._rows[np.asarray(ids, dtype=np.intp)]
+        if len(rows) == 0:
+            return None
+        x, y = self._x[rows], self._y[rows]
+        x2, y2 = x + self._w[rows], y + self._h[rows]
+        return (int(np.minimum(x, x2).min()), int(np.minimum(y, y2).min()),
+                int(np.maximum(x, x2).max()), int(np.maximum(y, y2).max()))
+
+    def ids_of_type(self, etype):
+        """Ids of all elements of one type, in draw order."""
+        live = self._alive[:self._n] & (self._kind[:self._n] == _TYPE_CODE[etype])
+        return self._ids[:self._n][live]
+
+    def raster_bounds(self, wrap_width=None):
+        """(ids, x0, y0, x1, y1) arrays: what raster_bbox() gives for every live element, in draw order."""
+        rows = np.flatnonzero(self._alive[:self._n])
+        kind = self._kind[rows]
+        x, y, w, h = (getattr(self, c)[rows].astype(np.int64) for c in ("_x", "_y", "_w", "_h"))
+        x0, y0 = np.minimum(x, x + w), np.minimum(y, y + h)
+        x1, y1 = np.maximum(x, x + w) + 1, np.maximum(y, y + h) + 1
+        rect = (kind == _TYPE_CODE["rect"]) | (kind == _TYPE_CODE["bitmap"])
+        x1[rect] -= 1
+        y1[rect] -= 1
+        circle = kind == _TYPE_CODE["circle"]
+        r = w[circle] // 2
+        cx, cy = x[circle] + r, y[circle] + h[circle] // 2
+        x0[circle], y0[circle], x1[circle], y1[circle] = cx - r, cy - r, cx + r + 1, cy + r + 1
+        text = np.flatnonzero(kind == _TYPE_CODE["text"])
+        for i, tid, size in zip(text.tolist(), self._text[rows][text].tolist(), self._size[rows][text].tolist()):
+            x0[i], y0[i], x1[i], y1[i] = _text_box(self._texts[tid], int(x[i]), int(y[i]), size, wrap_width)
+        return self._ids[rows], x0, y0, x1, y1
+
+    def overlapping(self, x0, y0, x1, y1, wrap_width=None):
+        """Ids (draw order) whose raster_bbox() overlaps the box x0 <= x < x1, y0 <= y < y1."""
+        ids, bx0, by0, bx1, by1 = self.raster_bounds(wrap_width)
+        return ids[(bx0 < x1) & (x0 < bx1) & (by0 < y1) & (y0 < by1)]
+
+
+def merge_rects(rects):
+    """Union overlapping or touching (x0, y0, x1, y1) rects until none touch."""
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for r in rects:
+            for i, o in enumerate(out):
+                if r[0] <= o[2] and o[0] <= r[2] and r[1] <= o[3] and o[1] <= r[3]:
+                    out[i] = (min(r[0], o[0]), min(r[1], o[1]), max(r[2], o[2]), max(r[3], o[3]))
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        rects = out
+    return rects
+
+
+# ----------------- Spatial index: hit-testing without Tk -----------------
+def _text_box(text, x, y, size=1, wrap_width=None):
+    bx0, by0, bx1, by1 = text_bounds(text, size)
+    if "\n" in text or wrap_width is not None and x + bx1 > wrap_width:
+        # the cursor returns to x = 0: lay the lines out where print() puts them
+        return _runs_box(text_runs(text, x, y, size, None, wrap_width), size, None) or (x, y, x, y)
+    return x + bx0, y + by0, x + bx1, y + by1
+
+
+def raster_bbox(el, wrap_width=None):
+    """(x0, y0, x1, y1), end-exclusive: every pixel the generated call for el can set.
+
+    Unlike footprint() this follows what the device draws: rects unrotated,
+    circles from the drawCircle() centre and radius, bitmaps as their w x h
+    box, text in classic font cells, wrapped at wrap_width (the display width) if given.
+    """
+    x, y, w, h = el.x, el.y, el.w, el.h
+    if el.type in ("rect", "bitmap"):
+        return min(x, x + w), min(y, y + h), max(x, x + w), max(y, y + h)
+    if el.type == "circle":
+        r = w // 2
+        cx, cy = x + r, y + h // 2
+        return cx - r, cy - r, cx + r + 1, cy + r + 1
+    if el.type == "text":
+        return _text_box(el.text, x, y, el.size, wrap_width)
+    if el.type == "triangle":
+        xs, ys = [p[0] for p in el.points], [p[1] for p in el.points]
+        return min(xs), min(ys), max(xs) + 1, max(ys) + 1
+    return min(x, x + w), min(y, y + h), max(x, x + w) + 1, max(y, y + h) + 1
+
+
+def signature(el):
+    """Everything about el that decides which pixels it draws, as a hashable tuple (not its id)."""
+    return (el.type, el.x, el.y, el.w, el.h, el.text, el.rotation, el.fill, el.radius, el.size,
+            tuple(el.points) if el.points else None)
+
+
+def footprint(el):
+    """Exact hit shape of an element in display coordinates: (bbox, kind, data).
+
+    kind is "poly" (convex vertices: rects, rotated rects, triangles, text
+    boxes, bitmaps), "ellipse" ((cx, cy, rx, ry)) or "segment" ((x0, y0, x1, y1)).
+    Rects and ovals span x..x+w like their canvas items; rotated rects use the
+    same corners as the rotated canvas polygon, not their unrotated bbox.
+    """
+    etype = el.type
+    x, y, w, h = el.x, el.y, el.w, el.h
+    if etype == "line":
+        return (min(x, x + w), min(y, y + h), max(x, x + w), max(y, y + h)), "segment", (x, y, x + w, y + h)
+    if etype == "circle":
+        return (x, y, x + w, y + h), "ellipse", (x + w / 2, y + h / 2, w / 2, h / 2)
+    if etype == "triangle":
+        pts = tuple(el.points)
+    elif etype == "text":
+        if not (w and h):
+            w, h = text_size(el.text or " ", el.size)
+        pts = ((x, y), (x + w, y), (x + w, y + h), (x, y + h))
+    elif el.rotation % 360:
+        cx, cy = x + w / 2, y + h / 2
+        rad = math.radians(el.rotation)
+        cos, sin = math.cos(rad), math.sin(rad)
+        pts = tuple((cx + dx * cos - dy * sin, cy + dx * sin + dy * cos)
+                    for dx, dy in ((-w / 2, -h / 2), (w / 2, -h / 2), (w / 2, h / 2), (-w / 2, h / 2)))
+    else:
+        pts = ((x, y), (x + w, y), (x + w, y + h), (x, y + h))
+    xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+    return (min(xs), min(ys), max(xs), max(ys)), "poly", pts
+
+
+def _segment_distance(ax, ay, bx, by, px, py):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = 0 if not length2 else max(0, min(1, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def _shape_contains(kind, data, px, py, tolerance):
+    """Point test against a footprint; the caller has already checked the (padded) bbox."""
+    if kind == "segment":
+        return _segment_distance(*data, px, py) <= max(tolerance, 0.5)
+    if kind == "ellipse":
+        cx, cy, rx, ry = data
+        rx, ry = rx + tolerance, ry + tolerance
+        if not (rx and ry):
+            return True  # zero-size circle: the bbox test is exact
+        return ((px - cx) / rx) ** 2 + ((py - cy) / ry) ** 2 <= 1
+    n = len(data)
+    sign = 0
+    for i in range(n):
+        (ax, ay), (bx, by) = data[i - 1], data[i]
+        cross = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+        if cross:
+            if sign and (cross > 0) != (sign > 0):
+                break
+            sign = cross
+    else:
+        return True
+    return tolerance > 0 and min(_segment_distance(*data[i - 1], *data[i], px, py) for i in range(n)) <= tolerance
+
+
+def _shape_intersects(kind, data, x0, y0, x1, y1):
+    """Does a footprint touch the rectangle x0..x1, y0..y1? (Bboxes already overlap.)"""
+    if kind == "ellipse":
+        cx, cy, rx, ry = data
+        if not (rx and ry):
+            return True
+        nx, ny = min(max(cx, x0), x1), min(max(cy, y0), y1)
+        return ((nx - cx) / rx) ** 2 + ((ny - cy) / ry) ** 2 <= 1
+    pts = ((data[0], data[1]), (data[2], data[3])) if kind == "segment" else data
+    corners = ((x0, y0), (x1, y0), (x1, y1), (x0, y1))
+    # Separating axis test; the rectangle's own axes are covered by the bbox overlap.
+    for i in range(len(pts)):
+        (ax, ay), (bx, by) = pts[i - 1], pts[i]
+        nx, ny = ay - by, bx - ax
+        if not (nx or ny):
+            continue
+        shape = [nx * px + ny * py for px, py in pts]
+        box = [nx * px + ny * py for px, py in corners]
+        if max(shape) < min(box) or max(box) < min(shape):
+            return False
+    return True
+
+
+class SpatialIndex:
+    """Uniform-grid index over element footprints, keyed by element (scene) id.
+
+    insert()/update()/remove() keep it in step with the model, touching only
+    the grid cells an element enters or leaves. at() answers point queries
+    (topmost hit first, by insertion order like canvas stacking), query()
+    answers marquee rectangles and nearest_handle() the selection handles.
+    Everything is in display coordinates and pure Python, so it works headless
+    and never round-trips through Tcl.
+    """
+    MAX_CELLS = 256  # elements spanning more cells than this are kept in a short "large" list
+
+    def __init__(self, cell_size=32):
+        self.cell_size = cell_size
+        self._cells = {}     # (cx, cy) -> set of ids
+        self._large = set()  # ids too big to be worth gridding
+        self._shapes = {}    # id -> (bbox, kind, data)
+        self._spans = {}     # id -> (cx0, cy0, cx1, cy1), or None for large ids
+        self._z = {}         # id -> stacking order
+        self._next_z = 0
+        self.handles = []    # selection handle positions [(x, y), ...]
+
+    @classmethod
+    def from_elements(cls, elements, cell_size=32):
+        """Index elements (Elements, ElementViews or a Scene) in draw order."""
+        index = cls(cell_size)
+        for el in elements:
+            index.insert(el.id, el)
+        return index
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __contains__(self, element_id):
+        return element_id in self._shapes
+
+    def insert(self, element_id, el):
+        """Add element_id on top of the stacking order (or refresh it if already indexed)."""
+        if element_id in self._shapes:
+            self.update(element_id, el)
+            return
+        self._z[element_id] = self._next_z
+        self._next_z += 1
+        self._place(element_id, footprint(el), None)
+
+    def update(self, element_id, el):
+        """Re-index element_id after it moved, resized or rotated."""
+        if element_id not in self._shapes:
+            self.insert(element_id, el)
+            return
+        self._place(element_id, footprint(el), self._spans.get(element_id, None))
+
+    def reorder(self, ids):
+        """Put the given ids at the bottom of the stacking order, in that order (like Scene.reorder)."""
+        ids = [i for i in ids if i in self._z]
+        first = set(ids)
+        rest = sorted((i for i in self._z if i not in first), key=self._z.__getitem__)
+        self._z = {element_id: z for z, element_id in enumerate([*ids, *rest])}
+        self._next_z = len(self._z)
+
+    def remove(self, element_id):
+        self._shapes.pop(element_id, None)
+        self._z.pop(element_id, None)
+        self._unplace(element_id, self._spans.pop(element_id, None))
+
+    def clear(self):
+        self._cells.clear()
+        self._large.clear()
+        self._shapes.clear()
+        self._spans.clear()
+        self._z.clear()
+        self.handles = []
+
+    def _span(self, bbox):
+        cs = self.cell_size
+        span = (int(bbox[0] // cs), int(bbox[1] // cs), int(bbox[2] // cs), int(bbox[3] // cs))
+        if (span[2] - span[0] + 1) * (span[3] - span[1] + 1) > self.MAX_CELLS:
+            return None
+        return span
+
+    def _place(self, element_id, shape, old):
+        self._shapes[element_id] = shape
+        span = self._span(shape[0])
+        if element_id in self._spans and span == old:
+            return  # still in the same cells: only the shape changed
+        self._unplace(element_id, old)
+        self._spans[element_id] = span
+        if span is None:
+            self._large.add(element_id)
+            return
+        cells = self._cells
+        for cx in range(span[0], span[2] + 1):
+            for cy in range(span[1], span[3] + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    cells[cx, cy] = {element_id}
+                else:
+                    bucket.add(element_id)
+
+    def _unplace(self, element_id, span):
+        if span is None:
+            self._large.discard(element_id)
+            return
+        cells = self._cells
+        for cx in range(span[0], span[2] + 1):
+            for cy in range(span[1], span[3] + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(element_id)
+                    if not bucket:
+                        del cells[cx, cy]
+
+    def _candidates(self, x0, y0, x1, y1):
+        cs = self.cell_size
+        cx0, cy0, cx1, cy1 = int(x0 // cs), int(y0 // cs), int(x1 // cs), int(y1 // cs)
+        found = set(self._large)
+        cells = self._cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            # Marquee larger than the occupied grid: walk the occupied cells instead.
+            for (cx, cy), bucket in cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found |= bucket
+            return found
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found |= bucket
+        return found
+
+    # ---- queries ----
+    def hits(self, px, py, tolerance=0):
+        """Ids whose footprint contains (px, py), topmost first."""
+        shapes = self._shapes
+        hits = []
+        for eid in self._candidates(px - tolerance, py - tolerance, px + tolerance, py + tolerance):
+            (bx0, by0, bx1, by1), kind, data = shapes[eid]
+            if bx0 - tolerance <= px <= bx1 + tolerance and by0 - tolerance <= py <= by1 + tolerance \
+                    and _shape_contains(kind, data, px, py, tolerance):
+                hits.append(eid)
+        hits.sort(key=self._z.__getitem__, reverse=True)
+        return hits
+
+    def at(self, px, py, tolerance=0):
+        """Topmost id at (px, py), or None."""
+        hits = self.hits(px, py, tolerance)
+        return hits[0] if hits else None
+
+    def query(self, x0, y0, x1, y1, contained=False):
+        """Ids touching (or, with contained=True, fully inside) a marquee, in stacking order."""
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        shapes = self._shapes
+        found = []
+        for eid in self._candidates(x0, y0, x1, y1):
+            (bx0, by0, bx1, by1), kind, data = shapes[eid]
+            if contained:
+                if x0 <= bx0 and bx1 <= x1 and y0 <= by0 and by1 <= y1:
+                    found.append(eid)
+            elif bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1 and _shape_intersects(kind, data, x0, y0, x1, y1):
+                found.append(eid)
+        found.sort(key=self._z.__getitem__)
+        return found
+
+    def set_handles(self, points):
+        """Positions of the current selection's handles (empty list when nothing is selected)."""
+        self.handles = list(points)
+
+    def nearest_handle(self, px, py, reach=4):
+        """Index into handles of the closest handle within reach (Chebyshev distance), or None."""
+        best, best_d = None, None
+        for i, (hx, hy) in enumerate(self.handles):
+            d = max(abs(px - hx), abs(py - hy))
+            if d <= reach and (best_d is None or d < best_d):
+                best, best_d = i, d
+        return best
+
 
 # ----------------- Utility Functions -----------------
-# For now, we'll keep only pure data/math utils here.
-# The geometry and code generation logic will stay in app.py as they depend on the canvas/Tkinter context.
\ No newline at end of file
+# Only Tk-free model, geometry and raster code lives here; code generation is in
+# codegen.py/backends.py and sketch parsing in parser.py, and app.py imports them.
+
+# ----------------- Framebuffer rasterizer -----------------
+# Headless, pixel-accurate rendering of the Element model. The primitives follow
+# Adafruit_GFX (drawFastHLine/VLine, drawRect, the midpoint drawCircle and the
+# vertical-span fillCircleHelper), so what ends up in the buffer is what the
+# display shows, not Tk's anti-aliased shapes.
+
+BLACK = 0
+WHITE = 1            # 1bpp "on" pixel (SSD1306 WHITE / SSD1306_WHITE)
+RGB565_WHITE = 0xFFFF
+
+
+def rgb565(r, g, b):
+    """Pack 8-bit r, g, b into a 16-bit RGB565 value."""
+    return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+
+
+def mode_for_display(display_name):
+    """Framebuffer mode for a DISPLAY_PRESETS name: "rgb565" for TFTs, "mono" otherwise."""
+    return "rgb565" if display_name and display_name.startswith("TFT") else "mono"
+
+
+@lru_cache(maxsize=512)
+def _circle_outline(r):
+    """Pixel offsets (dx, dy) plotted by Adafruit_GFX::drawCircle for radius r."""
+    xs = [0, 0, r, -r]
+    ys = [r, -r, 0, 0]
+    f = 1 - r
+    ddf_x = 1
+    ddf_y = -2 * r
+    x, y = 0, r
+    while x < y:
+        if f >= 0:
+            y -= 1
+            ddf_y += 2
+            f += ddf_y
+        x += 1
+        ddf_x += 2
+        f += ddf_x
+        xs += [x, -x, x, -x, y, -y, y, -y]
+        ys += [y, y, -y, -y, x, x, -x, -x]
+    return np.array(xs, dtype=np.int32), np.array(ys, dtype=np.int32)
+
+
+@lru_cache(maxsize=512)
+def _circle_helper_points(r, corner):
+    """Pixel offsets (dx, dy) of Adafruit_GFX::drawCircleHelper (quarter arcs, corner bitmask)."""
+    xs, ys = [], []
+    f = 1 - r
+    ddf_x = 1
+    ddf_y = -2 * r
+    x, y = 0, r
+    while x < y:
+        if f >= 0:
+            y -= 1
+            ddf_y += 2
+            f += ddf_y
+        x += 1
+        ddf_x += 2
+        f += ddf_x
+        if corner & 0x4:
+            xs += [x, y]; ys += [y, x]
+        if corner & 0x2:
+            xs += [x, y]; ys += [-y, -x]
+        if corner & 0x8:
+            xs += [-y, -x]; ys += [x, y]
+        if corner & 0x1:
+            xs += [-y, -x]; ys += [-x, -y]
+    return np.array(xs, dtype=np.int32), np.array(ys, dtype=np.int32)
+
+
+@lru_cache(maxsize=1024)
+def _fill_helper_spans(r, corners, delta):
+    """Vertical spans (dx, dy, length) of Adafruit_GFX::fillCircleHelper."""
+    dxs, dys, lens = [], [], []
+    f = 1 - r
+    ddf_x = 1
+    ddf_y = -2 * r
+    x, y = 0, r
+    px, py = x, y
+    delta += 1  # Avoid some +1's in the loop, as the original does
+    while x < y:
+        if f >= 0:
+            y -= 1
+            ddf_y += 2
+            f += ddf_y
+        x += 1
+        ddf_x += 2
+        f += ddf_x
+        if x < y + 1:
+            if corners & 1:
+                dxs.append(x); dys.append(-y); lens.append(2 * y + delta)
+            if corners & 2:
+                dxs.append(-x); dys.append(-y); lens.append(2 * y + delta)
+        if y != py:
+            if corners & 1:
+                dxs.append(py); dys.append(-px); lens.append(2 * px + delta)
+            if corners & 2:
+                dxs.append(-py); dys.append(-px); lens.append(2 * px + delta)
+            py = y
+        px = x
+    return (np.array(dxs, dtype=np.int32), np.array(dys, dtype=np.int32),
+            np.array(lens, dtype=np.int32))
+
+
+@lru_cache(maxsize=512)
+def _circle_fill_spans(r):
+    """Vertical spans (dx, dy, length) drawn by Adafruit_GFX::fillCircle for radius r."""
+    dx, dy, lens = _fill_helper_spans(r, 3, 0)
+    return (np.concatenate([[0], dx]).astype(np.int32), np.concatenate([[-r], dy]).astype(np.int32),
+            np.concatenate([[2 * r + 1], lens]).astype(np.int32))
+
+
+def _cdiv(a, b):
+    """C integer division (truncates toward zero), as used by Adafruit_GFX."""
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b >= 0) else -q
+
+
+def _cover_spans(mask, lines, starts, lengths):
+    """OR spans into mask rows: row lines[i] gets [starts[i], starts[i] + lengths[i]).
+
+    Spans are clipped like the SSD1306 driver does (zero or negative lengths draw
+    nothing) and filled with one bincount/cumsum pass instead of a Python loop.
+    Pass mask.T to fill vertical spans.
+    """
+    rows, cols = mask.shape
+    lines = np.asarray(lines, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = starts + np.asarray(lengths, dtype=np.int64)
+    keep = (ends > starts) & (lines >= 0) & (lines < rows) & (ends > 0) & (starts < cols)
+    if not keep.any():
+        return
+    lines = lines[keep]
+    base = lines * (cols + 1)
+    size = rows * (cols + 1)
+    diff = (np.bincount(base + np.clip(starts[keep], 0, cols), minlength=size)
+            - np.bincount(base + np.clip(ends[keep], 0, cols), minlength=size))
+    mask |= np.cumsum(diff.reshape(rows, cols + 1), axis=1)[:, :cols] > 0
+
+
+def _cover_boxes(mask, x, y, w, h):
+    """OR filled rectangles into mask with one 2-D difference array (fillRect clipping)."""
+    rows, cols = mask.shape
+    x0, y0 = np.clip(x, 0, cols), np.clip(y, 0, rows)
+    x1, y1 = np.clip(x + w, 0, cols), np.clip(y + h, 0, rows)
+    keep = (w > 0) & (h > 0) & (x0 < x1) & (y0 < y1)
+    if not keep.any():
+        return
+    x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+    stride = cols + 1
+    size = (rows + 1) * stride
+    diff = (np.bincount(y0 * stride + x0, minlength=size) - np.bincount(y0 * stride + x1, minlength=size)
+            - np.bincount(y1 * stride + x0, minlength=size) + np.bincount(y1 * stride + x1, minlength=size))
+    cover = np.cumsum(np.cumsum(diff.reshape(rows + 1, stride), axis=0), axis=1)
+    mask |= cover[:rows, :cols] > 0
+
+
+def _cover_points(mask, xs, ys):
+    """Set the in-bounds (xs, ys) pixels of mask."""
+    rows, cols = mask.shape
+    keep = (xs >= 0) & (xs < cols) & (ys >= 0) & (ys < rows)
+    # bincount over the flat index beats fancy-index assignment for large point sets
+    mask |= np.bincount(ys[keep] * cols + xs[keep], minlength=rows * cols).reshape(rows, cols) > 0
+
+
+def _columns(elements, names):
+    """int64 arrays of the named Element attributes, one per name."""
+    table = np.array(list(map(attrgetter(*names), elements)), dtype=np.int64).reshape(-1, len(names))
+    return tuple(table.T)
+
+
+def _element_table(elements):
+    """Column arrays (kind, x, y, w, h, fill, radius) for a Scene or an iterable of Elements.
+
+    Also returns the round rects, lines, triangles, text and bitmaps as a list,
+    since those are drawn one by one.
+    """
+    if isinstance(elements, Scene):
+        cols = elements.columns()
+        kind, fill = cols["kind"], cols["fill"]
+        x, y, w, h, radius = (cols[k].astype(np.int64) for k in ("x", "y", "w", "h", "radius"))
+        rare = _rare_mask(kind, radius)
+        return kind, x, y, w, h, fill, radius, [elements[int(i)] for i in cols["ids"][rare]]
+    elements = list(elements)
+    kind = np.array([_TYPE_CODE[el.type] for el in elements], dtype=np.uint8)
+    x, y, w, h, fill, radius = _columns(elements, ("x", "y", "w", "h", "fill", "radius"))
+    rare = _rare_mask(kind, radius)
+    return kind, x, y, w, h, fill.astype(bool), radius, [elements[i] for i in np.flatnonzero(rare)]
+
+
+def _rare_mask(kind, radius):
+    return ((kind == _TYPE_CODE["line"]) | (kind == _TYPE_CODE["triangle"]) | (kind == _TYPE_CODE["text"])
+            | (kind == _TYPE_CODE["bitmap"]) | ((kind == _TYPE_CODE["rect"]) & (radius != 0)))
+
+
+def _expand_offsets(cx, cy, radii, table):
+    """Place the per-radius offset table of every shape at its centre.
+
+    table(r) returns (dx, dy, *extra); the result is (xs, ys, *extra) with one
+    entry per plotted offset of every shape. Shapes are grouped by radius so
+    each group is a single broadcast add.
+    """
+    order = np.argsort(radii, kind="stable")
+    cx, cy, radii = cx[order], cy[order], radii[order]
+    bounds = np.flatnonzero(np.diff(radii)) + 1
+    out = None
+    for lo, hi in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [radii.size]])):
+        dx, dy, *extra = table(int(radii[lo]))
+        n = hi - lo
+        cols = [(cx[lo:hi, None] + dx).ravel(), (cy[lo:hi, None] + dy).ravel()]
+        cols += [np.tile(e, n) for e in extra]
+        if out is None:
+            out = [[c] for c in cols]
+        else:
+            for acc, c in zip(out, cols):
+                acc.append(c)
+    return [np.concatenate(acc) for acc in out]
+
+
+# ----------------- Fonts: Adafruit GFX text -----------------
+_GFX_NUMBER = re.compile(r"0[xX][0-9A-Fa-f]+|-?\d+")
+
+
+class GFXFont:
+    """An Adafruit GFX font as a glyph atlas: code -> (mask, x_offset, y_offset, x_advance).
+
+    masks are read-only bool arrays at size 1. The classic built-in font
+    (CLASSIC_FONT) has fixed 6x8 cells (5x7 glyph, spacing column, descender
+    row) drawn down from the cursor; GFXfont tables (from_header()) are
+    proportional and drawn from the baseline, like Adafruit_GFX::drawChar().
+    """
+    def __init__(self, name, glyphs, y_advance, first, last, classic=False):
+        self.name = name
+        self.glyphs = glyphs        # code - first -> (mask, x_offset, y_offset, x_advance)
+        self.y_advance = y_advance  # newline height at size 1
+        self.first = first
+        self.last = last
+        self.classic = classic
+        self._missing = (self.blank(6, 8) if classic else self.blank(0, 0), 0, 0, 6 if classic else 0)
+
+    def __repr__(self):
+        return f"GFXFont({self.name!r}, {self.first:#04x}-{self.last:#04x})"
+
+    @staticmethod
+    def blank(w, h):
+        mask = np.zeros((h, w), dtype=bool)
+        mask.flags.writeable = False
+        return mask
+
+    @classmethod
+    def from_glcdfont(cls, data=GLCDFONT, first=GLCDFONT_FIRST, name="classic"):
+        """The classic font from glcdfont.c-style column bytes (5 per character, LSB = top row)."""
+        columns = np.frombuffer(bytes(data), dtype=np.uint8).reshape(-1, 5)
+        cells = np.zeros((len(columns), 8, 6), dtype=bool)
+        cells[:, :, :5] = np.unpackbits(columns[:, :, None], axis=2, bitorder="little").transpose(0, 2, 1)
+        cells.flags.writeable = False
+        font = cls(name, [(cell, 0, 0, 6) for cell in cells], 8, first, first + len(cells) - 1, classic=True)
+        font.atlas = cells  # (chars, 8, 6): whole strings are one fancy-index
+        return font
+
+    @classmethod
+    def from_header(cls, source, name=None):
+        """Parse a fontconvert header (FreeSans9pt7b.h and the like): the Bitmaps, Glyphs and GFXfont tables."""
+        bitmaps = re.search(r"uint8_t\s+(\w*)Bitmaps\s*\[\s*\]\s*(?:PROGMEM)?\s*=\s*\{(.*?)\}", source, re.S)
+        glyphs = re.search(r"GFXglyph\s+\w*Glyphs\s*\[\s*\]\s*(?:PROGMEM)?\s*=\s*\{(.*)\}\s*;", source, re.S)
+        font = re.search(r"GFXfont\s+(\w+)\s*(?:PROGMEM)?\s*=\s*\{(.*?)\}\s*;", source, re.S)
+        if not (bitmaps and glyphs and font):
+            raise ValueError("Not a GFXfont header (expected ...Bitmaps[], ...Glyphs[] and a GFXfont)")
+        strip = lambda text: re.sub(r"//[^\n]*|/\*.*?\*/", "", text, flags=re.S)  # noqa: E731
+        data = bytes(int(v, 0) for v in _GFX_NUMBER.findall(strip(bitmaps.group(2))))
+        table = [[int(v, 0) for v in _GFX_NUMBER.findall(entry)]
+                 for entry in re.findall(r"\{([^{}]*)\}", strip(glyphs.group(1)))]
+        first, last, y_advance = (int(v, 0) for v in _GFX_NUMBER.findall(strip(font.group(2)))[-3:])
+        if len(table) != last - first + 1 or any(len(row) != 6 for row in table):
+            raise ValueError(f"GFXfont {font.group(1)}: glyph table does not match {first:#04x}-{last:#04x}")
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8)).astype(bool)
+        atlas = []
+        for offset, w, h, x_advance, x_offset, y_offset in table:
+            # glyph bitmaps are packed MSB first, rows not padded to whole bytes
+            mask = bits[8 * offset:8 * offset + w * h]
+            if mask.size != w * h:
+                raise ValueError(f"GFXfont {font.group(1)}: glyph bitmap past the end of the table")
+            mask = mask.reshape(h, w).copy()
+            mask.flags.writeable = False
+            atlas.append((mask, x_offset, y_offset, x_advance))
+        return cls(name or font.group(1), atlas, y_advance, first, last)
+
+    def glyph(self, code):
+        if self.first <= code <= self.last:
+            return self.glyphs[code - self.first]
+        return self._missing
+
+
+CLASSIC_FONT = GFXFont.from_glcdfont()
+
+
+def load_gfxfont(path):
+    """GFXFont from a fontconvert .h file."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return GFXFont.from_header(f.read())
+
+
+@lru_cache(maxsize=2048)
+def text_runs(text, x, y, size=1, font=None, wrap_width=None):
+    """Where print(text) with the cursor at (x, y) draws: ((x, y, run), ...).
+
+    Follows Adafruit_GFX::write(): "\\n" returns to x = 0 one line down, "\\r" is
+    ignored and, with wrap_width (setTextWrap(true) on a display that wide),
+    a glyph that would cross the right edge starts a new line at x = 0.
+    """
+    font = font or CLASSIC_FONT
+    line_height = size * font.y_advance
+    runs, start, run = [], (x, y), []
+    for ch in text:
+        if ch == "\n" or ch == "\r":
+            if ch == "\n":
+                if run:
+                    runs.append((*start, "".join(run)))
+                run, x, y = [], 0, y + line_height
+                start = (x, y)
+            continue
+        mask, x_offset, _, x_advance = font.glyph(ord(ch))
+        if wrap_width is not None and mask.size and x + size * (x_offset + mask.shape[1]) > wrap_width:
+            if run:
+                runs.append((*start, "".join(run)))
+            run, x, y = [], 0, y + line_height
+            start = (x, y)
+        run.append(ch)
+        x += size * x_advance
+    if run:
+        runs.append((*start, "".join(run)))
+    return tuple(runs)
+
+
+@lru_cache(maxsize=2048)
+def text_mask(run, size=1, font=None):
+    """(mask, dx, dy): pixels of one unwrapped run of glyphs, the mask's top-left at cursor + (dx, dy).
+
+    Masks are cached and read-only, so labels drawn over and over cost one lookup.
+    """
+    font = font or CLASSIC_FONT
+    if not run:
+        return GFXFont.blank(0, 0), 0, 0
+    if font.classic:
+        codes = np.array([ord(c) - font.first for c in run])
+        known = (codes >= 0) & (codes < len(font.atlas))
+        cells = np.zeros((len(run), 8, 6), dtype=bool)
+        cells[known] = font.atlas[codes[known]]
+        mask, dx, dy = cells.transpose(1, 0, 2).reshape(8, 6 * len(run)), 0, 0
+    else:
+        placed, pen = [], 0
+        for ch in run:
+            glyph, x_offset, y_offset, x_advance = font.glyph(ord(ch))
+            if glyph.size:
+                placed.append((glyph, pen + x_offset, y_offset))
+            pen += x_advance
+        if not placed:
+            return GFXFont.blank(0, 0), 0, 0
+        dx = min(gx for _, gx, _ in placed)
+        dy = min(gy for _, _, gy in placed)
+        width = max(gx + g.shape[1] for g, gx, _ in placed) - dx
+        height = max(gy + g.shape[0] for g, _, gy in placed) - dy
+        mask = np.zeros((height, width), dtype=bool)
+        for glyph, gx, gy in placed:
+            mask[gy - dy:gy - dy + glyph.shape[0], gx - dx:gx - dx + glyph.shape[1]] |= glyph
+    if size > 1:
+        # setTextSize(n): every font pixel becomes an n x n fillRect
+        mask = mask.repeat(size, axis=0).repeat(size, axis=1)
+    mask.flags.writeable = False
+    return mask, dx * size, dy * size
+
+
+def _runs_box(runs, size, font):
+    """Union (x0, y0, x1, y1) of the glyph masks of text_runs() output, or None."""
+    boxes = []
+    for rx, ry, run in runs:
+        mask, dx, dy = text_mask(run, size, font)
+        if mask.size:
+            boxes.append((rx + dx, ry + dy, rx + dx + mask.shape[1], ry + dy + mask.shape[0]))
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+@lru_cache(maxsize=2048)
+def text_bounds(text, size=1, font=None):
+    """(x0, y0, x1, y1), end-exclusive, of print(text) with the cursor at (0, 0) and no wrapping.
+
+    The classic font measures whole 6x8 cells (like getTextBounds()), GFXfont
+    tables the glyph bitmaps. Empty text is (0, 0, 0, 0).
+    """
+    return _runs_box(text_runs(text, 0, 0, size, font), size, font) or (0, 0, 0, 0)
+
+
+def text_size(text, size=1, font=None):
+    """(w, h) of print(text) without wrapping."""
+    x0, y0, x1, y1 = text_bounds(text, size, font)
+    return x1 - x0, y1 - y0
+
+
+class Framebuffer:
+    """NumPy-backed display memory: 1bpp ("mono") for OLEDs, RGB565 for TFTs.
+
+    pixels is a (height, width) array, uint8 0/1 in mono mode and uint16 RGB565
+    otherwise. The draw_* / fill_* methods mirror the Adafruit_GFX calls of the
+    same name, including clipping.
+    """
+    def __init__(self, width, height, mode="mono"):
+        if mode not in ("mono", "rgb565"):
+            raise ValueError(f"Unknown framebuffer mode: {mode}")
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.pixels = np.zeros((height, width), dtype=np.uint8 if mode == "mono" else np.uint16)
+
+    @property
+    def foreground(self):
+        """Default "WHITE" for this mode."""
+        return WHITE if self.mode == "mono" else RGB565_WHITE
+
+    def clear(self, color=BLACK):
+        self.pixels.fill(color)
+
+    def draw_pixel(self, x, y, color=None):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = self.foreground if color is None else color
+
+    def draw_fast_hline(self, x, y, w, color=None):
+        if w <= 0 or not 0 <= y < self.height:
+            return
+        x1 = min(x + w, self.width)
+        x = max(x, 0)
+        if x < x1:
+            self.pixels[y, x:x1] = self.foreground if color is None else color
+
+    def draw_fast_vline(self, x, y, h, color=None):
+        if h <= 0 or not 0 <= x < self.width:
+            return
+        y1 = min(y + h, self.height)
+        y = max(y, 0)
+        if y < y1:
+            self.pixels[y:y1, x] = self.foreground if color is None else color
+
+    def fill_rect(self, x, y, w, h, color=None):
+        if w <= 0 or h <= 0:
+            return
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        if x0 < x1 and y0 < y1:
+            self.pixels[y0:y1, x0:x1] = self.foreground if color is None else color
+
+    def draw_rect(self, x, y, w, h, color=None):
+        self.draw_fast_hline(x, y, w, color)
+        self.draw_fast_hline(x, y + h - 1, w, color)
+        self.draw_fast_vline(x, y, h, color)
+        self.draw_fast_vline(x + w - 1, y, h, color)
+
+    def draw_circle(self, x0, y0, r, color=None):
+        mask = np.zeros(self.pixels.shape, dtype=bool)
+        dx, dy = _circle_outline(r)
+        _cover_points(mask, x0 + dx, y0 + dy)
+        self.pixels[mask] = self.foreground if color is None else color
+
+    def fill_circle(self, x0, y0, r, color=None):
+        mask = np.zeros(self.pixels.shape, dtype=bool)
+        dx, dy, lens = _circle_fill_spans(r)
+        _cover_spans(mask.T, x0 + dx, y0 + dy, lens)
+        self.pixels[mask] = self.foreground if color is None else color
+
+    def draw_line(self, x0, y0, x1, y1, color=None):
+        """Bresenham line, same stepping as Adafruit_GFX::writeLine."""
+        if x0 == x1:
+            y0, y1 = min(y0, y1), max(y0, y1)
+            self.draw_fast_vline(x0, y0, y1 - y0 + 1, color)
+            return
+        if y0 == y1:
+            x0, x1 = min(x0, x1), max(x0, x1)
+            self.draw_fast_hline(x0, y0, x1 - x0 + 1, color)
+            return
+        steep = abs(y1 - y0) > abs(x1 - x0)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if x0 > x1:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+        dx = x1 - x0
+        dy = abs(y1 - y0)
+        err = dx // 2
+        ystep = 1 if y0 < y1 else -1
+        for x in range(x0, x1 + 1):
+            if steep:
+                self.draw_pixel(y0, x, color)
+            else:
+                self.draw_pixel(x, y0, color)
+            err -= dy
+            if err < 0:
+                y0 += ystep
+                err += dx
+
+    def draw_round_rect(self, x, y, w, h, r, color=None):
+        r = min(r, _cdiv(min(w, h), 2))
+        self.draw_fast_hline(x + r, y, w - 2 * r, color)
+        self.draw_fast_hline(x + r, y + h - 1, w - 2 * r, color)
+        self.draw_fast_vline(x, y + r, h - 2 * r, color)
+        self.draw_fast_vline(x + w - 1, y + r, h - 2 * r, color)
+        mask = np.zeros(self.pixels.shape, dtype=bool)
+        for cx, cy, corner in ((x + r, y + r, 1), (x + w - r - 1, y + r, 2),
+                               (x + w - r - 1, y + h - r - 1, 4), (x + r, y + h - r - 1, 8)):
+            dx, dy = _circle_helper_points(r, corner)
+            _cover_points(mask, cx + dx, cy + dy)
+        self.pixels[mask] = self.foreground if color is None else color
+
+    def fill_round_rect(self, x, y, w, h, r, color=None):
+        r = min(r, _cdiv(min(w, h), 2))
+        self.fill_rect(x + r, y, w - 2 * r, h, color)
+        mask = np.zeros(self.pixels.shape, dtype=bool)
+        for cx, corners in ((x + w - r - 1, 1), (x + r, 2)):
+            dx, dy, lens = _fill_helper_spans(r, corners, h - 2 * r - 1)
+            _cover_spans(mask.T, cx + dx, y + r + dy, lens)
+        self.pixels[mask] = self.foreground if color is None else color
+
+    def draw_triangle(self, x0, y0, x1, y1, x2, y2, color=None):
+        self.draw_line(x0, y0, x1, y1, color)
+        self.draw_line(x1, y1, x2, y2, color)
+        self.draw_line(x2, y2, x0, y0, color)
+
+    def fill_triangle(self, x0, y0, x1, y1, x2, y2, color=None):
+        """Scanline fill with the same edge stepping as Adafruit_GFX::fillTriangle."""
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        if y1 > y2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        if y0 == y2:
+            a, b = min(x0, x1, x2), max(x0, x1, x2)
+            self.draw_fast_hline(a, y0, b - a + 1, color)
+            return
+        dx01, dy01 = x1 - x0, y1 - y0
+        dx02, dy02 = x2 - x0, y2 - y0
+        dx12, dy12 = x2 - x1, y2 - y1
+        sa = sb = 0
+        last = y1 if y1 == y2 else y1 - 1
+        y = y0
+        while y <= last:
+            a = x0 + _cdiv(sa, dy01)
+            b = x0 + _cdiv(sb, dy02)
+            sa += dx01
+            sb += dx02
+            if a > b:
+                a, b = b, a
+            self.draw_fast_hline(a, y, b - a + 1, color)
+            y += 1
+        sa = dx12 * (y - y1)
+        sb = dx02 * (y - y0)
+        while y <= y2:
+            a = x1 + _cdiv(sa, dy12)
+            b = x0 + _cdiv(sb, dy02)
+            sa += dx12
+            sb += dx02
+            if a > b:
+                a, b = b, a
+            self.draw_fast_hline(a, y, b - a + 1, color)
+            y += 1
+
+    def draw_element(self, el, color=None):
+        """Draw one Element with the Adafruit_GFX call the generated code uses for it."""
+        if el.type == "rect":
+            if el.radius:
+                (self.fill_round_rect if el.fill else self.draw_round_rect)(el.x, el.y, el.w, el.h, el.radius, color)
+            else:
+                (self.fill_rect if el.fill else self.draw_rect)(el.x, el.y, el.w, el.h, color)
+        elif el.type == "circle":
+            (self.fill_circle if el.fill else self.draw_circle)(el.x + el.w // 2, el.y + el.h // 2, el.w // 2, color)
+        elif el.type == "line":
+            self.draw_line(el.x, el.y, el.x + el.w, el.y + el.h, color)
+        elif el.type == "triangle":
+            (x0, y0), (x1, y1), (x2, y2) = el.points
+            (self.fill_triangle if el.fill else self.draw_triangle)(x0, y0, x1, y1, x2, y2, color)
+        elif el.type == "text":
+            self.draw_text(el.x, el.y, el.text, el.size, color)
+        elif el.type == "bitmap":
+            try:
+                pixels = load_source(el.text)
+            except (OSError, ValueError):
+                self.draw_rect(el.x, el.y, el.w, el.h, color)  # asset gone: show where it was
+            else:
+                self.draw_bitmap(el.x, el.y, pixels[:el.h, :el.w], color)
+
+    def draw_bitmap(self, x, y, pixels, color=None):
+        """drawBitmap() for a bool mask (set bits only); drawRGBBitmap() for uint16 RGB565 (opaque).
+
+        RGB565 on a mono buffer lights every pixel that is not black.
+        """
+        h, w = pixels.shape
+        cx0, cy0 = max(x, 0), max(y, 0)
+        cx1, cy1 = min(x + w, self.width), min(y + h, self.height)
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        src = pixels[cy0 - y:cy1 - y, cx0 - x:cx1 - x]
+        dst = self.pixels[cy0:cy1, cx0:cx1]
+        if src.dtype == bool:
+            dst[src] = self.foreground if color is None else color
+        elif self.mode == "mono" or color is not None:
+            dst[...] = np.where(src != 0, self.foreground if color is None else color, 0)
+        else:
+            dst[...] = src
+
+    def draw_text(self, x, y, text, size=1, color=None, font=None, wrap=True):
+        """setCursor(x, y); print(text) in the classic font (or font), with setTextWrap(wrap)."""
+        color = self.foreground if color is None else color
+        for rx, ry, run in text_runs(text, x, y, size, font, self.width if wrap else None):
+            mask, dx, dy = text_mask(run, size, font)
+            x0, y0 = rx + dx, ry + dy
+            # clip to the screen like drawPixel()/fillRect() do
+            cx0, cy0 = max(x0, 0), max(y0, 0)
+            cx1, cy1 = min(x0 + mask.shape[1], self.width), min(y0 + mask.shape[0], self.height)
+            if cx0 < cx1 and cy0 < cy1:
+                self.pixels[cy0:cy1, cx0:cx1][mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]] = color
+
+    def to_rgb888(self, box=None):
+        """(height, width, 3) uint8 image of the buffer (or of box = (x0, y0, x1, y1)), e.g. for previews."""
+        pixels = self.pixels if box is None else self.pixels[box[1]:box[3], box[0]:box[2]]
+        if self.mode == "mono":
+            return np.repeat((pixels * 255).astype(np.uint8)[:, :, None], 3, axis=2)
+        p = pixels.astype(np.uint32)
+        r = (p >> 11) & 0x1F
+        g = (p >> 5) & 0x3F
+        b = p & 0x1F
+        return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=2).astype(np.uint8)
+
+    def packed(self):
+        """1bpp bytes, rows MSB-first and padded to whole bytes (drawBitmap layout)."""
+        return np.packbits(self.pixels != 0, axis=1).tobytes()
+
+    def pages(self):
+        """1bpp bytes in SSD1306 page order: one byte per column per 8-row page, LSB = top row."""
+        pages = -(-self.height // 8)
+        bits = np.zeros((pages * 8, self.width), dtype=np.uint8)
+        bits[:self.height] = self.pixels != 0
+        weights = (1 << np.arange(8, dtype=np.uint8))[None, :, None]
+        return (bits.reshape(pages, 8, self.width) * weights).sum(axis=1, dtype=np.uint8).tobytes()
+
+    def to_png(self, scale=1):
+        """PNG file bytes of the buffer, each pixel blown up to scale x scale."""
+        return encode_png(upscale(self.to_rgb888(), scale))
+
+
+def upscale(rgb, zoom, grid=False):
+    """Blow an (h, w, 3) image up to zoom x zoom blocks per pixel.
+
+    With grid, the last row and column of every block are darkened (but kept
+    visible on black) so single pixels stand out at high zoom.
+    """
+    if zoom > 1:
+        rgb = rgb.repeat(zoom, axis=0).repeat(zoom, axis=1)
+    if grid and zoom > 1:
+        for edge in (rgb[zoom - 1::zoom], rgb[:, zoom - 1::zoom]):
+            edge[...] = np.maximum(edge // 5 * 3, 28)
+    return rgb
+
+
+def encode_png(rgb):
+    """Minimal PNG encoder for an (h, w, 3) uint8 array (no Pillow needed)."""
+    h, w, _ = rgb.shape
+    raw = np.zeros((h, 1 + 3 * w), dtype=np.uint8)  # filter byte 0 (None) per row
+    raw[:, 1:] = rgb.reshape(h, 3 * w)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 9)) + chunk(b"IEND", b""))
+
+
+def rasterize(elements, size, mode="mono", color=None):
+    """Render Elements (or a Scene) into a new Framebuffer of the given (width, height) size.
+
+    Everything is drawn in the foreground colour, so draw order does not change
+    the result: the whole scene is reduced to one coverage mask built from
+    batched span, box and point arrays, grouped by circle radius. A Scene is
+    read straight from its columns. Rects are drawn
+    unrotated, exactly like the generated drawRect() call; text uses the classic
+    font atlas and wraps at the screen edge like print(). The exception is
+    RGB565 bitmaps, which are opaque: a scene with one is drawn in order.
+    """
+    width, height = size
+    fb = Framebuffer(width, height, mode)
+    mask = np.zeros((height, width), dtype=bool)
+
+    if not isinstance(elements, Scene):
+        elements = list(elements)
+    kind, x, y, w, h, fill, radius, others = _element_table(elements)
+    if any(el.type == "bitmap" and is_opaque(el.text) for el in others):
+        # An RGB565 bitmap also paints its black pixels, so here order does matter.
+        for el in elements:
+            fb.draw_element(el, color)
+        return fb
+    plain = (kind == _TYPE_CODE["rect"]) & (radius == 0)
+    circle = kind == _TYPE_CODE["circle"]
+
+    sel = plain & ~fill
+    if sel.any():
+        rx, ry, rw, rh = x[sel], y[sel], w[sel], h[sel]
+        _cover_spans(mask, np.concatenate([ry, ry + rh - 1]), np.concatenate([rx, rx]), np.concatenate([rw, rw]))
+        _cover_spans(mask.T, np.concatenate([rx, rx + rw - 1]), np.concatenate([ry, ry]), np.concatenate([rh, rh]))
+
+    sel = plain & fill
+    if sel.any():
+        _cover_boxes(mask, x[sel], y[sel], w[sel], h[sel])
+
+    for sel, table in ((circle & ~fill, _circle_outline), (circle & fill, _circle_fill_spans)):
+        if not sel.any():
+            continue
+        r = w[sel] // 2
+        cx, cy = x[sel] + r, y[sel] + h[sel] // 2
+        # cull negative radii and circles entirely off-screen before expanding them to pixels
+        keep = (r >= 0) & (cx + r >= 0) & (cx - r < width) & (cy + r >= 0) & (cy - r < height)
+        if not keep.any():
+            continue
+        if table is _circle_outline:
+            xs, ys = _expand_offsets(cx[keep], cy[keep], r[keep], table)
+            _cover_points(mask, xs, ys)
+        else:
+            xs, ys, lens = _expand_offsets(cx[keep], cy[keep], r[keep], table)
+            _cover_spans(mask.T, xs, ys, lens)
+
+    fb.pixels[mask] = fb.foreground if color is None else color
+    # Round rects, lines, triangles, text and bitmaps are rarer; draw them one by one on top.
+    for el in others:
+        fb.draw_element(el, color)
+    return fb
+
+
+def rerender(fb, scene, box):
+    """Re-rasterize the (x0, y0, x1, y1) part of fb from the elements of scene that overlap it."""
+    x0, y0, x1, y1 = box
+    drawn = [scene[int(i)] for i in scene.overlapping(x0, y0, x1, y1, fb.width)]
+    fb.pixels[y0:y1, x0:x1] = rasterize(drawn, (fb.width, fb.height), fb.mode).pixels[y0:y1, x0:x1]
@@ -0,0 +1,398 @@
+# display_designer/images.py
+"""
+Image assets for "bitmap" elements: PNG/PPM decoding and conversion to what
+the display draws, without Pillow.
+
+A bitmap element's text is its source, "<format>:<path>" (see bitmap_source()).
+The formats are
+
+  * fs         1bpp, Floyd–Steinberg error diffusion
+  * ordered    1bpp, 8x8 Bayer ordered dither
+  * threshold  1bpp, plain 50% threshold
+  * rgb565     16-bit colour for TFTs
+
+1bpp bitmaps are drawn like Adafruit_GFX::drawBitmap(): only the set bits, in
+the foreground colour. RGB565 bitmaps are opaque, like drawRGBBitmap().
+
+Converting is the slow part, so load_bitmap() caches results twice: in memory
+per (file, modification time, format), and on disk as .npy files named by the
+SHA-256 of the file's bytes and the format. The disk cache survives restarts
+and is shared by every project that uses the same asset; it lives in
+DESIGNER_CACHE_DIR, or the user's cache directory. Never imports tkinter.
+"""
+import hashlib
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+MONO_FORMATS = ("fs", "ordered", "threshold")
+BITMAP_FORMATS = MONO_FORMATS + ("rgb565",)
+DEFAULT_FORMAT = "fs"
+IMAGE_SUFFIXES = (".png", ".ppm", ".pgm", ".pbm", ".pnm")
+CACHE_ENV = "DESIGNER_CACHE_DIR"
+CACHE_VERSION = 1  # bump when a conversion changes, so old cache files are not reused
+
+
+# ----------------- Sources -----------------
+def bitmap_source(path, fmt=DEFAULT_FORMAT):
+    """Element text for an asset: "<format>:<path>"."""
+    if fmt not in BITMAP_FORMATS:
+        raise ValueError(f"Unknown bitmap format '{fmt}' (expected one of {', '.join(BITMAP_FORMATS)})")
+    return f"{fmt}:{path}"
+
+
+def split_source(source):
+    """(format, path) of a bitmap element's text."""
+    fmt, sep, path = source.partition(":")
+    if not sep or fmt not in BITMAP_FORMATS:
+        raise ValueError(f"'{source}' is not a bitmap source (<format>:<path>)")
+    return fmt, path
+
+
+def is_opaque(source):
+    """True for RGB565 bitmaps, which also overwrite what is under their black pixels."""
+    return source.startswith("rgb565:")
+
+
+# ----------------- Decoding -----------------
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # colour type -> samples per pixel
+
+
+def _unfilter(raw, height, stride, bpp):
+    """Undo the per-row PNG filters: (height, stride) uint8 scanlines."""
+    rows = np.frombuffer(raw, dtype=np.uint8)
+    if len(rows) < height * (stride + 1):
+        raise ValueError("PNG image data is truncated")
+    rows = rows[:height * (stride + 1)].reshape(height, stride + 1)
+    out = np.zeros((height, stride), dtype=np.uint8)
+    prev = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        kind, line = rows[y, 0], rows[y, 1:]
+        if kind == 0:
+            cur = line
+        elif kind == 2:  # Up
+            cur = line + prev  # uint8 wraps around like the filter does
+        elif kind == 1:  # Sub: a running sum per byte of the pixel, which cumsum does in one go
+            pad = (-stride) % bpp
+            lanes = np.concatenate([line, np.zeros(pad, np.uint8)]).reshape(-1, bpp)
+            cur = np.cumsum(lanes, axis=0, dtype=np.uint8).reshape(-1)[:stride]
+        elif kind in (3, 4):  # Average, Paeth: each byte needs the one to its left, so go a byte at a time
+            cur, up = bytearray(line.tobytes()), prev.tobytes()
+            for i in range(stride):
+                a = cur[i - bpp] if i >= bpp else 0
+                b = up[i]
+                if kind == 3:
+                    pred = (a + b) >> 1
+                else:
+                    c = up[i - bpp] if i >= bpp else 0
+                    p = a + b - c
+                    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                    pred = a if pa <= pb and pa <= pc else b if pb <= pc else c
+                cur[i] = (cur[i] + pred) & 0xFF
+            cur = np.frombuffer(bytes(cur), dtype=np.uint8)
+        else:
+            raise ValueError(f"Unknown PNG filter type {kind}")
+        out[y] = cur
+        prev = out[y]
+    return out
+
+
+def decode_png(data):
+    """(height, width, 3) uint8 RGB of PNG file bytes; alpha is composited onto black."""
+    if not data.startswith(_PNG_SIGNATURE):
+        raise ValueError("not a PNG file")
+    pos = len(_PNG_SIGNATURE)
+    header, palette, trns, idat = None, None, None, []
+    while pos + 8 <= len(data):
+        length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif tag == b"PLTE":
+            palette = np.frombuffer(body, dtype=np.uint8).reshape(-1, 3)
+        elif tag == b"tRNS":
+            trns = body
+        elif tag == b"IDAT":
+            idat.append(body)
+        elif tag == b"IEND":
+            break
+    if header is None:
+        raise ValueError("PNG has no IHDR chunk")
+    width, height, depth, ctype, _, _, interlace = header
+    if ctype not in _PNG_CHANNELS or depth not in (1, 2, 4, 8, 16):
+        raise ValueError(f"unsupported PNG colour type {ctype} / bit depth {depth}")
+    if interlace:
+        raise ValueError("interlaced PNGs are not supported")
+    channels = _PNG_CHANNELS[ctype]
+    bits = channels * depth
+    stride = -(-width * bits // 8)
+    try:
+        raw = zlib.decompress(b"".join(idat))
+    except zlib.error as e:
+        raise ValueError(f"corrupt PNG data: {e}")
+    rows = _unfilter(raw, height, stride, max(bits // 8, 1))
+
+    if depth == 16:
+        samples = rows.reshape(height, width, channels, 2)[..., 0]  # the high byte is plenty for a display
+    elif depth == 8:
+        samples = rows.reshape(height, width, channels)
+    else:
+        samples = np.unpackbits(rows, axis=1).reshape(height, -1, depth)[:, :width]
+        samples = (samples * (1 << np.arange(depth - 1, -1, -1, dtype=np.uint8))).sum(axis=2, dtype=np.uint8)
+        samples = samples[:, :, None]
+        if ctype == 0:
+            samples = samples * np.uint8(255 // ((1 << depth) - 1))
+
+    alpha = None
+    if ctype == 3:
+        if palette is None:
+            raise ValueError("palette PNG without a PLTE chunk")
+        index = samples[:, :, 0]
+        rgb = palette[np.minimum(index, len(palette) - 1)]
+        if trns:
+            table = np.full(256, 255, dtype=np.uint8)
+            table[:len(trns)] = np.frombuffer(trns, dtype=np.uint8)
+            alpha = table[index]
+    elif ctype in (0, 4):
+        rgb = np.repeat(samples[:, :, :1], 3, axis=2)
+        alpha = samples[:, :, 1] if ctype == 4 else None
+    else:
+        rgb = samples[:, :, :3]
+        alpha = samples[:, :, 3] if ctype == 6 else None
+    if alpha is not None:
+        rgb = (rgb.astype(np.uint16) * alpha[:, :, None] // 255).astype(np.uint8)
+    return np.ascontiguousarray(rgb, dtype=np.uint8)
+
+
+def _pnm_header(data, count):
+    """The first count whitespace-separated header fields of a PNM file, and where the pixel data starts."""
+    fields, pos = [], 2
+    while len(fields) < count:
+        while pos < len(data) and data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.find(b"\n", pos)
+            if pos < 0:
+                break
+            continue
+        end = pos
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        if end == pos:
+            break
+        fields.append(int(data[pos:end]))
+        pos = end
+    if len(fields) < count:
+        raise ValueError("truncated PNM header")
+    return fields, pos + 1  # a single whitespace byte ends the header
+
+
+def decode_pnm(data):
+    """(height, width, 3) uint8 RGB of a PPM/PGM/PBM file (binary P4-P6 or plain P1-P3)."""
+    magic = data[:2]
+    if magic not in (b"P1", b"P2", b"P3", b"P4", b"P5", b"P6"):
+        raise ValueError("not a PPM/PGM/PBM file")
+    kind = int(magic[1:])
+    bitmap = kind in (1, 4)
+    (width, height, *rest), start = _pnm_header(data, 2 if bitmap else 3)
+    maxval = 1 if bitmap else rest[0]
+    channels = 3 if kind in (3, 6) else 1
+    count = width * height * channels
+    if kind == 4:
+        rows = np.frombuffer(data, dtype=np.uint8, count=height * -(-width // 8), offset=start)
+        values = np.unpackbits(rows.reshape(height, -1), axis=1)[:, :width]
+    elif kind in (5, 6):
+        dtype = np.dtype(">u2") if maxval > 255 else np.uint8
+        values = np.frombuffer(data, dtype=dtype, count=count, offset=start)
+    else:
+        values = np.array(data[start:].split()[:count], dtype=np.int64)
+        if len(values) < count:
+            raise ValueError("truncated PNM data")
+    values = values.reshape(height, width, channels).astype(np.uint32)
+    if bitmap:
+        values = 1 - values  # PBM: 1 is black
+    rgb = (values * 255 // max(maxval, 1)).astype(np.uint8)
+    return np.repeat(rgb, 3, axis=2) if channels == 1 else rgb
+
+
+def decode_image(data):
+    """(height, width, 3) uint8 RGB of PNG or PPM/PGM/PBM file bytes."""
+    if data.startswith(_PNG_SIGNATURE):
+        return decode_png(data)
+    if data[:1] == b"P":
+        return decode_pnm(data)
+    raise ValueError("not a PNG or PPM/PGM/PBM image")
+
+
+# ----------------- Conversion -----------------
+# Recursive 8x8 Bayer matrix; thresholds are spread evenly over 0..255.
+_BAYER = np.array([[0]], dtype=np.float32)
+for _ in range(3):
+    _BAYER = np.block([[4 * _BAYER, 4 * _BAYER + 2], [4 * _BAYER + 3, 4 * _BAYER + 1]])
+_BAYER_THRESHOLDS = (_BAYER + 0.5) * (256 / 64)
+
+
+def luminance(rgb):
+    """(height, width) float32 Rec. 601 luma of an RGB image, 0..255."""
+    return rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def floyd_steinberg(gray):
+    """Floyd–Steinberg dither of a 0..255 image to a bool mask (True = lit).
+
+    Pixel (y, x) only waits for its left neighbour and three pixels of the row
+    above, so every pixel on the line x + 2y = t can be quantized at once:
+    w + 2h vectorized steps instead of w * h scalar ones, with the same result
+    as the usual scan.
+    """
+    h, w = gray.shape
+    acc = np.zeros((h + 1, w + 2), dtype=np.float32)  # one column of padding each side, one spare row
+    acc[:h, 1:w + 1] = gray
+    out = np.zeros((h, w), dtype=bool)
+    rows = np.arange(h)
+    for t in range(w + 2 * (h - 1)):
+        xs = t - 2 * rows
+        live = (xs >= 0) & (xs < w)
+        ys, xs = rows[live], xs[live]
+        cols = xs + 1
+        value = acc[ys, cols]
+        lit = value >= 128
+        out[ys, xs] = lit
+        err = value - 255 * lit
+        acc[ys, cols + 1] += err * (7 / 16)
+        acc[ys + 1, cols - 1] += err * (3 / 16)
+        acc[ys + 1, cols] += err * (5 / 16)
+        acc[ys + 1, cols + 1] += err * (1 / 16)
+    return out
+
+
+def ordered_dither(gray):
+    h, w = gray.shape
+    return gray > np.tile(_BAYER_THRESHOLDS, (-(-h // 8), -(-w // 8)))[:h, :w]
+
+
+def to_rgb565(rgb):
+    """(height, width) uint16 RGB565 of an RGB image."""
+    c = rgb.astype(np.uint16)
+    return ((c[..., 0] >> 3) << 11) | ((c[..., 1] >> 2) << 5) | (c[..., 2] >> 3)
+
+
+def convert(rgb, fmt):
+    """An RGB image in a bitmap format: a bool mask for the 1bpp formats, uint16 for rgb565."""
+    if fmt == "rgb565":
+        return to_rgb565(rgb)
+    gray = luminance(rgb)
+    if fmt == "fs":
+        return floyd_steinberg(gray)
+    if fmt == "ordered":
+        return ordered_dither(gray)
+    if fmt == "threshold":
+        return gray >= 128
+    raise ValueError(f"Unknown bitmap format '{fmt}'")
+
+
+# ----------------- Cache -----------------
+def default_cache_dir(environ=os.environ):
+    if environ.get(CACHE_ENV):
+        return environ[CACHE_ENV]
+    base = environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "display_designer", "bitmaps")
+
+
+class AssetCache:
+    """Converted bitmaps by file and format: in memory, backed by content-hashed .npy files.
+
+    directory None keeps the cache in memory only. Safe to use from the Tk and
+    worker threads at once.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.hits = 0      # answered from memory
+        self.loads = 0     # read from a disk cache file
+        self.converts = 0  # decoded and converted
+        self._files = {}   # (abspath, format) -> (mtime_ns, size, pixels)
+        self._lock = threading.Lock()
+
+    def load(self, path, fmt):
+        """The converted pixels of the image file at path (read-only array, see convert())."""
+        if fmt not in BITMAP_FORMATS:
+            raise ValueError(f"Unknown bitmap format '{fmt}'")
+        key = (os.path.abspath(path), fmt)
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                known = self._files.get(key)
+            if known is not None:
+                return known[2]  # deleted since it was loaded: keep showing the last version
+            raise
+        with self._lock:
+            known = self._files.get(key)
+            if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+                self.hits += 1
+                return known[2]
+        with open(path, "rb") as f:
+            data = f.read()
+        pixels = self.convert(data, fmt)
+        with self._lock:
+            self._files[key] = (st.st_mtime_ns, st.st_size, pixels)
+        return pixels
+
+    def convert(self, data, fmt):
+        """convert() of image file bytes, through the disk cache."""
+        digest = hashlib.sha256(data + f"\0{fmt}\0{CACHE_VERSION}".encode()).hexdigest()
+        cached = None if self.directory is None else os.path.join(self.directory, digest + ".npy")
+        if cached is not None:
+            try:
+                pixels = np.load(cached, allow_pickle=False)
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self.loads += 1
+                pixels.setflags(write=False)
+                return pixels
+        pixels = convert(decode_image(data), fmt)
+        pixels.setflags(write=False)
+        with self._lock:
+            self.converts += 1
+        if cached is not None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, pixels, allow_pickle=False)
+                os.replace(tmp, cached)
+            except OSError:
+                pass  # a read-only cache only costs the conversion next time
+        return pixels
+
+
+_cache = AssetCache(default_cache_dir())
+
+
+def load_bitmap(path, fmt=DEFAULT_FORMAT):
+    """Converted pixels of an image file, from the shared cache."""
+    return _cache.load(path, fmt)
+
+
+def load_source(source):
+    """load_bitmap() for a bitmap element's text."""
+    return load_bitmap(*reversed(split_source(source)))
+
+
+def cache_stats():
+    """Counters of the shared cache: memory hits, disk cache loads, conversions and files held."""
+    return {"hits": _cache.hits, "loads": _cache.loads, "converts": _cache.converts, "files": len(_cache._files)}
+
+
+def set_cache(cache):
+    """Replace the shared cache (e.g. AssetCache(None) to keep nothing on disk); returns the old one."""
+    global _cache
+    old, _cache = _cache, cache
+    return old
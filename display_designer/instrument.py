@@ -0,0 +1,158 @@
+# display_designer/instrument.py
+"""
+Opt-in timing of the app's event handlers and model operations.
+
+    DESIGNER_TRACE=1 python designer.py              # on from the start
+    DESIGNER_TRACE=drag.json python designer.py      # ...and write the trace on exit
+
+(or Debug ▸ Instrumentation in the window). Tracer.wrap() puts a timer around a
+function; while the tracer is off that costs one attribute check per call.
+While it is on, every call lands in a per-name latency histogram (p50/p95/p99
+for the stats overlay) and in a bounded buffer of Chrome trace events that
+write_trace() dumps for chrome://tracing or https://ui.perfetto.dev.
+
+Handlers run on the Tk thread and parse/codegen jobs on the worker thread, so
+record() can add a name while the stats overlay reads summary() or the menu
+resets; one lock covers the histograms (the event deque appends atomically).
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+TRACE_ENV = "DESIGNER_TRACE"
+MAX_EVENTS = 200_000  # about 40 MB of trace JSON; older events are dropped first
+
+# Log-spaced buckets: 8 per doubling (~9% wide) from 1 us, so percentiles are
+# good to a few percent with a fixed, small amount of memory per name.
+_BUCKETS_PER_OCTAVE = 8
+_BUCKET_FLOOR = 1e-6
+
+
+class LatencyHistogram:
+    """Call durations of one name, in log-spaced buckets."""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds > _BUCKET_FLOOR:
+            bucket = int(math.log2(seconds / _BUCKET_FLOOR) * _BUCKETS_PER_OCTAVE)
+        else:
+            bucket = 0
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Seconds below which p percent of the calls finished (bucket upper bound, capped at max)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.max, _BUCKET_FLOOR * 2 ** ((bucket + 1) / _BUCKETS_PER_OCTAVE))
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Tracer:
+    """Named timers: latency histograms plus a Chrome trace-event buffer."""
+
+    def __init__(self, enabled=False, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.histograms = {}
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def wrap(self, fn, name=None):
+        """fn, timed under name (default: its __name__) whenever the tracer is on."""
+        name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, start, time.perf_counter())
+        return timed
+
+    def record(self, name, start, end):
+        """Add one call of name that ran from start to end (perf_counter seconds)."""
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = LatencyHistogram()
+            hist.add(end - start)
+        self.events.append((name, start, end, threading.get_ident()))
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.events.clear()
+
+    def summary(self, top=None):
+        """(name, calls, p50, p95, p99, max) rows, slowest p95 first."""
+        with self._lock:
+            rows = [(name, h.count, h.percentile(50), h.percentile(95), h.percentile(99), h.max)
+                    for name, h in self.histograms.items()]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows[:top] if top else rows
+
+    def format_summary(self, top=None):
+        lines = [f"{'':<22}{'calls':>7}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        for name, calls, p50, p95, p99, _ in self.summary(top):
+            lines.append(f"{name[:22]:<22}{calls:>7}{_ms(p50):>9}{_ms(p95):>9}{_ms(p99):>9}")
+        return "\n".join(lines)
+
+    def trace_events(self):
+        """The buffered calls as Chrome trace "complete" events (microsecond timestamps)."""
+        threads = {}
+        out = []
+        for name, start, end, ident in list(self.events):
+            tid = threads.setdefault(ident, len(threads) + 1)
+            out.append({"name": name, "cat": "designer", "ph": "X", "pid": self._pid, "tid": tid,
+                        "ts": round((start - self._origin) * 1e6, 3), "dur": round((end - start) * 1e6, 3)})
+        main = threading.main_thread().ident
+        for ident, tid in threads.items():
+            label = "Tk" if ident == main else f"worker {tid}"
+            out.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": label}})
+        return out
+
+    def write_trace(self, path):
+        """Write the trace-event JSON to path; returns the number of events."""
+        events = self.trace_events()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+def _ms(seconds):
+    return f"{seconds * 1e3:.2f}ms" if seconds >= 1e-3 else f"{seconds * 1e6:.0f}us"
+
+
+def tracer_from_env(environ=os.environ):
+    """(Tracer, trace path or None) from DESIGNER_TRACE: unset/"0" off, "1" on, else on + output path."""
+    value = environ.get(TRACE_ENV, "").strip()
+    if value in ("", "0"):
+        return Tracer(), None
+    return Tracer(enabled=True), (None if value == "1" else value)
@@ -0,0 +1,680 @@
+# display_designer/mirror.py
+"""
+Live framebuffer mirror: stream the rendered display to a receiver while editing.
+
+    Mirror ▸ Start Mirror… in the window                 # publishes on tcp:127.0.0.1:7878
+    python designer.py mirror receive tcp:127.0.0.1:7878 --png mirror.png
+    python designer.py mirror sketch --display "OLED 128x64" --host 192.168.1.20 -o receiver.ino
+
+MirrorServer listens on a TCP or Unix socket and sends each receiver the
+difference between what that receiver already has and the current frame.
+At most IN_FLIGHT updates per receiver wait for their ack, so a slow receiver
+gets fewer, coalesced updates instead of a growing backlog.
+Monochrome displays get the changed runs of SSD1306 page bytes, TFTs the
+changed rectangles of RGB565 pixels, both PackBits run-length coded like the
+bitmap export (codegen.rle_encode). The ESP32 receiver sketch decodes straight
+from the socket into the SSD1306 buffer, or a one-row line buffer for TFT_eSPI,
+so it needs no frame-sized RAM of its own.
+
+Wire format (little-endian):
+
+    message   "DM" type:u8 seq:u16 length:u32, then length payload bytes
+    HELLO  1  width:u16 height:u16 format:u8 (0 = 1bpp SSD1306 pages, 1 = RGB565)
+    PAGES  2  count:u16, count x (page:u8 x:u16 n:u16, RLE of n page bytes)
+    RECTS  3  count:u16, count x (x:u16 y:u16 w:u16 h:u16, RLE of w*h big-endian RGB565 pixels)
+    ack       "DA" seq:u16, sent back by the receiver once a PAGES/RECTS update is shown
+
+A new receiver gets HELLO, then the whole frame as an update from a blank
+screen. The acks give the publisher a round-trip latency per edit.
+Never imports tkinter.
+"""
+import argparse
+import os
+import socket
+import stat
+import struct
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from .batch import _parse_size
+from .codegen import rle_encode
+from .core import DISPLAY_PRESETS, Framebuffer, mode_for_display
+from .optimize import changed_rects
+
+MAGIC = b"DM"
+ACK = b"DA"
+HEADER = struct.Struct("<2sBHI")
+ACK_FORMAT = struct.Struct("<2sH")
+HELLO, PAGES, RECTS = 1, 2, 3
+FORMATS = {"mono": 0, "rgb565": 1}
+DEFAULT_PORT = 7878
+DEFAULT_ADDRESS = f"tcp:127.0.0.1:{DEFAULT_PORT}"
+PAGE_GAP = 5    # unchanged page bytes sent rather than starting a new run (5-byte item header)
+MAX_RECTS = 8
+HISTORY = 256   # edit reports kept for summary()
+IN_FLIGHT = 2   # updates a receiver may have unacked before the next ones are coalesced
+
+
+# ----------------- Addresses -----------------
+def parse_address(text):
+    """(family, address) from "tcp:HOST:PORT", "HOST:PORT", ":PORT" or "unix:PATH"."""
+    value = text.strip()
+    if value.startswith("unix:"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not available on this platform; use tcp:HOST:PORT")
+        if not value[5:]:
+            raise ValueError("unix: needs a socket path")
+        return socket.AF_UNIX, value[5:]
+    if value.startswith("tcp:"):
+        value = value[4:]
+    host, _, port = value.rpartition(":")
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"Bad mirror address '{text}' (expected tcp:HOST:PORT or unix:PATH)")
+    if not 0 <= port < 65536:
+        raise ValueError(f"Bad port in '{text}'")
+    return socket.AF_INET, (host or "127.0.0.1", port)
+
+
+def format_address(family, address):
+    if family == socket.AF_INET:
+        return f"tcp:{address[0]}:{address[1]}"
+    return f"unix:{address}"
+
+
+# ----------------- Encoding -----------------
+def frame_bytes(width, height, mode):
+    """Size of a whole frame in the display's own format."""
+    return width * -(-height // 8) if mode == "mono" else width * height * 2
+
+
+def page_bytes(fb):
+    """(pages, width) uint8 array of a mono Framebuffer in SSD1306 page order."""
+    return np.frombuffer(fb.pages(), dtype=np.uint8).reshape(-1, fb.width)
+
+
+def _runs(changed, gap):
+    """(start, length) of the True stretches of a 1-D mask, joining stretches at most gap apart."""
+    idx = np.flatnonzero(changed)
+    if not len(idx):
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > gap + 1)
+    starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+    ends = np.concatenate((idx[breaks], [idx[-1]])) + 1
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
+
+
+def encode_update(before, after):
+    """(type, payload, items, raw bytes) of the update turning Framebuffer before into after; None if equal."""
+    items = []
+    if after.mode == "mono":
+        old, new = page_bytes(before), page_bytes(after)
+        for page in np.flatnonzero((old != new).any(axis=1)).tolist():
+            for x, n in _runs(old[page] != new[page], PAGE_GAP):
+                items.append((struct.pack("<BHH", page, x, n), new[page, x:x + n].tobytes()))
+        kind = PAGES
+    else:
+        for x, y, w, h in changed_rects(before.pixels != after.pixels, max_rects=MAX_RECTS):
+            items.append((struct.pack("<HHHH", x, y, w, h), after.pixels[y:y + h, x:x + w].astype(">u2").tobytes()))
+        kind = RECTS
+    if not items:
+        return None
+    payload = bytearray(struct.pack("<H", len(items)))
+    for head, data in items:
+        payload += head
+        payload += rle_encode(data)
+    return kind, bytes(payload), len(items), sum(len(data) for _, data in items)
+
+
+def message(kind, seq, payload):
+    return HEADER.pack(MAGIC, kind, seq, len(payload)) + payload
+
+
+def hello(width, height, mode):
+    return message(HELLO, 0, struct.pack("<HHB", width, height, FORMATS[mode]))
+
+
+def _unpack(payload, pos, size):
+    """(size decoded bytes, position after them) of the RLE data at payload[pos:] (see codegen.rle_decode)."""
+    out = bytearray()
+    while len(out) < size:
+        if pos + 1 >= len(payload):
+            raise ValueError("update payload is truncated")
+        c = payload[pos]
+        if c < 128:
+            out += payload[pos + 1:pos + 2 + c]
+            pos += 2 + c
+        else:
+            out += bytes((payload[pos + 1],)) * (c - 125)
+            pos += 2
+    if len(out) != size:
+        raise ValueError("RLE run overflows its item")
+    return bytes(out), pos
+
+
+def apply_update(fb, kind, payload):
+    """Apply a PAGES or RECTS payload to Framebuffer fb, like the receiver sketch; returns the item count."""
+    count, = struct.unpack_from("<H", payload)
+    pos = 2
+    shifts = np.arange(8, dtype=np.uint8)[:, None]
+    for _ in range(count):
+        if kind == PAGES:
+            page, x, n = struct.unpack_from("<BHH", payload, pos)
+            data, pos = _unpack(payload, pos + 5, n)
+            if page * 8 >= fb.height or x + n > fb.width:
+                raise ValueError(f"page update {page}:{x}+{n} is off the display")
+            rows = min(8, fb.height - page * 8)
+            bits = (np.frombuffer(data, dtype=np.uint8)[None, :] >> shifts) & 1
+            fb.pixels[page * 8:page * 8 + rows, x:x + n] = bits[:rows]
+        else:
+            x, y, w, h = struct.unpack_from("<HHHH", payload, pos)
+            data, pos = _unpack(payload, pos + 8, w * h * 2)
+            if x + w > fb.width or y + h > fb.height:
+                raise ValueError(f"rect update {x},{y} {w}x{h} is off the display")
+            fb.pixels[y:y + h, x:x + w] = np.frombuffer(data, dtype=">u2").reshape(h, w)
+    return count
+
+
+# ----------------- Publisher -----------------
+class _Client:
+    __slots__ = ("sock", "out", "inbox", "base", "seq", "in_flight")
+
+    def __init__(self, sock, base):
+        self.sock = sock
+        self.out = bytearray()    # bytes not sent yet; a new update is only queued once it is empty
+        self.inbox = bytearray()  # partial acks
+        self.base = base          # the frame this receiver will have once out is sent
+        self.seq = None           # seq of base (None: blank screen)
+        self.in_flight = 0        # updates sent but not acked yet
+
+
+class MirrorServer:
+    """Publishes frames to every connected receiver over non-blocking sockets.
+
+    publish() and poll() must be called from one thread (the Tk thread in the
+    app, which polls every few tens of milliseconds).
+    """
+    def __init__(self, address, width, height, mode="mono"):
+        family, addr = parse_address(address)
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.frame = Framebuffer(width, height, mode)
+        self.blank = self.frame
+        self.seq = 0
+        self.clients = []
+        self.history = deque(maxlen=HISTORY)
+        self._unacked = {}  # seq -> report waiting for its first ack
+        self._path = addr if family == socket.AF_UNIX else None
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            else:
+                _remove_stale_socket(addr)
+            sock.bind(addr)
+            sock.listen(4)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.address = format_address(family, sock.getsockname() if family == socket.AF_INET else addr)
+
+    def publish(self, fb):
+        """Make Framebuffer fb the current frame and send it on; returns the edit's report, None if unchanged."""
+        start = time.perf_counter()
+        update = encode_update(self.frame, fb)
+        if update is None:
+            return None
+        kind, payload, items, raw = update
+        previous = self.seq
+        self.seq = (self.seq + 1) & 0xFFFF
+        data = message(kind, self.seq, payload)
+        frame = Framebuffer(self.width, self.height, self.mode)
+        frame.pixels[...] = fb.pixels
+        self.frame = frame
+        report = {
+            "seq": self.seq,
+            "unit": "pages" if kind == PAGES else "rects",
+            "items": items,
+            "raw_bytes": raw,
+            "wire_bytes": len(data),
+            "frame_bytes": frame_bytes(self.width, self.height, self.mode),
+            "encode_ms": (time.perf_counter() - start) * 1e3,
+            "receivers": len(self.clients),
+            "latency_ms": None,
+            "sent": start,
+        }
+        self.history.append(report)
+        if self.clients:
+            self._unacked[self.seq] = report
+            while len(self._unacked) > HISTORY:
+                del self._unacked[next(iter(self._unacked))]
+        self._pump({previous: data})
+        return report
+
+    def poll(self):
+        """Accept receivers, read their acks and keep sending; returns the reports acked since the last poll."""
+        while True:
+            try:
+                sock, _ = self.sock.accept()
+            except OSError:  # BlockingIOError: nobody waiting
+                break
+            sock.setblocking(False)
+            if self._path is None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(sock, self.blank)
+            client.out += hello(self.width, self.height, self.mode)
+            self.clients.append(client)
+        acked = []
+        now = time.perf_counter()
+        for client in list(self.clients):
+            try:
+                data = client.sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                data = b""
+            if not data:
+                self._drop(client)
+                continue
+            client.inbox += data
+            while len(client.inbox) >= ACK_FORMAT.size:
+                tag, seq = ACK_FORMAT.unpack_from(client.inbox)
+                del client.inbox[:ACK_FORMAT.size]
+                if tag != ACK:
+                    self._drop(client)
+                    break
+                client.in_flight = max(client.in_flight - 1, 0)
+                report = self._unacked.pop(seq, None)
+                if report is not None:
+                    report["latency_ms"] = (now - report["sent"]) * 1e3
+                    acked.append(report)
+        self._pump({})
+        return acked
+
+    def _pump(self, encoded):
+        """Send pending bytes; queue an update for every receiver that is idle and behind."""
+        for client in list(self.clients):
+            self._send(client)
+            if client.out or client.seq == self.seq or client.in_flight >= IN_FLIGHT or client not in self.clients:
+                continue
+            data = encoded.get(client.seq)
+            if data is None:
+                update = encode_update(client.base, self.frame)
+                data = encoded[client.seq] = message(update[0], self.seq, update[1]) if update else b""
+            client.out += data
+            client.base, client.seq = self.frame, self.seq
+            client.in_flight += bool(data)
+            self._send(client)
+
+    def _send(self, client):
+        if not client.out:
+            return
+        try:
+            sent = client.sock.send(client.out)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._drop(client)
+            return
+        del client.out[:sent]
+
+    def _drop(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+            client.sock.close()
+
+    def summary(self):
+        """Totals over the recent edits (see HISTORY)."""
+        edits = list(self.history)
+        latencies = sorted(r["latency_ms"] for r in edits if r["latency_ms"] is not None)
+        return {
+            "edits": len(edits),
+            "wire_bytes": sum(r["wire_bytes"] for r in edits),
+            "frame_bytes": sum(r["frame_bytes"] for r in edits),
+            "acked": len(latencies),
+            "latency_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "latency_max_ms": latencies[-1] if latencies else None,
+        }
+
+    def close(self):
+        for client in list(self.clients):
+            self._drop(client)
+        self.sock.close()
+        if self._path is not None:
+            _remove_stale_socket(self._path)
+
+
+def _remove_stale_socket(path):
+    """Unlink a socket file left behind by an earlier run (never a regular file)."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def format_mirror_report(report):
+    """One-line summary of a publish() report."""
+    line = (f"Mirror #{report['seq']}: {report['items']} {report['unit']}, {report['wire_bytes']} B "
+            f"(frame {report['frame_bytes']} B), encode {report['encode_ms']:.2f} ms")
+    if report["latency_ms"] is not None:
+        line += f", shown after {report['latency_ms']:.1f} ms"
+    elif not report["receivers"]:
+        line += ", no receivers"
+    return line
+
+
+def format_mirror_summary(summary):
+    if not summary["edits"]:
+        return "Mirror: no edits published"
+    saved = 100 * (1 - summary["wire_bytes"] / summary["frame_bytes"])
+    line = (f"Mirror: {summary['edits']} edits, {summary['wire_bytes']} B sent "
+            f"({saved:.0f}% less than whole frames)")
+    if summary["acked"]:
+        line += f", latency p50 {summary['latency_p50_ms']:.1f} ms, max {summary['latency_max_ms']:.1f} ms"
+    return line
+
+
+# ----------------- Stand-in receiver -----------------
+class MirrorReceiver:
+    """Blocking receiver that applies the stream to a Framebuffer and acks, like the ESP32 sketch."""
+
+    def __init__(self, address, timeout=None):
+        family, addr = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(addr)
+        except OSError:
+            self.sock.close()
+            raise
+        self.fb = None
+
+    def _read(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("the mirror closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def receive(self):
+        """Read and apply one message: (type, seq, bytes on the wire, items)."""
+        magic, kind, seq, length = HEADER.unpack(self._read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a mirror stream")
+        payload = self._read(length)
+        items = 0
+        if kind == HELLO:
+            width, height, fmt = struct.unpack("<HHB", payload)
+            self.fb = Framebuffer(width, height, "mono" if fmt == FORMATS["mono"] else "rgb565")
+        elif kind in (PAGES, RECTS):
+            if self.fb is None:
+                raise ValueError("update before HELLO")
+            items = apply_update(self.fb, kind, payload)
+            self.sock.sendall(ACK_FORMAT.pack(ACK, seq))
+        return kind, seq, HEADER.size + length, items
+
+    def close(self):
+        self.sock.close()
+
+
+# ----------------- ESP32 receiver sketch -----------------
+_COMMON_LINES = [
+    "WiFiClient client;",
+    "",
+    "// Reads exactly n bytes; Stream::readBytes() gives up after its timeout (1 s).",
+    "static bool readAll(uint8_t *dst, size_t n) {",
+    "  return client.readBytes(dst, n) == n;",
+    "}",
+    "",
+    "static bool skip(uint32_t n) {",
+    "  uint8_t scratch[32];",
+    "  while (n) {",
+    "    size_t k = n < sizeof(scratch) ? n : sizeof(scratch);",
+    "    if (!readAll(scratch, k)) return false;",
+    "    n -= k;",
+    "  }",
+    "  return true;",
+    "}",
+    "",
+    "// PackBits RLE straight off the socket: c < 128 -> c + 1 literal bytes; c >= 128 -> next byte",
+    "// repeated c - 125 times. The state carries a run across calls, so an item can be decoded in pieces.",
+    "struct RleStream { uint8_t left = 0; bool repeat = false; uint8_t value = 0; };",
+    "",
+    "static bool unpack(RleStream &rle, uint8_t *dst, size_t n) {",
+    "  while (n) {",
+    "    if (!rle.left) {",
+    "      uint8_t c;",
+    "      if (!readAll(&c, 1)) return false;",
+    "      rle.repeat = c >= 128;",
+    "      rle.left = rle.repeat ? c - 125 : c + 1;",
+    "      if (rle.repeat && !readAll(&rle.value, 1)) return false;",
+    "    }",
+    "    size_t k = rle.left < n ? rle.left : n;",
+    "    if (rle.repeat) memset(dst, rle.value, k);",
+    "    else if (!readAll(dst, k)) return false;",
+    "    dst += k;",
+    "    n -= k;",
+    "    rle.left -= k;",
+    "  }",
+    "  return true;",
+    "}",
+    "",
+]
+
+_PAGES_LINES = [
+    "static bool applyUpdate(uint16_t count) {",
+    "  uint8_t *buffer = display.getBuffer();",
+    "  while (count--) {",
+    "    uint8_t item[5];",
+    "    if (!readAll(item, 5)) return false;",
+    "    uint16_t x = item[1] | item[2] << 8, n = item[3] | item[4] << 8;",
+    "    if (item[0] >= (SCREEN_HEIGHT + 7) / 8 || x + n > SCREEN_WIDTH) return false;",
+    "    RleStream rle;",
+    "    if (!unpack(rle, buffer + item[0] * SCREEN_WIDTH + x, n)) return false;",
+    "  }",
+    "  display.display();  // Adafruit_SSD1306 always pushes the whole buffer",
+    "  return true;",
+    "}",
+]
+
+_RECTS_LINES = [
+    "static uint8_t line[SCREEN_WIDTH * 2];  // one row of a rect",
+    "",
+    "static bool applyUpdate(uint16_t count) {",
+    "  while (count--) {",
+    "    uint8_t item[8];",
+    "    if (!readAll(item, 8)) return false;",
+    "    uint16_t x = item[0] | item[1] << 8, y = item[2] | item[3] << 8;",
+    "    uint16_t w = item[4] | item[5] << 8, h = item[6] | item[7] << 8;",
+    "    if (x + w > SCREEN_WIDTH || y + h > SCREEN_HEIGHT) return false;",
+    "    RleStream rle;",
+    "    for (uint16_t row = 0; row < h; row++) {",
+    "      if (!unpack(rle, line, w * 2)) return false;",
+    "      // Pixels arrive big-endian, the panel's byte order, so they go out as-is (swap bytes off).",
+    "      tft.pushImage(x, y + row, w, 1, (uint16_t *)line);",
+    "    }",
+    "  }",
+    "  return true;",
+    "}",
+]
+
+
+def receiver_sketch(width, height, mode="mono", host="192.168.1.100", port=DEFAULT_PORT,
+                    ssid="your-ssid", password="your-password"):
+    """Arduino sketch for an ESP32 that connects to the mirror and shows the stream."""
+    lines = [
+        "// Display mirror receiver: connects to the designer's mirror (start it on tcp:0.0.0.0:PORT)",
+        "// and shows every update it publishes. Protocol: display_designer/mirror.py.",
+        "#include <WiFi.h>",
+    ]
+    if mode == "mono":
+        lines += [
+            "#include <Wire.h>",
+            "#include <Adafruit_GFX.h>",
+            "#include <Adafruit_SSD1306.h>",
+        ]
+    else:
+        lines.append("#include <TFT_eSPI.h>  // driver and pins are set in TFT_eSPI's User_Setup.h")
+    lines += [
+        f"#define SCREEN_WIDTH {width}",
+        f"#define SCREEN_HEIGHT {height}",
+        f'#define WIFI_SSID "{ssid}"',
+        f'#define WIFI_PASSWORD "{password}"',
+        f'#define MIRROR_HOST "{host}"  // IP of the machine running the designer',
+        f"#define MIRROR_PORT {port}",
+        "",
+    ]
+    if mode == "mono":
+        lines.append("Adafruit_SSD1306 display(SCREEN_WIDTH, SCREEN_HEIGHT, &Wire);")
+    else:
+        lines.append("TFT_eSPI tft = TFT_eSPI();")
+    lines += _COMMON_LINES + (_PAGES_LINES if mode == "mono" else _RECTS_LINES) + [
+        "",
+        "// One message: HELLO checks the display, an update is applied, shown and acked.",
+        "static bool handleMessage() {",
+        "  uint8_t head[9];",
+        "  if (!readAll(head, 9) || head[0] != 'D' || head[1] != 'M') return false;",
+        "  uint16_t seq = head[3] | head[4] << 8;",
+        "  uint32_t len = head[5] | head[6] << 8 | (uint32_t)head[7] << 16 | (uint32_t)head[8] << 24;",
+        f"  if (head[2] == {HELLO}) {{",
+        "    uint8_t hello[5];",
+        "    if (len != 5 || !readAll(hello, 5)) return false;",
+        "    if ((hello[0] | hello[1] << 8) != SCREEN_WIDTH || (hello[2] | hello[3] << 8) != SCREEN_HEIGHT",
+        f"        || hello[4] != {FORMATS[mode]}) {{",
+        '      Serial.println(F("Mirror: the designer is showing a different display"));',
+        "      delay(5000);",
+        "      return false;",
+        "    }",
+        "    return true;",
+        "  }",
+        f"  if (head[2] == {PAGES if mode == 'mono' else RECTS}) {{",
+        "    uint8_t count[2];",
+        "    if (len < 2 || !readAll(count, 2) || !applyUpdate(count[0] | count[1] << 8)) return false;",
+        "    uint8_t ack[4] = {'D', 'A', (uint8_t)seq, (uint8_t)(seq >> 8)};",
+        "    client.write(ack, 4);",
+        "    return true;",
+        "  }",
+        "  return skip(len);",
+        "}",
+        "",
+        "void setup() {",
+        "  Serial.begin(115200);",
+    ]
+    if mode == "mono":
+        lines += [
+            "  if(!display.begin(SSD1306_SWITCHCAPVCC, 0x3C)) {",
+            '    Serial.println(F("SSD1306 allocation failed"));',
+            "    for(;;); // Don't proceed, loop forever",
+            "  }",
+            "  display.clearDisplay();",
+            "  display.display();",
+        ]
+    else:
+        lines.append("  tft.init();")
+        if width > height:
+            lines.append("  tft.setRotation(1);  // landscape")
+        lines.append("  tft.fillScreen(TFT_BLACK);")
+    lines += [
+        "  WiFi.begin(WIFI_SSID, WIFI_PASSWORD);",
+        "}",
+        "",
+        "void loop() {",
+        "  if (WiFi.status() != WL_CONNECTED) {",
+        "    delay(100);",
+        "    return;",
+        "  }",
+        "  if (!client.connected()) {",
+        "    if (!client.connect(MIRROR_HOST, MIRROR_PORT)) {",
+        "      delay(1000);",
+        "      return;",
+        "    }",
+        "    client.setNoDelay(true);",
+        "  }",
+        "  // On any error reconnect: the designer starts over with HELLO and a full frame.",
+        "  if (client.available() && !handleMessage()) client.stop();",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# ----------------- Command line -----------------
+def make_parser():
+    ap = argparse.ArgumentParser(prog="designer.py mirror",
+                                 description="Stand-in receiver and ESP32 receiver sketch for the live display mirror.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    rx = sub.add_parser("receive", help="stand-in receiver: apply the stream and report every update")
+    rx.add_argument("address", nargs="?", default=DEFAULT_ADDRESS, help=f"mirror address (default: {DEFAULT_ADDRESS})")
+    rx.add_argument("--png", help="rewrite this PNG after every update")
+    rx.add_argument("--scale", type=int, default=4, help="PNG pixel scale (default: 4)")
+    rx.add_argument("--count", type=int, help="stop after this many updates")
+    sk = sub.add_parser("sketch", help="write the ESP32 receiver sketch")
+    sk.add_argument("--display", choices=list(DISPLAY_PRESETS), default="OLED 128x64", help="display preset")
+    sk.add_argument("--size", type=_parse_size, help="custom WIDTHxHEIGHT (colour mode still from --display)")
+    sk.add_argument("--host", default="192.168.1.100", help="IP of the machine running the designer")
+    sk.add_argument("--port", type=int, default=DEFAULT_PORT)
+    sk.add_argument("--ssid", default="your-ssid")
+    sk.add_argument("--password", default="your-password")
+    sk.add_argument("-o", "--out", help="output file (default: stdout)")
+    return ap
+
+
+def receive(args, out):
+    try:
+        receiver = MirrorReceiver(args.address)
+    except (OSError, ValueError) as e:
+        print(f"error: cannot connect to {args.address}: {e}", file=sys.stderr)
+        return 1
+    updates = total = 0
+    try:
+        while args.count is None or updates < args.count:
+            kind, seq, nbytes, items = receiver.receive()
+            total += nbytes
+            if kind == HELLO:
+                fb = receiver.fb
+                print(f"{fb.width}x{fb.height} {fb.mode} display", file=out)
+                continue
+            if kind not in (PAGES, RECTS):
+                continue
+            updates += 1
+            unit = "pages" if kind == PAGES else "rects"
+            print(f"#{seq}: {items} {unit}, {nbytes} B", file=out)
+            if args.png:
+                with open(args.png, "wb") as f:
+                    f.write(receiver.fb.to_png(args.scale))
+    except KeyboardInterrupt:
+        pass
+    except (ConnectionError, ValueError) as e:
+        print(f"{e}", file=out)
+    finally:
+        receiver.close()
+    if updates:
+        fb = receiver.fb
+        print(f"{updates} updates, {total} B in total; whole frames would have been "
+              f"{updates * frame_bytes(fb.width, fb.height, fb.mode)} B", file=out)
+    return 0
+
+
+def main(argv=None, out=sys.stdout):
+    args = make_parser().parse_args(argv)
+    if args.command == "receive":
+        return receive(args, out)
+    width, height = args.size or DISPLAY_PRESETS[args.display]
+    code = receiver_sketch(width, height, mode_for_display(args.display), args.host, args.port,
+                           args.ssid, args.password)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(code)
+        print(f"wrote {args.out}", file=out)
+    else:
+        out.write(code)
+    return 0
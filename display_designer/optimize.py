@@ -0,0 +1,351 @@
+# display_designer/optimize.py
+"""
+Draw-call optimizer between the element model and code generation.
+
+optimize() returns a cheaper but pixel-identical element list: shapes that
+draw nothing new (fully covered, or off-screen) are culled, rects are
+strength-reduced to fast H/V lines or single fills, and text runs that
+continue each other are merged into one setCursor()/print(). Everything is
+drawn in the one foreground colour, so a shape whose pixels are all drawn by
+other shapes is redundant regardless of draw order. RGB565 bitmaps are the
+exception: they paint their whole box, so they hide what was drawn before
+them, and are only culled when later shapes cover all of it.
+
+dirty_rects() and partial_update_lines() turn a screen change into a few
+fillRect(BLACK) + redraw regions, for TFTs that have no local framebuffer.
+changed_rects() does the same for a mask of changed pixels (mirror.py).
+
+The cost figures are estimates: visible pixels written, and bytes on the bus
+(an address window costs WINDOW_BYTES, each RGB565 pixel 2 bytes; SSD1306-style
+buffered displays always push the whole buffer on display()).
+"""
+import math
+
+import numpy as np
+
+from .codegen import element_lines
+from .core import Element, Framebuffer, raster_bbox, rasterize, signature, text_size
+from .images import is_opaque
+
+# CASET + 4, RASET + 4, RAMWR: bytes to open an address window on an ST77xx/ILI9341
+WINDOW_BYTES = 11
+CHAR_W = 6  # classic font cell width at size 1
+MAX_TEXT_GAP = 2  # spaces allowed when merging two text runs
+
+
+def _copy(el):
+    return Element(el.type, el.id, el.x, el.y, el.w, el.h, text=el.text, rotation=el.rotation, fill=el.fill,
+                   radius=el.radius, size=el.size, points=el.points)
+
+
+def _region(el, width, height):
+    """Screen slice (y0, y1, x0, x1) that holds every pixel el can draw, or None if off-screen."""
+    bx0, by0, bx1, by1 = raster_bbox(el, width)
+    x0, y0 = max(int(math.floor(bx0)) - 1, 0), max(int(math.floor(by0)) - 1, 0)
+    x1, y1 = min(int(math.ceil(bx1)) + 2, width), min(int(math.ceil(by1)) + 2, height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return y0, y1, x0, x1
+
+
+# ----------------- Cost model -----------------
+def element_cost(el, pixels=None):
+    """(visible pixels, address windows) the Adafruit GFX call for el issues.
+
+    pixels is the element's rasterized visible pixel count.
+    """
+    if el.type == "text":
+        # size 1 glyphs are drawn pixel by pixel, larger sizes as one fillRect per font pixel
+        return pixels, pixels // (el.size * el.size)
+    if el.type == "rect":
+        if el.radius:
+            if el.fill:
+                return pixels, 1 + 2 * el.radius
+            straight = 2 * (el.w - 2 * el.radius) + 2 * (el.h - 2 * el.radius)
+            return pixels, 4 + max(pixels - straight, 0)  # four fast lines, corner arcs pixel by pixel
+        return pixels, 1 if el.fill else 4
+    if el.type == "line":
+        return pixels, 1 if (el.w == 0 or el.h == 0) else pixels
+    if el.type == "circle":
+        return pixels, (el.w // 2) * 2 + 1 if el.fill else pixels
+    if el.type == "triangle":
+        ys = [py for _, py in el.points]
+        return pixels, (max(ys) - min(ys) + 1) if el.fill else pixels
+    if el.type == "bitmap":
+        # drawBitmap() and drawRGBBitmap() are a writePixel() per pixel they draw
+        if is_opaque(el.text):
+            return el.w * el.h, el.w * el.h
+        return pixels, pixels
+    return pixels, 0
+
+
+def element_costs(elements, width, height, cache=None):
+    """(pixels, windows) for each element, in order (see element_cost).
+
+    cache is an optional dict kept between calls for one display size: an
+    element whose geometry is already in it is not rasterized again.
+    """
+    scratch = Framebuffer(width, height)
+    costs = []
+    for el in elements:
+        if cache is not None:
+            key = signature(el)
+            cost = cache.get(key)
+            if cost is not None:
+                costs.append(cost)
+                continue
+        region = _region(el, width, height)
+        count = 0
+        if region is not None:
+            y0, y1, x0, x1 = region
+            scratch.pixels[y0:y1, x0:x1] = 0
+            scratch.draw_element(el, 1)
+            count = int(np.count_nonzero(scratch.pixels[y0:y1, x0:x1]))
+        cost = element_cost(el, count)
+        if cache is not None:
+            cache[key] = cost
+        costs.append(cost)
+    return costs
+
+
+def scene_cost(elements, width, height, mode="mono", clear=True):
+    """Totals for drawing elements, after clearing the screen first if clear: dict(calls, pixels, windows, bus_bytes)."""
+    costs = element_costs(elements, width, height)
+    calls = len(costs)
+    pixels = sum(p for p, _ in costs)
+    windows = sum(w for _, w in costs)
+    if clear:  # clearDisplay() / fillScreen(BLACK)
+        calls += 1
+        pixels += width * height
+        windows += 1
+    return {"calls": calls, "pixels": pixels, "windows": windows,
+            "bus_bytes": bus_bytes(pixels, windows, width, height, mode)}
+
+
+def bus_bytes(pixels, windows, width, height, mode="mono"):
+    """Bytes sent to the panel for one screen update."""
+    if mode == "mono":
+        return width * -(-height // 8)  # display() pushes the whole buffer, whatever was drawn
+    return windows * WINDOW_BYTES + 2 * pixels
+
+
+# ----------------- Passes -----------------
+def cull(elements, width, height):
+    """Drop shapes whose visible pixels are all drawn by later kept shapes. Returns (kept, culled)."""
+    scratch = Framebuffer(width, height)
+    covered = np.zeros((height, width), dtype=bool)
+    kept, culled = [], 0
+    for el in reversed(elements):
+        region = _region(el, width, height)
+        if region is None:
+            culled += 1
+            continue
+        y0, y1, x0, x1 = region
+        scratch.pixels[y0:y1, x0:x1] = 0
+        if el.type == "bitmap" and is_opaque(el.text):
+            scratch.fill_rect(el.x, el.y, el.w, el.h, 1)
+        else:
+            scratch.draw_element(el, 1)
+        drawn = scratch.pixels[y0:y1, x0:x1] != 0
+        window = covered[y0:y1, x0:x1]
+        if not (drawn & ~window).any():
+            culled += 1
+            continue
+        window |= drawn
+        kept.append(el)
+    kept.reverse()
+    return kept, culled
+
+
+def reduce_strength(el):
+    """Cheaper equivalent of el (a new Element), or None if there is none."""
+    if el.type == "rect" and not el.radius and el.rotation % 360 == 0 and el.w > 0 and el.h > 0:
+        if el.h == 1:
+            return Element("line", el.id, el.x, el.y, el.w - 1, 0)
+        if el.w == 1:
+            return Element("line", el.id, el.x, el.y, 0, el.h - 1)
+        if not el.fill and (el.w <= 2 or el.h <= 2):
+            # a 2-pixel-thin outline is solid: one window instead of four
+            reduced = _copy(el)
+            reduced.fill = True
+            return reduced
+    elif el.type == "line" and (el.w < 0 and el.h == 0 or el.h < 0 and el.w == 0):
+        # drawLine going left/up -> the fast line drawn from the other end
+        return Element("line", el.id, el.x + el.w, el.y + el.h, -el.w, -el.h)
+    elif el.type == "circle" and el.w // 2 == 0:
+        return Element("line", el.id, el.x + el.w // 2, el.y + el.h // 2, 0, 0)
+    return None
+
+
+def merge_text(elements, width):
+    """Join text runs whose start is where the previous print() left the cursor. Returns (elements, merged)."""
+    out, merged = [], 0
+    for el in elements:
+        prev = out[-1] if out else None
+        if (el.type == "text" and prev is not None and prev.type == "text" and prev.size == el.size
+                and prev.y == el.y and "\n" not in prev.text and "\n" not in el.text):
+            step = CHAR_W * el.size
+            gap, rem = divmod(el.x - (prev.x + step * len(prev.text)), step)
+            end = prev.x + step * (len(prev.text) + gap + len(el.text))
+            # the cursor must not have wrapped, or the second run would land elsewhere
+            if rem == 0 and 0 <= gap <= MAX_TEXT_GAP and end <= width:
+                prev.text = prev.text + " " * gap + el.text
+                prev.w, prev.h = text_size(prev.text, prev.size)
+                merged += 1
+                continue
+        out.append(_copy(el) if el.type == "text" else el)
+    return out, merged
+
+
+def optimize(elements, width, height, mode="mono", cull_hidden=True, reduce=True, merge=True):
+    """Optimized copy of elements plus a report of what changed and the estimated costs."""
+    elements = list(elements)
+    before = scene_cost(elements, width, height, mode)
+    out, culled = cull(elements, width, height) if cull_hidden else (elements, 0)
+    reduced = 0
+    if reduce:
+        result = []
+        for el in out:
+            cheaper = reduce_strength(el)
+            reduced += cheaper is not None
+            result.append(cheaper or el)
+        out = result
+    merged = 0
+    if merge:
+        out, merged = merge_text(out, width)
+    after = scene_cost(out, width, height, mode)
+    return out, {"mode": mode, "before": before, "after": after,
+                 "culled": culled, "reduced": reduced, "merged": merged}
+
+
+def format_optimize_report(report):
+    b, a = report["before"], report["after"]
+    return (f"Optimized: {b['calls']} -> {a['calls']} calls ({report['culled']} culled, {report['reduced']} reduced, "
+            f"{report['merged']} text merged); pixels {b['pixels']} -> {a['pixels']}, "
+            f"bus {b['bus_bytes']} -> {a['bus_bytes']} B")
+
+
+# ----------------- Dirty rectangles -----------------
+def _changed_mask(before, after, width, height):
+    return rasterize(before, (width, height)).pixels != rasterize(after, (width, height)).pixels
+
+
+def _tile_rects(changed, tile):
+    """Merge changed tiles into rects: horizontal runs per tile row, grown down while identical."""
+    h, w = changed.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    padded = np.zeros((th * tile, tw * tile), dtype=bool)
+    padded[:h, :w] = changed
+    tiles = padded.reshape(th, tile, tw, tile).any(axis=(1, 3))
+    open_runs, rects = {}, []
+    for ty in range(th + 1):
+        row = tiles[ty] if ty < th else np.zeros(tw, dtype=bool)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], row.astype(np.int8), [0]))))
+        runs = set(zip(edges[::2].tolist(), edges[1::2].tolist()))
+        for run in list(open_runs):
+            if run not in runs:
+                rects.append((run[0], open_runs.pop(run), run[1], ty))
+        for run in runs:
+            open_runs.setdefault(run, ty)
+    # tile coords -> pixel rect, tightened to the changed pixels inside it
+    out = []
+    for tx0, ty0, tx1, ty1 in rects:
+        sub = changed[ty0 * tile:ty1 * tile, tx0 * tile:tx1 * tile]
+        ys, xs = np.flatnonzero(sub.any(axis=1)), np.flatnonzero(sub.any(axis=0))
+        out.append((tx0 * tile + int(xs[0]), ty0 * tile + int(ys[0]),
+                    int(xs[-1] - xs[0]) + 1, int(ys[-1] - ys[0]) + 1))
+    return out
+
+
+def dirty_rects(before, after, width, height, tile=8, max_rects=8):
+    """Rectangles (x, y, w, h) covering every pixel that differs between two layouts."""
+    return changed_rects(_changed_mask(before, after, width, height), tile, max_rects)
+
+
+def changed_rects(changed, tile=8, max_rects=8):
+    """At most max_rects rectangles (x, y, w, h) covering the True pixels of a (height, width) mask."""
+    if not changed.any():
+        return []
+    rects = _tile_rects(changed, tile)
+    while len(rects) > 4 * max_rects:
+        tile *= 2
+        rects = _tile_rects(changed, tile)
+    while len(rects) > max_rects:
+        # merge the pair whose union adds the least area
+        best = None
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                (ax, ay, aw, ah), (bx, by, bw, bh) = rects[i], rects[j]
+                x0, y0 = min(ax, bx), min(ay, by)
+                x1, y1 = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                grow = (x1 - x0) * (y1 - y0) - aw * ah - bw * bh
+                if best is None or grow < best[0]:
+                    best = (grow, i, j, (x0, y0, x1 - x0, y1 - y0))
+        _, i, j, union = best
+        rects = [r for k, r in enumerate(rects) if k not in (i, j)] + [union]
+    return rects
+
+
+def _box_rect(box):
+    x0, y0 = math.floor(box[0]), math.floor(box[1])
+    x1, y1 = math.ceil(box[2]), math.ceil(box[3])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _overlaps(rect, rects):
+    bx, by, bw, bh = rect
+    return any(bx <= x + w and x <= bx + bw and by <= y + h and y <= by + bh for x, y, w, h in rects)
+
+
+def redraw_set(after, rects, width):
+    """The elements of `after` (in draw order) to redraw once the (x, y, w, h) rects are cleared.
+
+    Redrawing an element also paints outside the cleared rects, which is
+    harmless in one colour. An opaque RGB565 bitmap is not: it must then be
+    redrawn whole whenever something under it is, and whatever lies on top
+    of it after that, so those boxes are added until nothing new overlaps.
+    """
+    boxes = [_box_rect(raster_bbox(el, width)) for el in after]
+    opaque = [el.type == "bitmap" and is_opaque(el.text) for el in after]
+    region = list(rects)
+    picked = [False] * len(after)
+    grew = True
+    while grew:
+        grew = False
+        for i, box in enumerate(boxes):
+            if picked[i] or not _overlaps(box, region):
+                continue
+            picked[i] = grew = True
+            if opaque[i]:
+                region.append(box)
+            else:
+                # this redraw would also paint over any later opaque bitmap on top of it
+                region += [boxes[j] for j in range(i + 1, len(after))
+                           if opaque[j] and not picked[j] and _overlaps(boxes[j], [box])]
+    return [el for el, p in zip(after, picked) if p]
+
+
+def partial_update_lines(before, after, width, height, mode="rgb565", name="updateScreen"):
+    """A C function that turns the `before` screen into `after` by clearing and redrawing only dirty rects.
+
+    Returns (lines, report) where report compares it with a full redraw.
+    """
+    after = list(after)
+    rects = dirty_rects(before, after, width, height)
+    redraw = redraw_set(after, rects, width)
+
+    lines = [f"void {name}() {{"]
+    lines += [f"  display.fillRect({x}, {y}, {w}, {h}, BLACK);" for x, y, w, h in rects]
+    for el in redraw:
+        lines.extend(element_lines(el))
+    if mode == "mono":
+        lines.append("  display.display();")
+    lines.append("}")
+
+    full = scene_cost(after, width, height, mode)
+    part = scene_cost(redraw, width, height, mode, clear=False)
+    part["calls"] += len(rects)
+    part["pixels"] += sum(w * h for _, _, w, h in rects)
+    part["windows"] += len(rects)
+    part["bus_bytes"] = bus_bytes(part["pixels"], part["windows"], width, height, mode)
+    return lines, {"rects": rects, "redrawn": len(redraw), "before": full, "after": part}
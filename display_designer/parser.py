@@ -0,0 +1,583 @@
+# display_designer/parser.py
+"""
+Parsing of the editor command language ("text x y ...", "rect x1 y1 x2 y2",
+"circle x y r", "bitmap x y path [format]", and the animation lines
+"key ms prop=value ..." / "timeline fps=N ...") and line-level
+reconciliation of an edited script, plus a single-pass parser for the
+Adafruit GFX calls in an Arduino sketch.
+"""
+import re
+
+from .core import Element
+from .images import BITMAP_FORMATS, DEFAULT_FORMAT, bitmap_source, load_bitmap
+
+
+# ----------------- Editor commands -----------------
+def parse_command(line):
+    """Parse one editor line into a spec (kind, x, y, w, h, text).
+
+    Returns None for blank lines, # comments and the animation lines (which
+    draw nothing; animation.py reads them); raises ValueError (or
+    IndexError for missing arguments) for lines it cannot parse.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    parts = line.split()
+    cmd = parts[0].lower()
+    if cmd == "key":
+        parse_keyframe(parts)
+        return None
+    if cmd == "timeline":
+        parse_timeline(parts)
+        return None
+    if cmd == "text":
+        x = int(parts[1]); y = int(parts[2]); txt = " ".join(parts[3:])
+        return ("text", x, y, 0, 0, txt)
+    if cmd == "rect":
+        x1 = int(parts[1]); y1 = int(parts[2]); x2 = int(parts[3]); y2 = int(parts[4])
+        return ("rect", x1, y1, x2 - x1, y2 - y1, "")
+    if cmd == "circle":
+        x = int(parts[1]); y = int(parts[2]); r = int(parts[3])
+        return ("circle", x - r, y - r, 2 * r, 2 * r, "")
+    if cmd == "bitmap":
+        x, y, path, fmt = bitmap_args(parts)
+        try:
+            pixels = load_bitmap(path, fmt)
+        except OSError as e:
+            raise ValueError(f"Cannot open '{path}': {e.strerror or e}")
+        except ValueError as e:
+            raise ValueError(f"Cannot read '{path}': {e}")
+        h, w = pixels.shape
+        return ("bitmap", x, y, w, h, bitmap_source(path, fmt))
+    raise ValueError(f"Unknown command '{parts[0]}'")
+
+
+# ----------------- Animation lines -----------------
+# "key MS prop=value ..." keyframes the element drawn by the nearest element line
+# above it; "timeline fps=N duration=MS loop=0|1" sets up playback.
+ANIMATED_PROPS = ("x", "y", "w", "h")
+TIMELINE_OPTIONS = {"fps": (1, 120), "duration": (1, 600_000), "loop": (0, 1)}
+
+
+def _assignments(parts, allowed):
+    values = {}
+    for part in parts:
+        name, sep, value = part.partition("=")
+        name = name.lower()
+        if not sep or name not in allowed:
+            raise ValueError(f"expected name=value with name one of {', '.join(allowed)}, got '{part}'")
+        values[name] = int(value)
+    return values
+
+
+def parse_keyframe(parts):
+    """(ms, {prop: value}) of a split "key ms prop=value ..." line."""
+    ms = int(parts[1])
+    if ms < 0:
+        raise ValueError("keyframe time must not be negative")
+    values = _assignments(parts[2:], ANIMATED_PROPS)
+    if not values:
+        raise IndexError(f"key needs at least one of {', '.join(p + '=' for p in ANIMATED_PROPS)}")
+    return ms, values
+
+
+def parse_timeline(parts):
+    """{option: value} of a split "timeline fps=N duration=MS loop=0|1" line."""
+    options = _assignments(parts[1:], TIMELINE_OPTIONS)
+    for name, value in options.items():
+        low, high = TIMELINE_OPTIONS[name]
+        if not low <= value <= high:
+            raise ValueError(f"{name} must be between {low} and {high}")
+    return options
+
+
+def bitmap_args(parts):
+    """(x, y, path, format) of a split "bitmap x y path [format]" line; the path may contain spaces."""
+    x = int(parts[1]); y = int(parts[2])
+    rest = parts[3:]
+    fmt = DEFAULT_FORMAT
+    if len(rest) > 1 and rest[-1].lower() in BITMAP_FORMATS:
+        fmt = rest.pop().lower()
+    if not rest:
+        raise IndexError("bitmap needs a file name")
+    return x, y, " ".join(rest), fmt
+
+
+_ASSET_COMMENT = re.compile(r"//[ \t]*bitmap[ \t]+\w+[ \t]+\d+x\d+[ \t]+\w+:([^\n]*?)[ \t]*$", re.M)
+
+
+def bitmap_paths(text):
+    """Image files a script or sketch draws, e.g. so a build cache can notice when they change."""
+    paths = [m.group(1) for m in _ASSET_COMMENT.finditer(text)]
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) > 3 and parts[0].lower() == "bitmap":
+            try:
+                paths.append(bitmap_args(parts)[2])
+            except ValueError:
+                pass
+    return list(dict.fromkeys(paths))
+
+
+def spec_to_element(spec):
+    """Element for a parsed editor spec."""
+    kind, x, y, w, h, txt = spec
+    return Element(kind, None, x, y, w, h, text=txt, rotation=0)
+
+
+def parse_lines(lines):
+    """{source: (spec, error)} for every distinct line; no shared state, so safe on a worker thread."""
+    parsed = {}
+    for source in lines:
+        if source not in parsed:
+            try:
+                parsed[source] = (parse_command(source), None)
+            except (ValueError, IndexError) as e:
+                parsed[source] = (None, str(e))
+    return parsed
+
+
+def parse_script(text):
+    """Elements described by a whole editor script, plus (line, message) problems."""
+    elements, problems = [], []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        entry = LineEntry(line)
+        if entry.error:
+            problems.append((lineno, entry.error))
+        elif entry.spec is not None:
+            elements.append(spec_to_element(entry.spec))
+    return elements, problems
+
+
+# ----------------- Reconciliation -----------------
+class LineEntry:
+    """One editor line: its source, parsed spec (or error) and the item drawn for it."""
+    __slots__ = ("source", "spec", "error", "item")
+
+    def __init__(self, source, parsed=None):
+        self.source = source
+        self.item = None  # set by the caller once something is drawn for the line
+        if parsed is None:
+            parsed = parse_lines((source,))[source]
+        self.spec, self.error = parsed
+
+
+class ScriptChanges:
+    """What update() changed. Each list holds (line_index, LineEntry), 0-based."""
+    def __init__(self):
+        self.created = []   # new spec, needs an item
+        self.updated = []   # same kind as before, item kept, spec changed
+        self.deleted = []   # entries whose item must go (entry.item still set)
+
+    def __bool__(self):
+        return bool(self.created or self.updated or self.deleted)
+
+
+class ScriptReconciler:
+    """Keeps an editor script parsed line by line and diffs new versions of it.
+
+    Only the lines between the unchanged prefix and suffix are re-parsed.
+    Within that window old and new lines are paired by position: a line that
+    still holds the same command keeps its item (updated in place), anything
+    else is deleted and/or created.
+    """
+    def __init__(self):
+        self.entries = []
+
+    def update(self, text, parsed=None):
+        """Diff text against the current entries. parsed is an optional parse_lines() result to reuse."""
+        new_lines = text.splitlines()
+        parsed = parsed or {}
+        old = self.entries
+        n_old, n_new = len(old), len(new_lines)
+
+        start = 0
+        limit = min(n_old, n_new)
+        while start < limit and old[start].source == new_lines[start]:
+            start += 1
+        end_old, end_new = n_old, n_new
+        while end_old > start and end_new > start and old[end_old - 1].source == new_lines[end_new - 1]:
+            end_old -= 1
+            end_new -= 1
+
+        changes = ScriptChanges()
+        middle = []
+        for offset, source in enumerate(new_lines[start:end_new]):
+            index = start + offset
+            entry = LineEntry(source, parsed.get(source))
+            prev = old[start + offset] if start + offset < end_old else None
+            if prev is not None and prev.item is not None:
+                if entry.spec is not None and prev.spec is not None and entry.spec[0] == prev.spec[0]:
+                    entry.item = prev.item
+                    if entry.spec != prev.spec:
+                        changes.updated.append((index, entry))
+                    middle.append(entry)
+                    continue
+                changes.deleted.append((index, prev))
+            if entry.spec is not None:
+                changes.created.append((index, entry))
+            middle.append(entry)
+        for prev in old[start + len(middle):end_old]:
+            if prev.item is not None:
+                changes.deleted.append((start, prev))
+
+        self.entries = old[:start] + middle + old[end_old:]
+        return changes
+
+    def errors(self):
+        """(1-based line number, message) for every line that failed to parse."""
+        return [(i + 1, e.error) for i, e in enumerate(self.entries) if e.error]
+
+    def sources(self):
+        """The lines already parsed, for parse_lines() to skip."""
+        return {entry.source for entry in self.entries}
+
+
+# ----------------- Adafruit GFX sketches -----------------
+# One pass over the sketch with a single master pattern: comments and string
+# literals are skipped as whole tokens, #define lines update the constant table
+# and every obj.method( / obj->method( call is decoded in source (= draw) order.
+
+_TOKEN = re.compile(r"""
+      (?P<asset>//[ \t]*bitmap[ \t]+(?P<aname>\w+)[ \t]+\d+x\d+[ \t]+(?P<asource>[^\n]*?)[ \t]*$)
+    | (?P<comment>//[^\n]*|/\*.*?\*/)
+    | (?P<define>^[ \t]*\#[ \t]*define[ \t]+(?P<dname>\w+)(?![(\w])[ \t]*(?P<dvalue>[^\n]*))
+    | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    | \b(?P<obj>\w+)\s*(?:\.|->)\s*(?P<call>\w+)\s*\((?:(?P<args>[^()"'\n]*)\))?
+""", re.M | re.S | re.X)
+_COMMENT = re.compile(r"//.*|/\*.*?\*/")
+_SIMPLE_ARGS = re.compile(r'([^()"\']*)\)')
+_ARG_SCAN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|[(),]')
+_EXPR_TOKEN = re.compile(r"\s*(?:(0[xX][0-9a-fA-F]+|\d+)[uUlL]*|(\w+)|(<<|>>|[-+*/%()~&|^]))")
+_DECIMAL = re.compile(r"\s*-?(?:0|[1-9][0-9]*)\s*\Z")  # what int() may parse directly (no octal, no _)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+_ESCAPE = re.compile(r"\\([0-7]{1,3}|.)")  # \ooo octal, as codegen.c_string() writes control characters
+
+# call name -> number of integer arguments it takes (the colour argument is ignored)
+GFX_CALLS = {
+    "drawPixel": 2, "drawLine": 4, "drawFastHLine": 3, "drawFastVLine": 3,
+    "drawRect": 4, "fillRect": 4, "drawRoundRect": 5, "fillRoundRect": 5,
+    "drawCircle": 3, "fillCircle": 3, "drawTriangle": 6, "fillTriangle": 6,
+    "setCursor": 2, "setTextSize": 1, "print": None, "println": None,
+    "drawBitmap": 5, "drawRGBBitmap": 5,
+}
+# (x, y, array, w, h): the array is looked up in the "// bitmap NAME WxH SOURCE"
+# comments codegen.bitmap_defs() writes above it
+_BITMAP_CALLS = {"drawBitmap", "drawRGBBitmap"}
+# display calls that do not draw anything the element model represents
+_STATE_CALLS = {
+    "begin", "display", "clearDisplay", "fillScreen", "setTextColor", "setTextWrap",
+    "setRotation", "invertDisplay", "dim", "cp437", "setFont", "startWrite", "endWrite",
+}
+
+
+class SketchError(ValueError):
+    """A GFX call whose arguments could not be evaluated."""
+
+
+class GfxCall:
+    """One decoded Adafruit GFX call: method name, evaluated arguments, 1-based line."""
+    __slots__ = ("name", "args", "line")
+
+    def __init__(self, name, args, line):
+        self.name = name
+        self.args = args
+        self.line = line
+
+    def __repr__(self):
+        return f"GfxCall({self.name!r}, {self.args!r}, line={self.line})"
+
+
+def _split_args(text, pos):
+    """Argument strings of the call whose "(" ends at pos, and the index after ")"."""
+    m = _SIMPLE_ARGS.match(text, pos)
+    if m:
+        inner = m.group(1)
+        return ([a.strip() for a in inner.split(",")] if inner.strip() else []), m.end()
+    args, depth, start = [], 0, pos
+    for m in _ARG_SCAN.finditer(text, pos):
+        tok = m.group()
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            if depth == 0:
+                inner = text[start:m.start()].strip()
+                if inner or args:
+                    args.append(inner)
+                return args, m.end()
+            depth -= 1
+        elif tok == "," and depth == 0:
+            args.append(text[start:m.start()].strip())
+            start = m.end()
+    raise SketchError("unterminated call")
+
+
+def _c_int(number):
+    """Value of a C integer literal: 0x... is hex and a leading 0 means octal."""
+    if number[:2] in ("0x", "0X"):
+        return int(number, 16)
+    if len(number) > 1 and number[0] == "0":
+        if not number.isdigit() or "8" in number or "9" in number:
+            raise SketchError(f"invalid octal constant '{number}'")
+        return int(number, 8)
+    return int(number)
+
+
+def _int32(v):
+    """v wrapped to a signed 32-bit int, like int arithmetic on the ESP32."""
+    return ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+class _Evaluator:
+    """Integer expressions over #define constants, with C operator precedence and 32-bit ints."""
+    _BINARY = [("|",), ("^",), ("&",), ("<<", ">>"), ("+", "-"), ("*", "/", "%")]
+
+    def __init__(self):
+        self.defines = {}
+        self._cache = {}
+
+    def define(self, name, value):
+        self.defines[name] = value
+        self._cache.clear()
+
+    def value(self, expr, _depth=0):
+        if _DECIMAL.match(expr):
+            return _int32(int(expr))
+        expr = expr.strip()
+        if expr in self._cache:
+            return self._cache[expr]
+        if _depth > 16:
+            raise SketchError(f"recursive #define in '{expr}'")
+        tokens = []
+        pos = 0
+        expr_s = expr.rstrip()
+        while pos < len(expr_s):
+            m = _EXPR_TOKEN.match(expr_s, pos)
+            if not m:
+                raise SketchError(f"cannot evaluate '{expr}'")
+            tokens.append(m.groups())
+            pos = m.end()
+        self._tokens = tokens
+        self._pos = 0
+        self._depth = _depth
+        try:
+            result = self._binary(0)
+        except RecursionError:
+            raise SketchError(f"'{expr}' is nested too deeply")
+        if self._pos != len(tokens):
+            raise SketchError(f"cannot evaluate '{expr}'")
+        self._cache[expr] = result
+        return result
+
+    def _peek(self):
+        return self._tokens[self._pos][2] if self._pos < len(self._tokens) else None
+
+    def _binary(self, level):
+        if level == len(self._BINARY):
+            return self._unary()
+        left = self._binary(level + 1)
+        while self._peek() in self._BINARY[level]:
+            op = self._peek()
+            self._pos += 1
+            right = self._binary(level + 1)
+            if op == "+": left += right
+            elif op == "-": left -= right
+            elif op == "*": left *= right
+            elif op in ("/", "%"):
+                if right == 0:
+                    raise SketchError("division by zero")
+                q = abs(left) // abs(right)
+                q = q if (left >= 0) == (right >= 0) else -q
+                left = q if op == "/" else left - q * right
+            elif op in ("<<", ">>"):
+                if not 0 <= right < 32:
+                    raise SketchError(f"shift count {right} is out of range")
+                left = left << right if op == "<<" else left >> right
+            elif op == "&": left &= right
+            elif op == "^": left ^= right
+            else: left |= right
+            left = _int32(left)
+        return left
+
+    def _unary(self):
+        op = self._peek()
+        if op in ("-", "+", "~"):
+            self._pos += 1
+            v = self._unary()
+            return _int32(-v) if op == "-" else (~v if op == "~" else v)
+        return self._primary()
+
+    def _primary(self):
+        if self._pos >= len(self._tokens):
+            raise SketchError("unexpected end of expression")
+        number, name, op = self._tokens[self._pos]
+        self._pos += 1
+        if number is not None:
+            return _int32(_c_int(number))
+        if name is not None:
+            if name not in self.defines:
+                raise SketchError(f"'{name}' is not a constant")
+            saved = (self._tokens, self._pos, self._depth)
+            try:
+                return self.value(self.defines[name], self._depth + 1)
+            finally:
+                self._tokens, self._pos, self._depth = saved
+        if op == "(":
+            v = self._binary(0)
+            if self._peek() != ")":
+                raise SketchError("missing ')'")
+            self._pos += 1
+            return v
+        raise SketchError(f"unexpected '{op}'")
+
+
+def _unescape(m):
+    code = m.group(1)
+    if code[0] in "01234567":
+        return chr(int(code, 8))
+    return _ESCAPES.get(code, code)
+
+
+def _string_value(arg, evaluator):
+    """What print(arg) prints: string/char literal, F("...") or an integer expression."""
+    if arg.startswith("F(") and arg.endswith(")"):
+        arg = arg[2:-1].strip()
+    if len(arg) >= 2 and arg[0] == arg[-1] and arg[0] in "\"'":
+        return _ESCAPE.sub(_unescape, arg[1:-1])
+    return str(evaluator.value(arg))
+
+
+def tokenize_sketch(text, problems=None):
+    """Yield the GfxCalls of a sketch in source order, in a single pass.
+
+    print()/println() only count on objects already used as a display, so
+    Serial.print() is ignored. drawBitmap()/drawRGBBitmap() get the source of
+    their array (from its "// bitmap" comment) as the third argument. Unknown calls on a display object and calls
+    whose arguments are not constant are reported to problems as
+    (line, message) instead of being dropped silently.
+    """
+    evaluator = _Evaluator()
+    assets = {}  # array name -> bitmap source
+    display_objects = set()
+    unknown = []
+    line, line_pos = 1, 0
+    pos = 0
+    while True:
+        m = _TOKEN.search(text, pos)
+        if not m:
+            break
+        pos = m.end()
+        obj, name, inner = m.group("obj", "call", "args")
+        if name is None:
+            if m.group("aname"):
+                assets[m.group("aname")] = m.group("asource")
+            elif m.group("dname"):
+                value = _COMMENT.sub("", m.group("dvalue")).strip()
+                evaluator.define(m.group("dname"), value or "1")
+            continue
+        start = m.start()
+        line += text.count("\n", line_pos, start)
+        line_pos = start
+        if inner is not None:
+            # fast path: no nested parentheses or strings in the argument list
+            args = inner.split(",") if inner.strip() else []
+        else:
+            try:
+                args, pos = _split_args(text, pos)
+            except SketchError as e:
+                if problems is not None:
+                    problems.append((line, f"{name}: {e}"))
+                continue
+        if name not in GFX_CALLS:
+            if name in _STATE_CALLS:
+                if name != "begin":  # Serial.begin() etc. do not make an object a display
+                    display_objects.add(obj)
+            else:
+                unknown.append((obj, line, name))
+            continue
+        count = GFX_CALLS[name]
+        if count is None:
+            if obj not in display_objects:
+                continue  # Serial.print() and friends
+        else:
+            display_objects.add(obj)
+        try:
+            if count is None:
+                values = [_string_value(a.strip(), evaluator) for a in args[:1]]
+            elif name in _BITMAP_CALLS:
+                if len(args) < count:
+                    raise SketchError(f"expected {count} arguments, got {len(args)}")
+                array = args[2].strip()
+                if array not in assets:
+                    raise SketchError(f"no '// bitmap {array} ...' comment says which image {array} is")
+                values = [assets[array] if i == 2 else evaluator.value(a) for i, a in enumerate(args[:count])]
+            else:
+                if len(args) < count:
+                    raise SketchError(f"expected {count} arguments, got {len(args)}")
+                values = [evaluator.value(a) for a in args[:count]]  # plain literals skip the parser
+        except SketchError as e:
+            if problems is not None:
+                problems.append((line, f"{name}: {e}"))
+            continue
+        yield GfxCall(name, values, line)
+    if problems is not None:
+        problems.extend((ln, f"unsupported call {obj}.{name}()") for obj, ln, name in unknown
+                        if obj in display_objects)
+        problems.sort()
+
+
+def calls_to_elements(calls):
+    """Turn GfxCalls into Elements (canvas id None), replaying text cursor state."""
+    elements = []
+    cursor_x = cursor_y = 0
+    text_size = 1
+    for call in calls:
+        name, a = call.name, call.args
+        if name == "setCursor":
+            cursor_x, cursor_y = a
+        elif name == "setTextSize":
+            text_size = max(1, a[0])
+        elif name in ("print", "println"):
+            chunks = (a[0] if a else "").split("\n")
+            if name == "println":
+                chunks.append("")
+            for i, chunk in enumerate(chunks):
+                chunk = chunk.replace("\r", "")
+                if i:
+                    cursor_x, cursor_y = 0, cursor_y + 8 * text_size
+                if chunk:
+                    elements.append(Element("text", None, cursor_x, cursor_y, text=chunk, size=text_size))
+                    cursor_x += 6 * text_size * len(chunk)  # classic 5x7 font, 1px spacing
+        elif name in ("drawRect", "fillRect"):
+            elements.append(Element("rect", None, *a, fill=name == "fillRect"))
+        elif name in ("drawRoundRect", "fillRoundRect"):
+            elements.append(Element("rect", None, *a[:4], radius=a[4], fill=name == "fillRoundRect"))
+        elif name in ("drawCircle", "fillCircle"):
+            cx, cy, r = a
+            elements.append(Element("circle", None, cx - r, cy - r, 2 * r, 2 * r, fill=name == "fillCircle"))
+        elif name == "drawLine":
+            x0, y0, x1, y1 = a
+            elements.append(Element("line", None, x0, y0, x1 - x0, y1 - y0))
+        elif name == "drawFastHLine":
+            elements.append(Element("line", None, a[0], a[1], a[2] - 1, 0))
+        elif name == "drawFastVLine":
+            elements.append(Element("line", None, a[0], a[1], 0, a[2] - 1))
+        elif name == "drawPixel":
+            elements.append(Element("rect", None, a[0], a[1], 1, 1, fill=True))
+        elif name in _BITMAP_CALLS:
+            x, y, source, w, h = a
+            elements.append(Element("bitmap", None, x, y, w, h, text=source))
+        elif name in ("drawTriangle", "fillTriangle"):
+            points = [(a[0], a[1]), (a[2], a[3]), (a[4], a[5])]
+            xs, ys = [p[0] for p in points], [p[1] for p in points]
+            elements.append(Element("triangle", None, min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys),
+                                    fill=name == "fillTriangle", points=points))
+    return elements
+
+
+def parse_sketch(text):
+    """Elements drawn by an Adafruit GFX sketch, in draw order, plus (line, message) problems."""
+    problems = []
+    elements = calls_to_elements(tokenize_sketch(text, problems))
+    return elements, problems
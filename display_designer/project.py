@@ -0,0 +1,136 @@
+# display_designer/project.py
+"""
+Multi-screen projects: named screens, only one of which is live in the window.
+
+The active screen's elements live on the canvas (app.CanvasElements). Every
+other screen is kept compactly: its editor script plus, once it has been
+visited, a core.Scene snapshot of its elements and the editor's
+ScriptReconciler, whose line -> item links are stored as draw-order indexes
+because canvas ids do not survive the switch. A screen that was never opened
+is just its script and is only parsed when it is shown or its code is built
+(once per script text; the parse is kept until the script changes).
+Never imports tkinter.
+"""
+import re
+
+from .parser import parse_script
+
+_NAME_CHARS = re.compile(r"[^A-Za-z0-9_]+")
+
+
+def screen_name(text):
+    """A C identifier for drawScreen_<name>() from free text ("Main menu" -> "Main_menu")."""
+    name = _NAME_CHARS.sub("_", text.strip()).strip("_")
+    if not name:
+        raise ValueError("Screen name needs at least one letter or digit")
+    return name
+
+
+class Screen:
+    """One named screen; see the module docstring for how it is stored while inactive."""
+    __slots__ = ("name", "script", "scene", "reconciler", "_parsed")
+
+    def __init__(self, name, script=""):
+        self.name = name
+        self.script = script     # editor text
+        self.scene = None        # Scene snapshot while stored; None when active or never opened
+        self.reconciler = None   # ScriptReconciler while stored, entry.item = draw index
+        self._parsed = None      # (script, elements) of the last parse of a never-opened screen
+
+    @property
+    def opened(self):
+        """True once the screen has been shown and stored again (it has a Scene snapshot)."""
+        return self.scene is not None
+
+    def elements(self):
+        """The stored elements, or the parsed script for a screen that was never opened."""
+        if self.scene is not None:
+            return list(self.scene)
+        parsed = self._parsed
+        if parsed is None or parsed[0] != self.script:
+            # Built on the code worker; a whole new tuple, so a concurrent reader sees either.
+            parsed = self._parsed = (self.script, parse_script(self.script)[0])
+        return parsed[1]
+
+    def store(self, script, scene, reconciler, order):
+        """Keep the screen while another one is shown.
+
+        scene is a snapshot of its elements; order lists its canvas ids in
+        draw order, so the reconciler's items can be relinked by restore().
+        """
+        index = {item: i for i, item in enumerate(order)}
+        for entry in reconciler.entries:
+            entry.item = index.get(entry.item)
+        self.script, self.scene, self.reconciler = script, scene, reconciler
+        self._parsed = None
+
+    def restore(self, items):
+        """Relink the stored reconciler to items (new canvas ids, in draw order) and return it.
+
+        The screen is active again afterwards, so the snapshot is dropped.
+        """
+        reconciler = self.reconciler
+        for entry in reconciler.entries:
+            if entry.item is not None:
+                entry.item = items[entry.item] if entry.item < len(items) else None
+        self.scene = self.reconciler = None
+        return reconciler
+
+
+class Project:
+    """Ordered, uniquely named screens and which one is active."""
+
+    def __init__(self):
+        self.screens = {}
+        self.active = None
+
+    def __len__(self):
+        return len(self.screens)
+
+    def __iter__(self):
+        return iter(self.screens.values())
+
+    def __contains__(self, name):
+        return name in self.screens
+
+    def __getitem__(self, name):
+        return self.screens[name]
+
+    def names(self):
+        return list(self.screens)
+
+    def unique_name(self, base):
+        name = screen_name(base)
+        i = 2
+        while name in self.screens:
+            name = f"{screen_name(base)}_{i}"
+            i += 1
+        return name
+
+    def add(self, name, script=""):
+        """Add a screen (name must be a free C identifier); the first one becomes active."""
+        if name != screen_name(name):
+            raise ValueError(f"'{name}' is not a valid screen name (letters, digits and _)")
+        if name in self.screens:
+            raise ValueError(f"There is already a screen called '{name}'")
+        screen = self.screens[name] = Screen(name, script)
+        if self.active is None:
+            self.active = name
+        return screen
+
+    def rename(self, old, new):
+        if new == old:
+            return
+        if new != screen_name(new) or new in self.screens:
+            raise ValueError(f"'{new}' is not a free screen name")
+        self.screens = {new if k == old else k: v for k, v in self.screens.items()}
+        self.screens[new].name = new
+        if self.active == old:
+            self.active = new
+
+    def remove(self, name):
+        if len(self.screens) == 1:
+            raise ValueError("A project needs at least one screen")
+        del self.screens[name]
+        if self.active == name:
+            self.active = next(iter(self.screens))
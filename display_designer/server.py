@@ -0,0 +1,558 @@
+# display_designer/server.py
+"""
+Render/codegen server for editor integrations: one long-running process that
+keeps parsed lines, glyph masks, converted bitmaps and the last frame of every
+open document warm, so a preview on save costs milliseconds instead of a Tk
+and parser start-up.
+
+    python designer.py serve                                  # tcp:127.0.0.1:7879
+    python designer.py serve unix:/tmp/designer-render.sock
+    curl -s localhost:7879/render -d '{"document": "menu.txt", "text": "rect 0 0 20 10"}'
+    curl -s --unix-socket /tmp/designer-render.sock http://localhost/status
+
+HTTP/1.1 on a loopback TCP port or a Unix socket, served by asyncio so any
+number of editors can keep connections open. Endpoints:
+
+    POST   /render          JSON request below -> code, PNG (base64) and diagnostics
+    GET    /png/DOCUMENT    the document's last rendered PNG
+    DELETE /documents/DOCUMENT
+    GET    /status          documents, cache and request counters
+
+A render request is {"document": ID, "text": ...} plus, optionally, "path"
+(its extension picks script or sketch, as in the batch build), "kind"
+("script" or "sketch"), "display" (a preset), "size" ("WxH"), "mode",
+"backend", "optimize", "scale" (PNG pixel scale) and "png" / "code" (false
+to leave them out of the reply).
+
+Each document keeps its ScriptReconciler, Scene, CodeDocument and
+Framebuffer between requests (Document): only edited lines are parsed, only
+the code of changed elements is regenerated and only the rects they covered
+before and after are rasterized again. Sketches are parsed whole (one pass)
+and then diffed against the previous elements. Renders run on a thread pool,
+one at a time per document. Never imports tkinter.
+"""
+import argparse
+import asyncio
+import base64
+import ipaddress
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+from .backends import BACKENDS, DEFAULT_BACKEND, format_footprint, generate_for
+from .batch import _parse_size, is_sketch, sketch_size
+from .codegen import CodeDocument
+from .core import (DISPLAY_PRESETS, Framebuffer, Scene, merge_rects, mode_for_display, raster_bbox, rerender,
+                   signature, text_mask, text_size)
+from .images import cache_stats
+from .mirror import _remove_stale_socket, format_address, parse_address
+from .optimize import format_optimize_report, optimize
+from .parser import ScriptReconciler, parse_lines, parse_sketch, spec_to_element
+
+DEFAULT_PORT = 7879
+DEFAULT_ADDRESS = f"tcp:127.0.0.1:{DEFAULT_PORT}"
+MAX_DOCUMENTS = 64      # least recently used documents beyond this are dropped
+MAX_BODY = 16 << 20     # bytes in one request
+MAX_SIDE = 2048         # display width/height a request may ask for
+MAX_SCALE = 16
+LINE_CACHE_SIZE = 100_000
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ----------------- Shared line cache -----------------
+class LineCache:
+    """parse_lines() results shared by every document, so a new or reset document starts warm.
+
+    Bitmap lines are always parsed again: their spec holds the image size,
+    which changes with the file (the converted pixels are cached by images.py).
+    """
+    def __init__(self, size=LINE_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def parse(self, lines):
+        with self._lock:
+            known = {line: self._parsed[line] for line in lines if line in self._parsed}
+        fresh = parse_lines(line for line in lines if line not in known)
+        with self._lock:
+            self.hits += len(known)
+            self.misses += len(fresh)
+            for line, result in fresh.items():
+                if not line.lstrip().lower().startswith("bitmap"):
+                    self._parsed[line] = result
+            if len(self._parsed) > self.size:
+                # plain dicts keep insertion order: drop the oldest half
+                for line in list(self._parsed)[:len(self._parsed) // 2]:
+                    del self._parsed[line]
+        known.update(fresh)
+        return known
+
+    def stats(self):
+        return {"lines": len(self._parsed), "hits": self.hits, "misses": self.misses}
+
+
+# ----------------- Documents -----------------
+class Document:
+    """Render state of one client document, updated incrementally by render()."""
+
+    def __init__(self, name, kind, width, height, mode="mono", backend=DEFAULT_BACKEND, optimized=False,
+                 lines=None):
+        self.name = name
+        self.kind = kind  # "script" or "sketch"
+        self.width, self.height, self.mode = width, height, mode
+        self.backend, self.optimized = backend, optimized
+        self.lines = lines or LineCache()
+        self.text = None
+        self.scene = Scene()
+        self.script = ScriptReconciler()
+        self.order = []        # sketch: (signature, scene id) per element, in draw order
+        self.code_doc = CodeDocument(width, height)
+        self.code = self.code_doc.rebuild([])
+        self.notes = []
+        self.problems = []
+        self.fb = Framebuffer(width, height, mode)
+        self._bounds = {}      # scene id -> raster bbox when last drawn
+        self._dirty = []
+        self._png = {}         # scale -> PNG bytes of fb
+        self.scale = 1         # of the last PNG asked for (GET /png)
+        self.lock = None       # asyncio.Lock, set by the server
+
+    @property
+    def config(self):
+        return self.kind, self.width, self.height, self.mode, self.backend, self.optimized
+
+    def render(self, text, scale=1, png=True, code=True):
+        """Bring the document up to text and return the reply dict (see the module docstring)."""
+        start = time.perf_counter()
+        stats = {"parsed_lines": 0, "changed": 0, "rendered_pixels": 0}
+        if text != self.text:
+            update = self._update_script if self.kind == "script" else self._update_sketch
+            touched, rebuild, parsed = update(text)
+            stats["parsed_lines"], stats["changed"] = parsed, len(touched)
+            stats["rendered_pixels"] = self._redraw(touched)
+            self._update_code(touched, rebuild)
+            self.text = text
+        self.scale = scale
+        reply = {
+            "document": self.name, "kind": self.kind, "width": self.width, "height": self.height,
+            "mode": self.mode, "backend": self.backend, "elements": len(self.scene),
+            "diagnostics": [{"line": lineno, "message": msg} for lineno, msg in self.problems],
+            "notes": self.notes,
+        }
+        if code:
+            reply["code"] = self.code
+        if png:
+            reply["png"] = base64.b64encode(self.png(scale)).decode("ascii")
+        stats["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        reply["stats"] = stats
+        return reply
+
+    def png(self, scale=1):
+        if scale not in self._png:
+            self._png[scale] = self.fb.to_png(scale)
+        return self._png[scale]
+
+    # ---- model ----
+    def _update_script(self, text):
+        """Apply an edited script like the window's Run.
+
+        Returns (touched ids, whether the code needs a rebuild, lines parsed).
+        """
+        new_lines = set(text.splitlines()) - self.script.sources()
+        changes = self.script.update(text, self.lines.parse(new_lines))
+        touched, swapped = [], False
+        for _, entry in changes.deleted:
+            if entry.item is not None and entry.item in self.scene:
+                self._forget(entry.item)
+                self.scene.remove(entry.item)
+            entry.item = None
+        for _, entry in changes.updated:
+            kind, x, y, w, h, txt = entry.spec
+            el = self.scene[entry.item]
+            swapped |= kind == "bitmap" and el.text != txt
+            el.x, el.y, el.w, el.h, el.text = x, y, w, h, txt
+            if kind == "text":
+                el.w, el.h = text_size(txt, el.size)
+            touched.append(entry.item)
+        for _, entry in changes.created:
+            entry.item = self.scene.add(spec_to_element(entry.spec))
+            touched.append(entry.item)
+        if changes.created or changes.deleted:
+            self.scene.reorder([e.item for e in self.script.entries if e.item is not None])
+        self.problems = self.script.errors()
+        # another image also changes the arrays declared above setup()
+        return touched, bool(changes.created or changes.deleted or swapped), len(new_lines)
+
+    def _update_sketch(self, text):
+        """Parse the sketch again and keep the elements that did not change; returns like _update_script()."""
+        elements, self.problems = parse_sketch(text)
+        unused = defaultdict(list)
+        for sig, eid in self.order:
+            unused[sig].append(eid)
+        order, touched = [], []
+        for el in elements:
+            sig = signature(el)
+            if unused[sig]:
+                eid = unused[sig].pop(0)
+            else:
+                eid = self.scene.add(el)
+                touched.append(eid)
+            order.append((sig, eid))
+        for eids in unused.values():
+            for eid in eids:
+                self._forget(eid)
+                self.scene.remove(eid)
+        added = set(touched)
+        kept = [eid for _, eid in self.order if eid in self.scene]
+        moved = kept != [eid for _, eid in order if eid not in added]
+        if moved:
+            # Draw order only shows through opaque (RGB565) bitmaps, but there it does.
+            self._dirty.append((0, 0, self.width, self.height))
+        changed = bool(touched) or moved or len(order) != len(self.order)
+        if changed:
+            self.scene.reorder([eid for _, eid in order])
+        self.order = order
+        return touched, changed, text.count("\n") + 1
+
+    # ---- pixels ----
+    def _forget(self, eid):
+        box = self._bounds.pop(eid, None)
+        if box is not None:
+            self._dirty.append(box)
+
+    def _redraw(self, touched):
+        """Re-rasterize where touched elements were and are now; returns the pixels rasterized again."""
+        for eid in touched:
+            box = raster_bbox(self.scene[eid], self.width)
+            self._forget(eid)
+            self._dirty.append(box)
+            self._bounds[eid] = box
+        rects = []
+        for x0, y0, x1, y1 in merge_rects(self._dirty):
+            x0, y0 = max(int(x0), 0), max(int(y0), 0)
+            x1, y1 = min(int(x1), self.width), min(int(y1), self.height)
+            if x0 < x1 and y0 < y1:
+                rects.append((x0, y0, x1, y1))
+        self._dirty = []
+        for rect in rects:
+            rerender(self.fb, self.scene, rect)
+        if rects:
+            self._png.clear()
+        return sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+
+    # ---- code ----
+    def _update_code(self, touched, rebuild):
+        if self.optimized or self.backend != DEFAULT_BACKEND:
+            # whole-screen output: the optimizer and other backends have no per-element line spans
+            elements, self.notes = list(self.scene), []
+            if self.optimized:
+                elements, report = optimize(elements, self.width, self.height, mode=self.mode)
+                self.notes.append(format_optimize_report(report))
+            if self.backend != DEFAULT_BACKEND:
+                self.code, report = generate_for(elements, self.width, self.height, self.backend)
+                self.notes.append(format_footprint(report))
+            else:
+                self.code = self.code_doc.rebuild(elements)
+            return
+        if rebuild:
+            self.code = self.code_doc.rebuild(self.scene)
+            return
+        for eid in touched:
+            self.code_doc.set_element(self.scene[eid])
+        if touched:
+            self.code = self.code_doc.text()
+
+
+# ----------------- Requests -----------------
+def render_options(request, display="OLED 128x64"):
+    """(kind, width, height, mode, backend, optimized) for a render request; ValueError if it is malformed."""
+    text = request.get("text")
+    if not isinstance(text, str):
+        raise ValueError('"text" must be a string')
+    kind = request.get("kind")
+    if kind is None:
+        kind = "sketch" if is_sketch(str(request.get("path") or ""), text) else "script"
+    elif kind not in ("script", "sketch"):
+        raise ValueError('"kind" must be "script" or "sketch"')
+    display = request.get("display", display)
+    if display not in DISPLAY_PRESETS or DISPLAY_PRESETS[display] is None:
+        raise ValueError(f"unknown display '{display}'")
+    if request.get("size"):
+        width, height = _parse_size(str(request["size"]))
+    elif kind == "sketch" and "display" not in request:
+        width, height = sketch_size(text, DISPLAY_PRESETS[display])
+    else:
+        width, height = DISPLAY_PRESETS[display]
+    if not (0 < width <= MAX_SIDE and 0 < height <= MAX_SIDE):
+        raise ValueError(f"display size must be between 1 and {MAX_SIDE}")
+    mode = request.get("mode") or mode_for_display(display)
+    if mode not in ("mono", "rgb565"):
+        raise ValueError('"mode" must be "mono" or "rgb565"')
+    backend = request.get("backend") or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend '{backend}' (one of {', '.join(BACKENDS)})")
+    return kind, width, height, mode, backend, bool(request.get("optimize"))
+
+
+def _scale(request):
+    scale = request.get("scale", 1)
+    if not isinstance(scale, int) or not 1 <= scale <= MAX_SCALE:
+        raise ValueError(f'"scale" must be an integer from 1 to {MAX_SCALE}')
+    return scale
+
+
+def check_local(family, address):
+    """Refuse TCP addresses other than loopback: requests name files the server reads."""
+    if family != socket.AF_INET:
+        return
+    host = address[0]
+    try:
+        local = host == "localhost" or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        local = False
+    if not local:
+        raise ValueError(f"the render server only listens on loopback (e.g. tcp:127.0.0.1:{DEFAULT_PORT}), "
+                         f"not {host}")
+
+
+class RenderServer:
+    """asyncio HTTP server over the documents; start() binds, serve_forever() runs it."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, display="OLED 128x64", max_documents=MAX_DOCUMENTS, workers=None):
+        self.family, self.addr = parse_address(address)
+        check_local(self.family, self.addr)
+        self.display = display
+        self.max_documents = max_documents
+        self.documents = OrderedDict()  # name -> Document, least recently used first
+        self.lines = LineCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix="render")
+        self.counters = {"connections": 0, "requests": 0, "renders": 0, "errors": 0}
+        self.started = time.monotonic()
+        self.address = None
+        self._server = None
+
+    async def start(self):
+        if self.family == socket.AF_INET:
+            host, port = self.addr
+            self._server = await asyncio.start_server(self._client, host, port, reuse_address=True)
+            self.address = format_address(self.family, self._server.sockets[0].getsockname()[:2])
+        else:
+            _remove_stale_socket(self.addr)
+            self._server = await asyncio.start_unix_server(self._client, self.addr)
+            self.address = format_address(self.family, self.addr)
+        return self.address
+
+    async def serve_forever(self):
+        try:
+            await self._server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            if self.family != socket.AF_INET:
+                _remove_stale_socket(self.addr)
+            self._server = None
+        self.executor.shutdown(wait=False)
+
+    # ---- HTTP ----
+    async def _client(self, reader, writer):
+        self.counters["connections"] += 1
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HttpError as e:
+                    await _respond(writer, e.status, _error_body(str(e)), close=True)
+                    return
+                if request is None:
+                    return
+                method, target, headers, body = request
+                close = headers.get("connection", "").lower() == "close"
+                self.counters["requests"] += 1
+                try:
+                    status, content_type, payload = await self.handle(method, target, body)
+                except HttpError as e:
+                    self.counters["errors"] += 1
+                    status, content_type, payload = e.status, "application/json", _error_body(str(e))
+                except Exception as e:  # keep serving the other clients
+                    self.counters["errors"] += 1
+                    status, content_type, payload = 500, "application/json", _error_body(f"{type(e).__name__}: {e}")
+                await _respond(writer, status, payload, content_type, close)
+                if close:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, method, target, body):
+        """(status, content type, body bytes) for one request."""
+        path = urlsplit(target).path
+        if path == "/render":
+            if method != "POST":
+                raise HttpError(405, "POST a JSON render request to /render")
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError as e:
+                raise HttpError(400, f"invalid JSON: {e}")
+            if not isinstance(request, dict):
+                raise HttpError(400, "the request must be a JSON object")
+            reply = await self.render(request)
+            return 200, "application/json", json.dumps(reply).encode()
+        if path.startswith("/png/") and method == "GET":
+            doc = self._get(unquote(path[len("/png/"):]))
+            async with doc.lock:
+                png = await asyncio.get_running_loop().run_in_executor(self.executor, doc.png, doc.scale)
+            return 200, "image/png", png
+        if path.startswith("/documents/") and method == "DELETE":
+            name = unquote(path[len("/documents/"):])
+            self._get(name)
+            del self.documents[name]
+            return 200, "application/json", json.dumps({"deleted": name}).encode()
+        if path == "/status" and method == "GET":
+            return 200, "application/json", json.dumps(self.status()).encode()
+        raise HttpError(404, f"no such endpoint: {method} {path}")
+
+    # ---- documents ----
+    async def render(self, request):
+        try:
+            config = render_options(request, self.display)
+            scale = _scale(request)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        name = str(request.get("document") or request.get("path") or "untitled")
+        doc = self.documents.get(name)
+        if doc is None or doc.config != config:
+            doc = Document(name, *config, lines=self.lines)  # new, or the display/kind/backend changed
+            doc.lock = asyncio.Lock()
+            self.documents[name] = doc
+        self.documents.move_to_end(name)
+        while len(self.documents) > self.max_documents:
+            self.documents.popitem(last=False)
+        async with doc.lock:
+            reply = await asyncio.get_running_loop().run_in_executor(
+                self.executor, doc.render, request["text"], scale, request.get("png", True) is not False,
+                request.get("code", True) is not False)
+        self.counters["renders"] += 1
+        return reply
+
+    def _get(self, name):
+        doc = self.documents.get(name)
+        if doc is None:
+            raise HttpError(404, f"no document '{name}'")
+        return doc
+
+    def status(self):
+        glyphs = text_mask.cache_info()
+        return {
+            "address": self.address,
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            **self.counters,
+            "documents": [{"document": d.name, "kind": d.kind, "size": f"{d.width}x{d.height}",
+                           "elements": len(d.scene), "problems": len(d.problems)} for d in self.documents.values()],
+            "line_cache": self.lines.stats(),
+            "glyph_cache": {"masks": glyphs.currsize, "hits": glyphs.hits, "misses": glyphs.misses},
+            "bitmap_cache": cache_stats(),
+        }
+
+
+async def _read_request(reader):
+    """(method, target, headers, body) of the next request, or None once the client has closed the connection."""
+    try:
+        line = await reader.readline()
+    except ValueError:  # longer than the stream limit
+        raise HttpError(400, "request line too long")
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise HttpError(400, "header line too long")
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise HttpError(400, "too many headers")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "bad Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, f"request body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), target, headers, body
+
+
+async def _respond(writer, status, payload, content_type="application/json", close=False):
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + payload)
+    await writer.drain()
+
+
+def _error_body(message):
+    return json.dumps({"error": message}).encode()
+
+
+# ----------------- Command line -----------------
+def make_parser():
+    presets = [name for name, size in DISPLAY_PRESETS.items() if size]
+    ap = argparse.ArgumentParser(prog="designer.py serve",
+                                 description="Keep a render/codegen server running for editor integrations.")
+    ap.add_argument("address", nargs="?", default=DEFAULT_ADDRESS,
+                    help=f"tcp:127.0.0.1:PORT or unix:PATH (default: {DEFAULT_ADDRESS})")
+    ap.add_argument("--display", choices=presets, default="OLED 128x64",
+                    help="display preset for requests that do not name one")
+    ap.add_argument("--max-documents", type=int, default=MAX_DOCUMENTS,
+                    help=f"documents kept in memory (default: {MAX_DOCUMENTS})")
+    ap.add_argument("-j", "--workers", type=int, help="render threads (default: up to 4)")
+    return ap
+
+
+def main(argv=None, out=sys.stdout):
+    args = make_parser().parse_args(argv)
+    try:
+        server = RenderServer(args.address, args.display, args.max_documents, args.workers)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    async def run():
+        address = await server.start()
+        print(f"serving on {address}", file=out, flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except OSError as e:
+        print(f"error: cannot listen on {args.address}: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
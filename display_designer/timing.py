@@ -0,0 +1,166 @@
+# display_designer/timing.py
+"""
+Frame-time cost model: how long the generated setup() body takes on an ESP32.
+
+Each element's Adafruit GFX call is costed from the optimizer's pixel and
+address-window counts (optimize.element_costs) as CPU time plus bus time:
+
+  * CPU: a fixed cost per call (virtual dispatch, clipping, start/endWrite),
+    per span/window and per pixel.
+  * Bus: SPI TFTs stream every window and pixel as they are drawn (blocking,
+    so bus time adds to CPU time). Buffered monochrome panels (SSD1306) only
+    touch RAM while drawing and pay the bus once, when display() pushes the
+    buffer: 9 bit times per I2C byte plus a start/address/stop per chunk.
+
+The constants are rough figures for Adafruit GFX on a 240 MHz ESP32. They are
+meant for ranking shapes and comparing buses, not for cycle-exact numbers.
+"""
+from .codegen import element_lines
+from .optimize import WINDOW_BYTES, element_costs
+
+CPU_HZ = 240_000_000
+CALL_CYCLES = 400          # per GFX call
+WINDOW_CYCLES = {"mono": 60, "rgb565": 180}   # per span (mono) / setAddrWindow (TFT)
+PIXEL_CYCLES = {"mono": 4, "rgb565": 2}       # per pixel written to RAM / the SPI FIFO
+I2C_CHUNK = 127            # data bytes per Wire transaction (ESP32 Wire buffer is 128 incl. control byte)
+I2C_TRANSACTION_BITS = 29  # start + address + ack + control byte + ack + stop
+SSD1306_COMMAND_BYTES = 7  # page/column address setup sent by display()
+
+
+class Bus:
+    """Display bus: kind is "i2c" or "spi", clock in Hz."""
+    __slots__ = ("kind", "clock")
+
+    def __init__(self, kind, clock):
+        if kind not in ("i2c", "spi"):
+            raise ValueError(f"Unknown bus '{kind}' (expected i2c or spi)")
+        self.kind = kind
+        self.clock = clock
+
+    @property
+    def label(self):
+        if self.clock >= 1_000_000:
+            return f"{self.kind.upper()} {self.clock / 1e6:g} MHz"
+        return f"{self.kind.upper()} {self.clock / 1e3:g} kHz"
+
+    def seconds(self, nbytes, transactions=0):
+        """Time to move nbytes (in the given number of transactions)."""
+        if self.kind == "i2c":
+            return (9 * nbytes + I2C_TRANSACTION_BITS * transactions) / self.clock
+        return 8 * nbytes / self.clock
+
+
+BUSES = {
+    "i2c-100k": Bus("i2c", 100_000),
+    "i2c-400k": Bus("i2c", 400_000),
+    "spi-40m": Bus("spi", 40_000_000),
+    "spi-80m": Bus("spi", 80_000_000),
+}
+
+
+def default_bus(mode):
+    """The usual wiring: SSD1306-style OLEDs on 400 kHz I2C, TFTs on 40 MHz SPI."""
+    return BUSES["i2c-400k"] if mode == "mono" else BUSES["spi-40m"]
+
+
+def parse_bus(value):
+    """Bus from "i2c-400k", "spi-80m", "i2c:1000000" and the like."""
+    value = value.lower()
+    if value in BUSES:
+        return BUSES[value]
+    kind, _, clock = value.replace(":", "-").partition("-")
+    scale = 1
+    if clock.endswith("k"):
+        clock, scale = clock[:-1], 1_000
+    elif clock.endswith("m"):
+        clock, scale = clock[:-1], 1_000_000
+    try:
+        return Bus(kind, int(float(clock) * scale))
+    except ValueError:
+        raise ValueError(f"Bad bus '{value}' (expected e.g. i2c-400k or spi-40m)")
+
+
+def _call_time(pixels, windows, mode, bus):
+    """(cpu_s, bus_s) of one call that writes pixels in windows."""
+    cpu = (CALL_CYCLES + WINDOW_CYCLES[mode] * windows + PIXEL_CYCLES[mode] * pixels) / CPU_HZ
+    if mode == "mono":
+        return cpu, 0.0
+    return cpu, bus.seconds(WINDOW_BYTES * windows + 2 * pixels, windows)
+
+
+def push_time(width, height, bus):
+    """display(): send the whole 1bpp buffer of a buffered panel."""
+    nbytes = width * -(-height // 8)
+    transactions = 1 + -(-nbytes // I2C_CHUNK)
+    return bus.seconds(nbytes + SSD1306_COMMAND_BYTES, transactions)
+
+
+class FrameProfile:
+    """Estimated cost of drawing one screen. per_element holds (element, cpu_s, bus_s) in draw order."""
+    def __init__(self, bus, mode, clear, per_element, push):
+        self.bus = bus
+        self.mode = mode
+        self.clear = clear          # (cpu_s, bus_s) of clearDisplay()/fillScreen()
+        self.per_element = per_element
+        self.push = push            # bus seconds of display(), 0 on TFTs
+
+    @property
+    def cpu(self):
+        return self.clear[0] + sum(c for _, c, _ in self.per_element)
+
+    @property
+    def bus_time(self):
+        return self.clear[1] + sum(b for _, _, b in self.per_element) + self.push
+
+    @property
+    def frame_time(self):
+        return self.cpu + self.bus_time
+
+    @property
+    def fps(self):
+        return 1.0 / self.frame_time if self.frame_time else float("inf")
+
+    def slowest(self, n=5):
+        """The n most expensive (element, seconds) pairs."""
+        ranked = sorted(((el, c + b) for el, c, b in self.per_element), key=lambda item: item[1], reverse=True)
+        return ranked[:n]
+
+    def summary(self):
+        push = f", display() {self.push * 1e3:.2f} ms" if self.push else ""
+        return (f"{self.bus.label}: frame {self.frame_time * 1e3:.2f} ms ({self.fps:.1f} FPS) — "
+                f"CPU {self.cpu * 1e3:.2f} ms, bus {self.bus_time * 1e3:.2f} ms{push}")
+
+
+def profile_frame(elements, width, height, mode="mono", bus=None, cache=None):
+    """FrameProfile for drawing elements (in order) on a cleared screen over bus.
+
+    cache is passed on to element_costs(), so repeated profiles of a scene
+    that changes a little only re-cost what changed.
+    """
+    bus = bus or default_bus(mode)
+    elements = list(elements)
+    costs = element_costs(elements, width, height, cache)
+    per_element = [(el, *_call_time(pixels, windows, mode, bus)) for el, (pixels, windows) in zip(elements, costs)]
+    if mode == "mono":
+        clear = ((CALL_CYCLES + width * -(-height // 8) // 4) / CPU_HZ, 0.0)  # memset of the buffer
+        push = push_time(width, height, bus)
+    else:
+        clear = _call_time(width * height, 1, mode, bus)
+        push = 0.0
+    return FrameProfile(bus, mode, clear, per_element, push)
+
+
+def describe(el):
+    """Short label for an element: its generated call without the display. prefix."""
+    lines = element_lines(el)
+    call = lines[-1].strip() if lines else el.type
+    return call.replace("display.", "")
+
+
+def format_profile(profile, top=5):
+    """Summary line plus the top most expensive elements, for the CLI."""
+    lines = [profile.summary()]
+    for el, seconds in profile.slowest(top):
+        share = 100 * seconds / profile.frame_time if profile.frame_time else 0
+        lines.append(f"  {seconds * 1e6:9.1f} us {share:5.1f}%  {describe(el)}")
+    return lines